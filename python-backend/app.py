@@ -1,21 +1,46 @@
 import os
 import re
+import shutil
 import tempfile
-from io import BytesIO
-import zipfile
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import time
 import random
 
 from urllib.error import HTTPError
 
-from flask import Flask, jsonify, request, send_file, Response, stream_with_context
+from flask import Flask, jsonify, request, send_file, Response, stream_with_context, make_response, g
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, decode_token
+import copy
+import csv
+import io
 import json
+import queue
 import threading
-
-from models import db, User, bcrypt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import wraps
+
+from models import db, User, RevokedToken, bcrypt
+from video_cache import create_video_cache_from_env
+from info_cache import create_info_cache_from_env
+from singleflight import Flight, SingleFlight
+from download_scheduler import DownloadScheduler, QueueFullError
+from artifacts import DownloadArtifact, send_artifact
+from jobs import JobStore, create_job_store_from_env
+from zip_stream import ZipEntry, stream_zip
+from passthrough import REQUESTS_AVAILABLE, PassthroughError, open_upstream, proxy_response, select_progressive_format
+from hedged_resolver import AllStrategiesFailed, HedgedResolver, Strategy
+from extractor_health import create_health_tracker_from_env
+from cookie_pool import create_cookie_pool_from_env
+from auth import AuthError, create_authenticator_from_env
+from link_extractor import SHORTENER, LinkFilter, create_link_extractor_from_env
+from link_expander import create_link_expander_from_env
+from format_ladder import create_format_ladder_cache_from_env
+from prefetch import PRIORITY_RANKS, PrefetchBudget, PrefetchItem, create_prefetcher_from_env
+from rate_limit import (BACKGROUND, INTERACTIVE, InboundLimiter, RateLimited, create_bucket_backend_from_env,
+                        create_inbound_limiter_from_env, create_outbound_limiter_from_env)
+from download_tuning import create_download_tuning_from_env, tier_for_format
+from fmp4_mux import FragmentedMP4Stream, MuxError, build_mux_command, find_ffmpeg, mux_response, select_dash_pair
 
 app = Flask(__name__)
 
@@ -39,9 +64,67 @@ CORS(app, supports_credentials=True)
 with app.app_context():
     db.create_all()
 
+# Cache em disco dos vídeos finais (compartilhado entre workers via sistema de arquivos)
+video_cache = create_video_cache_from_env()
+
+# Cache de info_dicts do yt-dlp (evita extrações repetidas do mesmo vídeo)
+info_cache = create_info_cache_from_env()
+
+# Escadas de qualidade de /api/formats, montadas junto com o info_dict (mesma validade)
+format_ladders = create_format_ladder_cache_from_env(info_cache.ttl_seconds)
+FORMATS_MAX_AGE = int(os.environ.get('FORMATS_MAX_AGE', '300'))
+
+# Coalescência de downloads simultâneos do mesmo vídeo (locks de arquivo entre workers)
+download_flights = SingleFlight(
+    lock_dir=os.environ.get('SINGLEFLIGHT_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'youtube_shorts_locks')
+)
+
+# Agendador central: limita downloads e merges simultâneos e enfileira o excedente
+download_scheduler = DownloadScheduler(
+    max_concurrent=int(os.environ.get('DOWNLOAD_MAX_CONCURRENT', '2')),
+    max_merges=int(os.environ.get('DOWNLOAD_MAX_MERGES', '1')),
+    max_queue=int(os.environ.get('DOWNLOAD_MAX_QUEUE', '50')),
+    max_queue_per_user=int(os.environ.get('DOWNLOAD_MAX_QUEUE_PER_USER', '5')),
+)
+
+# Baldes de tokens compartilhados entre workers (SQLite) e ritmo das requisições ao YouTube,
+# global e por identidade de cookies, com prioridade para downloads interativos
+rate_limit_store = create_bucket_backend_from_env()
+outbound_limiter = create_outbound_limiter_from_env(rate_limit_store)
+
+# Limites por usuário/IP e cotas diárias nos endpoints de download (mesmo armazenamento)
+inbound_limiter = create_inbound_limiter_from_env(rate_limit_store)
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1'))
+
+# Saúde dos backends/estratégias de extração (janela deslizante + circuit breaker)
+extractor_health = create_health_tracker_from_env()
+
+# Extração com estratégias em paralelo escalonado (URLs, player_clients, pytube)
+extraction_resolver = HedgedResolver(
+    stagger_seconds=float(os.environ.get('EXTRACTION_HEDGE_DELAY', '4.0')),
+    winner_ttl=float(os.environ.get('EXTRACTION_WINNER_TTL', '600')),
+    health=extractor_health,
+)
+EXTRACTION_PLAYER_CLIENTS = [client.strip() for client in
+                             os.environ.get('EXTRACTION_PLAYER_CLIENTS', 'ios,android').split(',') if client.strip()]
+
+# Perfil de ajuste dos downloads do yt-dlp (fragmentos em paralelo, chunk size, retries)
+download_tuning = create_download_tuning_from_env()
+
+# Repasse direto (sem arquivo temporário) de formatos progressivos em /api/download
+PASSTHROUGH_ENABLED = os.environ.get('PASSTHROUGH_ENABLED', 'true').lower() == 'true'
+
+# Mux em streaming (MP4 fragmentado) de pares DASH vídeo+áudio, com limite de processos ffmpeg
+FMP4_STREAMING_ENABLED = os.environ.get('FMP4_STREAMING_ENABLED', 'true').lower() == 'true'
+fmp4_stream_slots = threading.BoundedSemaphore(int(os.environ.get('FMP4_MAX_STREAMS', '4')))
+
+# Jobs de download (estado, progresso e artefato por referência), com expiração
+job_store = create_job_store_from_env()
+
 # Importações com fallback
 try:
     import yt_dlp
+    from yt_dlp.networking.exceptions import network_exceptions
     from yt_dlp.version import __version__ as YT_DLP_VERSION
     YT_DLP_AVAILABLE = True
     app.logger.info("yt-dlp disponível (versão %s)", YT_DLP_VERSION)
@@ -59,72 +142,24 @@ except ImportError:
     app.logger.warning("pytube não está disponível. Instale com: pip install pytube")
 
 
-# Variáveis globais relacionadas a cookies
-TEMP_COOKIE_FILE_PATH = None
-COOKIES_STATUS_LOGGED = False
-
-
-def log_cookie_status():
-    """
-    Registra nos logs se os cookies do YouTube foram configurados.
-    Executado apenas uma vez por ciclo de vida da aplicação.
-    """
-    global COOKIES_STATUS_LOGGED
-    if COOKIES_STATUS_LOGGED:
-        return
-
-    env_file_path = os.environ.get('YOUTUBE_COOKIES_FILE')
-    env_content = os.environ.get('YOUTUBE_COOKIES_CONTENT')
-
-    if env_file_path and os.path.exists(env_file_path):
-        app.logger.info("Cookies configurados via YOUTUBE_COOKIES_FILE (%s)", env_file_path)
-    elif env_content and env_content.strip():
-        app.logger.info("Cookies configurados via YOUTUBE_COOKIES_CONTENT (conteúdo inline)")
-    else:
-        app.logger.warning(
-            "Nenhum cookie do YouTube configurado. Configure YOUTUBE_COOKIES_CONTENT no Railway para reduzir bloqueios."
-        )
+# Pool de identidades do YouTube (arquivos de cookies), validadas uma única vez no
+# carregamento, com rodízio entre os downloads e quarentena após bloqueios
+cookie_pool = create_cookie_pool_from_env()
+if len(cookie_pool):
+    app.logger.info("Cookies configurados: %d identidade(s) (%s)", len(cookie_pool), cookie_pool.mode)
+else:
+    app.logger.warning(
+        "Nenhum cookie do YouTube configurado. Configure YOUTUBE_COOKIES_CONTENT no Railway para reduzir bloqueios."
+    )
 
-    COOKIES_STATUS_LOGGED = True
 
 def get_cookies_file_path():
     """
-    Retorna o caminho para o arquivo de cookies.
-    Prioridade:
-    1. Variável de ambiente YOUTUBE_COOKIES_FILE (caminho do arquivo)
-    2. Variável de ambiente YOUTUBE_COOKIES_CONTENT (conteúdo do arquivo) -> cria arquivo temporário
+    Retorna o caminho do arquivo de cookies para a próxima requisição, escolhido
+    pelo cookie_pool (menor carga ou rodízio, pulando identidades em quarentena).
+    Fontes: YOUTUBE_COOKIES_FILE, YOUTUBE_COOKIES_DIR e YOUTUBE_COOKIES_CONTENT(_<N>).
     """
-    log_cookie_status()
-
-    global TEMP_COOKIE_FILE_PATH
-    
-    # 1. Verificar se existe caminho explícito definido
-    env_file_path = os.environ.get('YOUTUBE_COOKIES_FILE')
-    if env_file_path and os.path.exists(env_file_path):
-        return env_file_path
-        
-    # 2. Se já criamos um arquivo temporário anteriormente e ele existe, retornar ele
-    if TEMP_COOKIE_FILE_PATH and os.path.exists(TEMP_COOKIE_FILE_PATH):
-        return TEMP_COOKIE_FILE_PATH
-        
-    # 3. Verificar se existe conteúdo de cookies definido em variável de ambiente
-    cookies_content = os.environ.get('YOUTUBE_COOKIES_CONTENT')
-    if cookies_content:
-        try:
-            # Criar arquivo temporário
-            fd, path = tempfile.mkstemp(suffix='.txt', text=True)
-            with os.fdopen(fd, 'w') as f:
-                f.write(cookies_content)
-            
-            TEMP_COOKIE_FILE_PATH = path
-            app.logger.info("Arquivo de cookies temporário criado com sucesso a partir de YOUTUBE_COOKIES_CONTENT")
-            return path
-        except Exception as e:
-            app.logger.error("Erro ao criar arquivo de cookies temporário: %s", str(e))
-            return None
-            
-    return None
-
+    return cookie_pool.pick()
 
 
 def slugify(value: str) -> str:
@@ -138,53 +173,98 @@ def slugify(value: str) -> str:
     return safe[:80]
 
 
+# Links de produtos: índice de domínios de lojas e encurtadores (PRODUCT_LINK_*)
+link_extractor = create_link_extractor_from_env()
+# Expansão opcional dos encurtadores (amzn.to, bit.ly...) com cache SQLite (LINK_EXPANSION_*)
+link_expander = create_link_expander_from_env(is_shortener=link_extractor.is_shortener)
+
+
 def extract_product_links(description: str, link_filter: str = None) -> list:
     """
-    Extrai links de produtos da descrição do vídeo.
+    Extrai links de produtos da descrição do vídeo (uma única leitura do texto).
     
     Args:
         description: Descrição completa do vídeo
-        link_filter: Termo que a URL deve conter para ser incluída (opcional)
+        link_filter: Termo que a URL deve conter para ser incluída (opcional);
+                     vários termos separados por vírgula, '-termo' exclui
     
     Returns:
-        Lista de URLs encontradas
+        Lista de URLs encontradas (normalizadas, sem repetições). Com
+        LINK_EXPANSION_ENABLED, encurtadores são trocados pela URL final (o
+        filtro vale para ela) e descartados se não levarem a um produto.
     """
-    if not description:
-        return []
-    
-    # Padrões comuns de URLs de produtos/afiliados
-    patterns = [
-        r'https?://(?:www\.)?(?:shopee|amazon|aliexpress|magazineluiza|mercadolivre|americanas|submarino|shoptime)\.(?:com\.br|com)/[^\s\)]+',
-        r'https?://(?:amzn\.to|bit\.ly|t\.co|short\.link|tinyurl)/[^\s\)]+',
-        r'https?://[^\s\)]+(?:shopee|amazon|aliexpress|magazineluiza|mercadolivre)[^\s\)]*',
-    ]
+    link_filter = LinkFilter.parse(link_filter)
+    if link_expander is None:
+        return sorted(link.url for link in link_extractor.extract(description, link_filter))
+
+    links = link_extractor.extract(description)
+    expanded = link_expander.expand_many(link.url for link in links if link.kind == SHORTENER)
+    urls = set()
+    for link in links:
+        if link.url in expanded:
+            link = link_extractor.classify_url(expanded[link.url])
+            if link is None:
+                continue
+        if link_filter and not link_filter.matches(link.url):
+            continue
+        urls.add(link.url)
+    return sorted(urls)
+
+
+def build_video_metadata(video_info: dict, save_description: bool = False, save_links: bool = False,
+                         link_filter: str = None) -> dict:
+    """
+    Monta os metadados de um vídeo a partir do info_dict do yt-dlp.
+    Os links são extraídos da descrição mesmo que ela não seja salva.
+    """
+    description = video_info.get('description', '') or ''
+    metadata = {
+        'title': video_info.get('title', ''),
+        'channel': video_info.get('channel', ''),
+        'published_at': video_info.get('upload_date', ''),
+        'description': description if save_description else '',
+        'links': []
+    }
+    if save_links and description:
+        metadata['links'] = extract_product_links(description, link_filter)
+    return metadata
+
+
+def build_metadata_json(metadata: dict, save_description: bool = False, save_links: bool = False) -> dict:
+    """Conteúdo do metadata.json incluído nos pacotes ZIP."""
+    metadata_json = {}
     
-    links = set()
+    if save_description and metadata.get('description'):
+        metadata_json['description'] = metadata['description']
     
-    for pattern in patterns:
-        matches = re.findall(pattern, description, re.IGNORECASE)
-        for match in matches:
-            # Limpar URL (remover caracteres finais indesejados)
-            url = match.rstrip('.,;:!?)]}')
-            
-            # Aplicar filtro se fornecido
-            if link_filter and link_filter.strip():
-                if link_filter.lower() not in url.lower():
-                    continue
-            
-            links.add(url)
+    if save_links and metadata.get('links'):
+        metadata_json['links'] = metadata['links']
     
-    return sorted(list(links))
+    # Adicionar outros metadados úteis
+    if metadata.get('title'):
+        metadata_json['title'] = metadata['title']
+    if metadata.get('channel'):
+        metadata_json['channel'] = metadata['channel']
+    if metadata.get('published_at'):
+        metadata_json['published_at'] = metadata['published_at']
+    return metadata_json
 
 
-def create_video_package(video_buffer: BytesIO, video_filename: str, metadata: dict, 
+def create_video_package(video_artifact: DownloadArtifact, video_filename: str, metadata: dict, 
                          save_video: bool = True, save_description: bool = False, 
-                         save_links: bool = False) -> BytesIO:
+                         save_links: bool = False):
     """
-    Cria um pacote ZIP com vídeo e metadados, ou retorna apenas o buffer do vídeo.
+    Gera um pacote ZIP com vídeo e metadados como uma sequência de blocos de
+    bytes, para ser enviado direto na resposta (sem montar o ZIP em memória
+    nem em disco; o pico de memória é de poucos MB, qualquer que seja o vídeo).
+    
+    O vídeo entra sem compressão (ZIP_STORED): MP4 já é comprimido e o deflate
+    gastaria CPU sem reduzir o tamanho. Apenas o metadata.json é comprimido.
+    Vídeos grandes usam ZIP64 automaticamente.
     
     Args:
-        video_buffer: Buffer do vídeo baixado
+        video_artifact: Vídeo baixado (DownloadArtifact) ou None; quem chama
+                        continua dono do artefato e deve fechá-lo ao fim da resposta
         video_filename: Nome do arquivo de vídeo
         metadata: Dicionário com metadados (description, links, title, etc.)
         save_video: Se deve incluir o vídeo
@@ -192,57 +272,199 @@ def create_video_package(video_buffer: BytesIO, video_filename: str, metadata: d
         save_links: Se deve incluir links
     
     Returns:
-        BytesIO com ZIP ou vídeo direto
+        Gerador de blocos (bytes) do ZIP
     """
-    # Se não há metadados para salvar, retornar vídeo direto
-    if not save_description and not save_links:
-        return video_buffer
+    entries = []
     
-    # Criar ZIP com metadados
-    zip_buffer = BytesIO()
+    # Adicionar vídeo se solicitado
+    if save_video and video_artifact is not None:
+        entries.append(ZipEntry(video_filename, path=video_artifact.path))
     
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Adicionar vídeo se solicitado
-        if save_video:
-            video_buffer.seek(0)
-            zip_file.writestr(video_filename, video_buffer.read())
-        
-        # Preparar JSON com metadados
-        metadata_json = {}
-        
-        if save_description and metadata.get('description'):
-            metadata_json['description'] = metadata['description']
-        
-        if save_links and metadata.get('links'):
-            metadata_json['links'] = metadata['links']
-        
-        # Adicionar outros metadados úteis
-        if metadata.get('title'):
-            metadata_json['title'] = metadata['title']
-        if metadata.get('channel'):
-            metadata_json['channel'] = metadata['channel']
-        if metadata.get('published_at'):
-            metadata_json['published_at'] = metadata['published_at']
-        
-        # Salvar JSON
-        if metadata_json:
-            json_content = json.dumps(metadata_json, ensure_ascii=False, indent=2)
-            zip_file.writestr('metadata.json', json_content.encode('utf-8'))
+    # Preparar JSON com metadados
+    metadata_json = build_metadata_json(metadata, save_description, save_links)
+    if metadata_json:
+        json_content = json.dumps(metadata_json, ensure_ascii=False, indent=2)
+        entries.append(ZipEntry('metadata.json', data=json_content.encode('utf-8'), compress=True))
     
-    zip_buffer.seek(0)
-    return zip_buffer
+    return stream_zip(entries)
 
 
-@app.get("/api/health")
-def health_check():
+# E-mails com acesso a /api/health/details (estado interno: contas de cookies, erros dos extratores)
+HEALTH_DETAILS_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',')
+                         if email.strip()}
+
+
+def available_methods() -> list:
     methods = []
     if YT_DLP_AVAILABLE:
         methods.append("yt-dlp")
     if PYTUBE_AVAILABLE:
         methods.append("pytube")
-    
+    return methods
+
+
+@app.get("/api/health")
+def health_check():
+    """Status público e resumido; os detalhes ficam em /api/health/details."""
+    methods = available_methods()
     message = f"Python backend ativo. Métodos disponíveis: {', '.join(methods) if methods else 'nenhum'}"
-    return jsonify({"status": "OK", "message": message, "methods": methods})
+    return jsonify({
+        "status": "OK",
+        "message": message,
+        "methods": methods,
+    })
+
+
+# ==================== AUTENTICAÇÃO ====================
+
+def decode_access_token(token: str) -> dict:
+    """Claims do token (assinatura e expiração verificadas pelo flask_jwt_extended)."""
+    with app.app_context():
+        return decode_token(token)
+
+
+def load_revoked_tokens(cursor):
+    """Revogações ainda válidas gravadas após o cursor (último id lido)."""
+    with app.app_context():
+        query = RevokedToken.query.filter(RevokedToken.expires_at > datetime.utcnow())
+        if cursor is not None:
+            query = query.filter(RevokedToken.id > cursor)
+        rows = query.order_by(RevokedToken.id).all()
+        entries = [(row.jti, row.expires_at.replace(tzinfo=timezone.utc).timestamp()) for row in rows]
+        return entries, rows[-1].id if rows else cursor
+
+
+def store_revoked_token(jti: str, user_id: str, expires_at: float):
+    """Grava a revogação até a expiração do token (exp)."""
+    with app.app_context():
+        if expires_at:
+            expires = datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)
+        else:
+            expires = datetime.utcnow() + app.config['JWT_ACCESS_TOKEN_EXPIRES']
+        if not RevokedToken.query.filter_by(jti=jti).first():
+            db.session.add(RevokedToken(jti=jti, user_id=user_id, expires_at=expires))
+        db.session.commit()
+
+
+def purge_revoked_tokens() -> int:
+    """Apaga as revogações de tokens já expirados (recusados de qualquer forma pelo decode)."""
+    with app.app_context():
+        removed = RevokedToken.query.filter(RevokedToken.expires_at <= datetime.utcnow()).delete()
+        db.session.commit()
+        return removed
+
+
+def load_user_profile(user_id: int):
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        return user.to_dict() if user else None
+
+
+# Validação de tokens em cache, denylist de tokens revogados e métricas do custo por requisição
+authenticator = create_authenticator_from_env(decode_access_token, load_revoked_tokens, store_revoked_token,
+                                              purge_revoked_tokens)
+
+
+def request_token(allow_query_token: bool = False):
+    """Token JWT do cabeçalho Authorization (ou de ?token=, se permitido)."""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1].strip() or None
+    if allow_query_token:
+        return request.args.get('token') or None
+    return None
+
+
+def request_identity(allow_query_token: bool = False):
+    """
+    Identidade do token da requisição ou None se ausente, inválido, expirado
+    ou revogado. O resultado é guardado na requisição: decoradores e a view
+    não validam o mesmo token duas vezes.
+    """
+    token = request_token(allow_query_token)
+    if not token:
+        return None
+    identities = g.setdefault('auth_identities', {})
+    if token in identities:
+        return identities[token]
+    started = time.perf_counter()
+    try:
+        identity = authenticator.authenticate(token)
+    except AuthError as exc:
+        app.logger.warning("Token inválido: %s", exc)
+        identity = None
+    g.auth_ms = g.get('auth_ms', 0.0) + (time.perf_counter() - started) * 1000
+    identities[token] = identity
+    return identity
+
+
+def user_id_from_request(allow_query_token: bool = False):
+    """
+    Identidade (sub) do token JWT da requisição ou None se ausente/inválido.
+    allow_query_token aceita ?token= (o EventSource não envia cabeçalhos).
+    """
+    identity = request_identity(allow_query_token)
+    return identity.user_id if identity else None
+
+
+def login_required(allow_query_token: bool = False):
+    """
+    Exige um token válido e não revogado; a view recebe o usuário em
+    g.user_id (e o token validado em g.identity).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not request_token(allow_query_token):
+                return jsonify({"error": "Faça login para continuar."}), 401
+            identity = request_identity(allow_query_token)
+            if identity is None:
+                return jsonify({"error": "Sessão inválida. Faça login novamente."}), 401
+            g.identity = identity
+            g.user_id = identity.user_id
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@app.after_request
+def add_auth_timing(response):
+    """Custo da autenticação na requisição (Server-Timing, visível no DevTools)."""
+    if 'auth_ms' in g:
+        response.headers.add('Server-Timing', f"auth;dur={g.auth_ms:.3f}")
+    return response
+
+
+@app.get("/api/health/details")
+@login_required()
+def health_details():
+    """
+    Métricas internas (caches, filas, limitadores, contas de cookies, saúde
+    dos extratores). Apenas para os usuários listados em ADMIN_EMAILS.
+    """
+    profile = authenticator.user_profile(g.user_id, load_user_profile) or {}
+    if (profile.get('email') or '').lower() not in HEALTH_DETAILS_EMAILS:
+        return jsonify({"error": "Acesso restrito aos administradores"}), 403
+    
+    return jsonify({
+        "status": "OK",
+        "methods": available_methods(),
+        "video_cache": video_cache.stats(),
+        "info_cache": info_cache.stats(),
+        "download_coalescing": download_flights.stats(),
+        "download_queue": download_scheduler.stats(),
+        "jobs": job_store.stats(),
+        "download_tuning": download_tuning.stats(),
+        "extraction": extraction_resolver.stats(),
+        "extractor_health": extractor_health.stats(),
+        "outbound_rate_limit": outbound_limiter.stats(),
+        "cookie_pool": cookie_pool.stats(),
+        "inbound_rate_limit": inbound_limiter.stats(),
+        "auth": authenticator.stats(),
+        "format_ladder": format_ladders.stats(),
+        "prefetch": dict(prefetcher.stats(), disk_budget=prefetch_budget.stats()),
+        "link_expansion": link_expander.stats() if link_expander else None,
+    })
 
 
 # ==================== ENDPOINTS DE AUTENTICAÇÃO ====================
@@ -319,24 +541,24 @@ def login():
 
 
 @app.get("/api/auth/verify")
-@jwt_required()
+@login_required()
 def verify():
-    """Verificar se token é válido e retornar dados do usuário"""
+    """Verificar se token é válido e retornar dados do usuário (perfil em cache)"""
     try:
-        user_id = get_jwt_identity()
+        user_id = g.user_id
         try:
             user_id_int = int(user_id)
         except (TypeError, ValueError):
             app.logger.error("Identidade do token inválida: %s", user_id)
             return jsonify({"error": "Sessão inválida. Faça login novamente."}), 401
-        user = User.query.get(user_id_int)
+        user = authenticator.user_profile(user_id_int, load_user_profile)
         
         if not user:
             return jsonify({"error": "Usuário não encontrado"}), 404
         
         return jsonify({
             "valid": True,
-            "user": user.to_dict()
+            "user": user
         }), 200
         
     except Exception as e:
@@ -345,9 +567,15 @@ def verify():
 
 
 @app.post("/api/auth/logout")
-@jwt_required()
+@login_required()
 def logout():
-    """Logout (no JWT, logout é feito no cliente removendo o token)"""
+    """Logout: revoga o token atual, que deixa de ser aceito por todos os workers"""
+    try:
+        authenticator.revoke(g.identity)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Erro ao revogar token: {str(e)}")
+        return jsonify({"error": "Não foi possível encerrar a sessão. Tente novamente."}), 500
     return jsonify({"message": "Logout realizado com sucesso"}), 200
 
 
@@ -355,6 +583,9 @@ def logout():
 def get_video_formats():
     """
     Retorna as qualidades disponíveis para um vídeo.
+    
+    A escada de qualidades (format_ladder) fica em cache junto com o info_dict;
+    a resposta leva ETag e Cache-Control, e If-None-Match recebe 304.
     """
     video_id = request.args.get("videoId")
     if not video_id:
@@ -363,106 +594,19 @@ def get_video_formats():
     if not YT_DLP_AVAILABLE:
         return jsonify({"error": "Serviço temporariamente indisponível"}), 503
 
-    candidate_urls = [
-        f"https://www.youtube.com/watch?v={video_id}",
-        f"https://www.youtube.com/shorts/{video_id}",
-        f"https://youtu.be/{video_id}",
-    ]
-
-    # Verificar cookies antes de tentar
-    cookies_file = get_cookies_file_path()
-    if not cookies_file:
-        app.logger.warning(
-            "⚠️  Listando formatos sem cookies - pode falhar se YouTube bloquear IP"
-        )
-
-    for video_url in candidate_urls:
-        try:
-            # Usar configuração simplificada (similar à branch local)
-            ydl_opts = get_ydl_opts_base(cookies_file=cookies_file, quiet=True, listformats=True)
+    ladder = format_ladders.get(video_id)
+    if ladder is None:
+        # Verificar cookies antes de tentar
+        cookies_file = get_cookies_file_path()
+        if not cookies_file:
+            app.logger.warning(
+                "⚠️  Listando formatos sem cookies - pode falhar se YouTube bloquear IP"
+            )
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Extrair informações (abordagem simples como na branch local)
-                info = ydl.extract_info(video_url, download=False)
-                
-                formats = []
-                seen_qualities = set()
-                
-                # Processar formatos disponíveis
-                for fmt in info.get('formats', []):
-                    # Filtrar apenas formatos de vídeo com H.264 (evitar AV1)
-                    vcodec = fmt.get('vcodec', 'none')
-                    if vcodec == 'none' or 'av01' in vcodec.lower():
-                        continue
-                    
-                    height = fmt.get('height')
-                    width = fmt.get('width')
-                    filesize = fmt.get('filesize') or fmt.get('filesize_approx', 0)
-                    format_id = fmt.get('format_id')
-                    ext = fmt.get('ext', 'mp4')
-                    
-                    if height:
-                        # Criar label de qualidade
-                        if height >= 2160:
-                            quality_label = "4K (2160p)"
-                        elif height >= 1440:
-                            quality_label = "2K (1440p)"
-                        elif height >= 1080:
-                            quality_label = "Full HD (1080p)"
-                        elif height >= 720:
-                            quality_label = "HD (720p)"
-                        elif height >= 480:
-                            quality_label = "SD (480p)"
-                        elif height >= 360:
-                            quality_label = "360p"
-                        else:
-                            quality_label = f"{height}p"
-                        
-                        quality_key = f"{height}p"
-                        
-                        # Evitar duplicatas e priorizar H.264
-                        if quality_key not in seen_qualities or 'avc1' in vcodec.lower():
-                            if quality_key in seen_qualities:
-                                # Substituir se for H.264
-                                formats = [f for f in formats if f.get('height') != height]
-                            
-                            seen_qualities.add(quality_key)
-                            formats.append({
-                                'format_id': format_id,
-                                'quality': quality_label,
-                                'height': height,
-                                'width': width,
-                                'filesize': filesize,
-                                'filesize_mb': round(filesize / (1024 * 1024), 2) if filesize else None,
-                                'vcodec': vcodec,
-                                'ext': ext,
-                            })
-                
-                # Ordenar por altura (maior primeiro)
-                formats.sort(key=lambda x: x['height'], reverse=True)
-                
-                # Adicionar opção "Melhor qualidade disponível"
-                formats.insert(0, {
-                    'format_id': 'best',
-                    'quality': 'Melhor qualidade disponível',
-                    'height': None,
-                    'width': None,
-                    'filesize': None,
-                    'filesize_mb': None,
-                    'vcodec': None,
-                    'ext': 'mp4',
-                })
-                
-                return jsonify({
-                    "formats": formats,
-                    "video_id": video_id,
-                    "title": info.get('title', 'Video')
-                })
-                
-        except Exception as exc:
-            error_msg = str(exc)
-            app.logger.warning("Erro ao obter formatos (%s): %s", video_url, error_msg)
-            
+        # Informações do vídeo (cache compartilhado com os endpoints de download)
+        info, video_url, error_msg = get_video_info(video_id, cookies_file)
+        
+        if not info:
             # Verificar se é erro de bloqueio do YouTube
             if is_bot_detection_error(error_msg):
                 app.logger.error("YouTube bloqueou a requisição (detecção de bot)")
@@ -480,16 +624,183 @@ def get_video_formats():
                     "code": "YOUTUBE_BLOCKED"
                 }), 503
             
+            # Mensagem genérica - não expor detalhes técnicos
+            return jsonify({
+                "error": "Não foi possível processar a solicitação. Tente novamente mais tarde.",
+                "code": "FORMATS_UNAVAILABLE"
+            }), 503
+        
+        # Info do cache compartilhado (ex.: extraída por outro worker): montar a escada neste processo
+        ladder = format_ladders.build(video_id, info)
+    
+    response = Response(ladder.body, mimetype='application/json')
+    response.set_etag(ladder.etag)
+    response.headers['Cache-Control'] = f'public, max-age={FORMATS_MAX_AGE}'
+    return response.make_conditional(request)
+
+
+def youtube_candidate_urls(video_id: str) -> list:
+    """Variações de URL aceitas pelo YouTube para o mesmo vídeo."""
+    return [
+        f"https://www.youtube.com/watch?v={video_id}",
+        f"https://www.youtube.com/shorts/{video_id}",
+        f"https://youtu.be/{video_id}",
+    ]
+
+
+def pytube_info_dict(yt, video_id: str) -> dict:
+    """
+    Converte um objeto do pytube em um info_dict no formato do yt-dlp (apenas
+    formatos HTTP diretos), para que o restante do pipeline (seleção de
+    formato, download, cache) funcione igual com qualquer estratégia.
+    """
+    formats = []
+    for stream in yt.streams:
+        if stream.subtype not in ('mp4', 'webm'):
             continue
+        is_audio_only = not stream.includes_video_track
+        height = None
+        if stream.resolution:
+            try:
+                height = int(stream.resolution.rstrip('p'))
+            except ValueError:
+                pass
+        formats.append({
+            'format_id': str(stream.itag),
+            'url': stream.url,
+            'ext': ('m4a' if stream.subtype == 'mp4' else 'webm') if is_audio_only else stream.subtype,
+            'protocol': 'https',
+            'vcodec': 'none' if is_audio_only else (stream.video_codec or 'unknown'),
+            'acodec': (stream.audio_codec or 'unknown') if stream.includes_audio_track else 'none',
+            'height': height,
+            'fps': getattr(stream, 'fps', None),
+            'abr': int(stream.abr.rstrip('kbps')) if getattr(stream, 'abr', None) else None,
+            'filesize': getattr(stream, '_filesize', None) or None,
+        })
+    publish_date = getattr(yt, 'publish_date', None)
+    return {
+        'id': video_id,
+        'title': yt.title,
+        'description': yt.description or '',
+        'channel': yt.author,
+        'uploader': yt.author,
+        'duration': yt.length,
+        'upload_date': publish_date.strftime('%Y%m%d') if publish_date else None,
+        'thumbnail': yt.thumbnail_url,
+        'webpage_url': yt.watch_url,
+        'extractor': 'pytube',
+        'extractor_key': 'Pytube',
+        'formats': formats,
+    }
+
+
+def extraction_strategies(video_id: str, cookies_file=None) -> list:
+    """
+    Estratégias de extração do info_dict, em ordem de preferência:
+    variações de URL (yt-dlp), player_clients alternativos (yt-dlp) e pytube.
+    """
+    def ytdlp_strategy(video_url, player_client=None):
+        def extract(cancel):
+            if cancel.is_set():
+                raise RuntimeError("Extração cancelada")
+            # Mesmo seletor dos downloads: 'best' falharia em vídeos só com formatos DASH
+            ydl_opts = get_ydl_opts_base(format_selector=get_format_selector(), cookies_file=cookies_file,
+                                         quiet=True, player_client=player_client)
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl, cookie_pool.using(cookies_file):
+                try:
+                    info = ydl.extract_info(video_url, download=False)
+                    if not info:
+                        raise RuntimeError("yt-dlp não retornou informações")
+                except Exception as exc:
+                    cookie_pool.report(cookies_file, exc, blocked=is_bot_detection_error(str(exc)))
+                    raise
+                cookie_pool.report(cookies_file)
+                return ydl.sanitize_info(info)
+        return extract
     
-    # Mensagem genérica - não expor detalhes técnicos
-    return jsonify({
-        "error": "Não foi possível processar a solicitação. Tente novamente mais tarde.",
-        "code": "FORMATS_UNAVAILABLE"
-    }), 503
+    def pytube_strategy(video_url):
+        def extract(cancel):
+            if cancel.is_set():
+                raise RuntimeError("Extração cancelada")
+            yt = YouTube(video_url, use_oauth=False, allow_oauth_cache=False)
+            return pytube_info_dict(yt, video_id)
+        return extract
+    
+    urls = youtube_candidate_urls(video_id)
+    # Com várias identidades no pool, o bloqueio (e o circuito) vale só para a identidade usada
+    suffix = f"@{cookie_identity(cookies_file)}" if cookies_file and len(cookie_pool) > 1 else ''
+    strategies = []
+    if YT_DLP_AVAILABLE:
+        for label, video_url in zip(('watch', 'shorts', 'youtu.be'), urls):
+            # Variações de URL usam o mesmo cliente: um bloqueio vale para todas
+            strategies.append(Strategy(f"yt-dlp:{label}", ytdlp_strategy(video_url), group=f"yt-dlp:default{suffix}"))
+        for client in EXTRACTION_PLAYER_CLIENTS:
+            strategies.append(Strategy(f"yt-dlp:client={client}", ytdlp_strategy(urls[0], [client]),
+                                       group=f"yt-dlp:{client}{suffix}"))
+    if PYTUBE_AVAILABLE:
+        strategies.append(Strategy("pytube", pytube_strategy(urls[0]), group='pytube'))
+    return strategies
+
+
+def cookie_identity(cookies_file=None):
+    """Nome da identidade do pool para o arquivo de cookies (usado no limitador de saída)."""
+    if not cookies_file:
+        return None
+    identity = cookie_pool.identity_for(cookies_file)
+    return identity.name if identity else os.path.basename(cookies_file)
+
+
+def get_video_info(video_id: str, cookies_file=None, use_cache: bool = True, priority: str = INTERACTIVE):
+    """
+    Retorna o info_dict do vídeo usando o cache de informações (compartilhado por
+    /api/formats, /api/download e /api/download-with-metadata).
+    
+    Sem cache, as estratégias de extraction_strategies rodam com partidas
+    escalonadas (extraction_resolver): uma estratégia lenta ou falhando não
+    atrasa as outras, e a vencedora recente é tentada primeiro. Cada estratégia
+    iniciada passa antes pelo limitador de saída (priority: INTERACTIVE ou
+    BACKGROUND); sem token, as seguintes não começam.
+    
+    Returns:
+        (info, video_url, error_message) - info é None se todas as estratégias falharem
+    """
+    if use_cache:
+        cached_info = info_cache.get(video_id)
+        if cached_info:
+            app.logger.info("Informações do vídeo %s obtidas do cache", video_id)
+            video_url = cached_info.get('webpage_url') or f"https://www.youtube.com/watch?v={video_id}"
+            return cached_info, video_url, None
+
+    # Todas as estratégias desta extração usam a mesma identidade do pool
+    cookies_file = cookies_file or get_cookies_file_path()
+    strategies = extraction_strategies(video_id, cookies_file)
+    if not strategies:
+        return None, None, "Nenhum extrator disponível"
+    
+    identity = cookie_identity(cookies_file)
+    
+    def take_token(strategy):
+        # Um token por estratégia que de fato começa (a primeira e cada partida escalonada)
+        outbound_limiter.acquire(identity, priority)
+    
+    try:
+        info, strategy_name = extraction_resolver.resolve('extract', strategies, skip_group_on=is_bot_detection_error,
+                                                          before_start=take_token, client_error=is_client_error)
+    except AllStrategiesFailed as exc:
+        for name, error in exc.errors.items():
+            app.logger.warning("Erro ao obter informações (%s): %s", name, error)
+        # Priorizar a mensagem de bloqueio, que muda a resposta dos endpoints
+        error_msg = next((str(e) for e in exc.errors.values() if is_bot_detection_error(str(e))), str(exc))
+        return None, None, error_msg
+    
+    app.logger.info("Informações do vídeo %s obtidas com a estratégia %s", video_id, strategy_name)
+    info_cache.set(video_id, info)
+    format_ladders.build(video_id, info)
+    video_url = info.get('webpage_url') or f"https://www.youtube.com/watch?v={video_id}"
+    return info, video_url, None
 
 
-def get_ydl_opts_base(format_selector=None, cookies_file=None, quiet=False, listformats=False, player_client=None, strategy='default'):
+def get_ydl_opts_base(format_selector=None, cookies_file=None, quiet=False, listformats=False, player_client=None, strategy='default', tuning_tier=None):
     """
     Retorna configurações base simplificadas do yt-dlp (similar à branch local).
     Mantém suporte a cookies que é essencial para produção.
@@ -501,8 +812,10 @@ def get_ydl_opts_base(format_selector=None, cookies_file=None, quiet=False, list
         listformats: Se True, apenas lista formatos sem baixar
         player_client: Lista de player_clients para tentar (None = usa padrão do yt-dlp)
         strategy: Estratégia a usar (mantido para compatibilidade, mas não usado)
+        tuning_tier: Faixa de qualidade ('sd', 'hd', 'fhd') para aplicar o perfil de
+                     download_tuning (fragmentos em paralelo, chunk size, retries, timeout)
     """
-    # Obter caminho do arquivo de cookies
+    # Obter caminho do arquivo de cookies (identidade escolhida pelo cookie_pool)
     final_cookies_file = cookies_file or get_cookies_file_path()
     
     # Configuração simplificada similar à branch local
@@ -514,10 +827,20 @@ def get_ydl_opts_base(format_selector=None, cookies_file=None, quiet=False, list
         'verbose': not quiet,
     }
     
-    # Usar cookies se disponíveis (ESSENCIAL para produção)
-    if final_cookies_file and os.path.exists(final_cookies_file):
+    if tuning_tier:
+        opts.update(download_tuning.options_for_tier(tuning_tier))
+    
+    # ffmpeg fora do PATH (mesmo binário usado no mux em streaming)
+    if os.environ.get('FFMPEG_BINARY'):
+        opts['ffmpeg_location'] = os.environ['FFMPEG_BINARY']
+    
+    # Clientes do player do YouTube a usar na extração (ex.: ['ios'], ['android'])
+    if player_client:
+        opts['extractor_args'] = {'youtube': {'player_client': list(player_client)}}
+    
+    # Usar cookies se disponíveis (ESSENCIAL para produção); o pool já validou o arquivo
+    if final_cookies_file:
         opts['cookiefile'] = final_cookies_file
-        app.logger.info("Usando cookies do YouTube: %s", final_cookies_file)
     
     # Adicionar format apenas se não for listagem e se fornecido
     if not listformats:
@@ -568,6 +891,72 @@ def is_bot_detection_error(error_msg):
     return any(indicator in error_lower for indicator in bot_indicators)
 
 
+def is_client_error(error):
+    """
+    Verifica se a falha foi causada pelo próprio pedido (vídeo inexistente,
+    privado ou removido, ID inválido) e não pelo backend. Essas falhas não
+    contam na saúde dos extratores; bloqueios nunca são erros do cliente.
+    
+    Args:
+        error: Exceção (yt-dlp/pytube) ou mensagem de erro original
+    """
+    if not error or is_bot_detection_error(error):
+        return False
+    if YT_DLP_AVAILABLE and isinstance(error, yt_dlp.utils.DownloadError) and error.exc_info:
+        error = error.exc_info[1] or error
+    if YT_DLP_AVAILABLE and isinstance(error, yt_dlp.utils.ExtractorError):
+        # Erros de rede também chegam como expected=True: esses são do backend
+        network = (error.cause, error.exc_info[1])
+        return error.expected and not any(isinstance(e, network_exceptions) for e in network)
+    if PYTUBE_AVAILABLE and isinstance(error, VideoUnavailable):
+        return True
+    
+    error_lower = str(error).lower()
+    client_indicators = [
+        "video unavailable",
+        "private video",
+        "video is private",
+        "has been removed",
+        "incomplete youtube id",
+        "is not a valid url",
+        "does not exist",
+    ]
+    return any(indicator in error_lower for indicator in client_indicators)
+
+
+class DownloadFailure(str):
+    """
+    Mensagem de erro do download para o usuário, com a causa original (erro do
+    yt-dlp/pytube). blocked e client_error são decididos pela causa, e não pelo
+    texto do backend, que menciona bloqueio mesmo quando o vídeo não existe.
+    """
+    
+    def __new__(cls, message: str, cause=None):
+        failure = super().__new__(cls, message)
+        failure.cause = cause
+        failure.blocked = is_bot_detection_error(cause)
+        failure.client_error = is_client_error(cause)
+        return failure
+
+
+def record_download_health(key: str, success: bool, started: float, error_msg=None):
+    """
+    Registra o resultado de um backend de download no extractor_health.
+    Falhas do próprio pedido não contam: só liberam o probe do circuito.
+    """
+    if success:
+        extractor_health.record(key, True, time.monotonic() - started)
+        return
+    if isinstance(error_msg, DownloadFailure):
+        blocked, client_error = error_msg.blocked, error_msg.client_error
+    else:
+        blocked, client_error = is_bot_detection_error(error_msg), is_client_error(error_msg)
+    if client_error:
+        extractor_health.release_probe(key)
+    else:
+        extractor_health.record(key, False, time.monotonic() - started, error=error_msg, blocked=blocked)
+
+
 def get_format_selector(quality=None):
     """
     Retorna a string de formato baseada na qualidade selecionada.
@@ -593,16 +982,193 @@ def get_format_selector(quality=None):
         )
 
 
-def download_with_ytdlp(video_id: str, quality=None, progress_callback=None):
+def expected_download_size(info: dict) -> dict:
+    """
+    Calcula o total esperado de bytes e o número de componentes (vídeo + áudio)
+    a partir do info_dict já processado pelo seletor de formatos.
+    """
+    requested_formats = [f for f in (info.get('requested_formats') or []) if f]
+    if requested_formats:
+        total = sum((f.get('filesize') or f.get('filesize_approx') or 0) for f in requested_formats)
+        return {'total_expected_bytes': total, 'remaining_components': len(requested_formats)}
+    
+    total = info.get('filesize') or info.get('filesize_approx') or 0
+    return {'total_expected_bytes': total, 'remaining_components': 1}
+
+
+def make_ytdlp_progress_hooks(progress_callback):
+    """
+    Cria os hooks de progresso do yt-dlp (progress_hooks e postprocessor_hooks)
+    que convertem os eventos em chamadas a progress_callback.
+    
+    Returns:
+        (state, progress_hook, postprocessor_hook) - state recebe o total esperado
+        via expected_download_size antes do download começar
+    """
+    state = {
+        'total_expected_bytes': 0,
+        'remaining_components': 1,
+        'downloaded_total_bytes': 0,
+        'file_bytes': {},
+    }
+    # Componentes DASH podem ser baixados em paralelo: bytes contados por arquivo
+    state_lock = threading.Lock()
+    
+    def processing_event(message):
+        downloaded = state['downloaded_total_bytes']
+        combined_total = state['total_expected_bytes'] or downloaded
+        return {
+            'status': 'processing',
+            'percent': 100,
+            'downloaded_bytes': downloaded,
+            'total_bytes': combined_total,
+            'downloaded_mb': round(downloaded / (1024 * 1024), 2),
+            'total_mb': round(combined_total / (1024 * 1024), 2) if combined_total else None,
+            'message': message,
+        }
+    
+    def progress_hook(d):
+        try:
+            status = d.get('status', '')
+            filename = d.get('filename') or (d.get('info_dict') or {}).get('format_id')
+            if status == 'downloading':
+                downloaded = d.get('downloaded_bytes') or 0
+                with state_lock:
+                    previous = state['file_bytes'].get(filename, 0)
+                    state['downloaded_total_bytes'] += max(0, downloaded - previous)
+                    state['file_bytes'][filename] = max(previous, downloaded)
+                    downloaded_total = state['downloaded_total_bytes']
+                
+                combined_total = state['total_expected_bytes'] or 0
+                if not combined_total:
+                    combined_total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                
+                percent = None
+                if combined_total:
+                    percent = min(99.9, (downloaded_total / combined_total) * 100)
+                
+                speed = d.get('speed', 0)
+                progress_callback({
+                    'status': 'downloading',
+                    'percent': round(percent, 2) if percent is not None else None,
+                    'downloaded_bytes': downloaded_total,
+                    'total_bytes': combined_total if combined_total else None,
+                    'downloaded_mb': round(downloaded_total / (1024 * 1024), 2),
+                    'total_mb': round(combined_total / (1024 * 1024), 2) if combined_total else None,
+                    'speed': speed,
+                    'speed_mbps': round(speed / (1024 * 1024), 2) if speed else 0,
+                })
+            elif status == 'finished':
+                app.logger.info("Progress hook: status='finished' - componente baixado")
+                with state_lock:
+                    previous = state['file_bytes'].get(filename, 0)
+                    file_total = d.get('total_bytes') or d.get('total_bytes_estimate') or previous
+                    if file_total and previous < file_total:
+                        state['downloaded_total_bytes'] += (file_total - previous)
+                    state['file_bytes'][filename] = file_total
+                    state['remaining_components'] = max(0, state['remaining_components'] - 1)
+                    all_done = state['remaining_components'] <= 0
+                
+                if all_done:
+                    progress_callback(processing_event('Processando... Juntando áudio e vídeo (isso pode demorar)'))
+        except Exception as e:
+            app.logger.error("Erro no progress_hook: %s", str(e))
+            # Não propagar erro para não quebrar o download
+    
+    def postprocessor_hook(d):
+        try:
+            if d.get('status') == 'started' and d.get('postprocessor') == 'Merger':
+                app.logger.info("Postprocessor hook: merge iniciado")
+                progress_callback(processing_event('Processando... Juntando áudio e vídeo (isso pode demorar)'))
+        except Exception as e:
+            app.logger.error("Erro no postprocessor_hook: %s", str(e))
+    
+    return state, progress_hook, postprocessor_hook
+
+
+def get_downloaded_filepath(info: dict):
+    """
+    Retorna o caminho do arquivo final informado pelo yt-dlp no info_dict
+    (requested_downloads[*].filepath, preenchido após o merge e a movimentação).
+    """
+    candidates = []
+    for requested in reversed(info.get('requested_downloads') or []):
+        candidates.extend([requested.get('filepath'), requested.get('_filename')])
+    candidates.extend([info.get('filepath'), info.get('_filename')])
+    
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def download_components_parallel(ydl, info: dict, tmpdir: str, filename: str):
+    """
+    Baixa vídeo e áudio de um par DASH ao mesmo tempo e junta com o ffmpeg.
+    Sozinho, o yt-dlp baixa um componente depois do outro; aqui cada um roda
+    em seu próprio YoutubeDL (mesmas opções, hooks e perfil de ajuste).
+    
+    Returns:
+        Caminho do MP4 final ou None se algum componente não foi baixado
+    """
+    from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+    
+    source_info = copy.deepcopy(info)
+    for key in ('requested_formats', 'requested_downloads'):
+        source_info.pop(key, None)
+    
+    def fetch(fmt):
+        params = dict(ydl.params)
+        params['format'] = fmt['format_id']
+        params['outtmpl'] = os.path.join(tmpdir, f"component_{fmt['format_id']}.%(ext)s")
+        params['postprocessor_hooks'] = []
+        with yt_dlp.YoutubeDL(params) as component_ydl:
+            result = component_ydl.process_ie_result(copy.deepcopy(source_info), download=True)
+        return get_downloaded_filepath(result)
+    
+    video_fmt, audio_fmt = sorted(info['requested_formats'], key=lambda f: f.get('vcodec') in (None, 'none'))
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='dash-component') as executor:
+        video_future = executor.submit(fetch, video_fmt)
+        audio_future = executor.submit(fetch, audio_fmt)
+        video_path, audio_path = video_future.result(), audio_future.result()
+    if not video_path or not audio_path:
+        return None
+    
+    # Mesmos hooks do merge do yt-dlp (progresso 'processing' e slot de merge)
+    hooks = ydl.params.get('postprocessor_hooks') or []
+    for hook in hooks:
+        hook({'status': 'started', 'postprocessor': 'Merger', 'info_dict': info})
+    output_path = os.path.join(tmpdir, filename)
+    try:
+        FFmpegPostProcessor(ydl).run_ffmpeg_multiple_files(
+            [video_path, audio_path], output_path,
+            ['-c', 'copy', '-map', '0:v:0', '-map', '1:a:0', '-movflags', '+faststart'],
+        )
+    finally:
+        for hook in hooks:
+            hook({'status': 'finished', 'postprocessor': 'Merger', 'info_dict': info})
+    return output_path
+
+
+def download_with_ytdlp(video_id: str, quality=None, progress_callback=None, priority: str = INTERACTIVE):
     """
     Tenta baixar o vídeo usando yt-dlp (PRIMEIRA PRIORIDADE).
-    Retorna (success, buffer, filename, error_message)
+    Retorna (success, artifact, filename, error_message), onde artifact é um
+    DownloadArtifact com o MP4 final em disco.
     
     Args:
         video_id: ID do vídeo do YouTube
         quality: format_id específico ou 'best' para melhor qualidade
         progress_callback: função callback(d, status) para progresso
+        priority: prioridade no limitador de saída (INTERACTIVE ou BACKGROUND)
     """
+    # Consultar o cache em disco antes de acessar o YouTube (a requisição já foi
+    # contabilizada em start_shared_download; aqui cobre quem esperou outro worker)
+    cached = video_cache.lookup(video_id, quality, record_stats=False)
+    if cached:
+        app.logger.info("Vídeo servido do cache: %s (formato %s)", video_id, cached.format_id)
+        return True, DownloadArtifact(cached.path, cached.filename), cached.filename, None
+
     if not YT_DLP_AVAILABLE:
         return False, None, None, "yt-dlp não está instalado"
 
@@ -615,32 +1181,35 @@ def download_with_ytdlp(video_id: str, quality=None, progress_callback=None):
             "Configure YOUTUBE_COOKIES_CONTENT no Railway seguindo GUIA_COOKIES.md"
         )
 
-    candidate_urls = [
-        f"https://www.youtube.com/watch?v={video_id}",
-        f"https://www.youtube.com/shorts/{video_id}",
-        f"https://youtu.be/{video_id}",
-    ]
-    
-    # Abordagem simplificada: tentar cada URL sem estratégias complexas
-    for video_url in candidate_urls:
-        try:
+    # Duas tentativas: a primeira pode usar o info_dict em cache (de /api/formats ou de
+    # um download anterior); se o download falhar, extrai de novo, pois as URLs
+    # assinadas do info_dict podem ter sido recusadas
+    last_error = None  # erro original (yt-dlp) da última tentativa
+    for attempt in range(2):
+        # Extração com estratégias em paralelo escalonado (URLs, player_clients, pytube)
+        info, video_url, error_msg = get_video_info(video_id, cookies_file, use_cache=(attempt == 0), priority=priority)
+        if not info:
+            app.logger.warning("Não foi possível extrair informações de %s: %s", video_id, error_msg)
+            last_error = error_msg
+            # Identidade bloqueada (já em quarentena): tentar de novo com outra do pool
+            if is_bot_detection_error(error_msg) and cookie_pool.available_count():
+                cookies_file = get_cookies_file_path()
+                continue
+            break
+        
+        merge_slot = {'held': False}
+        try:
             app.logger.info("Tentando download com yt-dlp: %s (qualidade: %s)", video_url, quality or 'best')
             
             # Configuração do yt-dlp para baixar em formato compatível (H.264/AVC1)
             format_selector = get_format_selector(quality)
             
-            total_expected_bytes = 0
-            total_components = 1
-            downloaded_total_bytes = 0
-            current_filename = None
-            last_file_bytes = 0
-            remaining_components = 1
-
             # Usar configuração simplificada (similar à branch local)
             ydl_opts = get_ydl_opts_base(
                 format_selector=format_selector, 
                 cookies_file=cookies_file, 
-                quiet=False
+                quiet=False,
+                tuning_tier=tier_for_format(info)
             )
             
             # Log informativo sobre uso de cookies
@@ -648,317 +1217,111 @@ def download_with_ytdlp(video_id: str, quality=None, progress_callback=None):
                 app.logger.info("Usando cookies do YouTube para autenticação (arquivo: %s)", cookies_file)
             else:
                 app.logger.warning("⚠️  Download sem cookies - maior risco de bloqueio pelo YouTube")
-                
-                # Adicionar hook de progresso se callback fornecido
-                if progress_callback:
-                    merge_started = False
-                
-                def progress_hook(d):
-                    nonlocal merge_started, total_expected_bytes, downloaded_total_bytes, current_filename, last_file_bytes, remaining_components
-                    try:
-                        status = d.get('status', '')
-                        if status == 'downloading':
-                            filename = d.get('filename') or (d.get('info_dict') or {}).get('id')
-                            if filename != current_filename:
-                                current_filename = filename
-                                last_file_bytes = 0
-                            
-                            downloaded = d.get('downloaded_bytes') or 0
-                            delta = max(0, downloaded - last_file_bytes)
-                            downloaded_total_bytes += delta
-                            last_file_bytes = downloaded
-                            
-                            combined_total = total_expected_bytes or 0
-                            if not combined_total:
-                                combined_total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-                            
-                            percent = None
-                            if combined_total:
-                                percent = min(99.9, (downloaded_total_bytes / combined_total) * 100)
-                            
-                            speed = d.get('speed', 0)
-                            progress_callback({
-                                'status': 'downloading',
-                                'percent': round(percent, 2) if percent is not None else None,
-                                'downloaded_bytes': downloaded_total_bytes,
-                                'total_bytes': combined_total if combined_total else None,
-                                'downloaded_mb': round(downloaded_total_bytes / (1024 * 1024), 2),
-                                'total_mb': round(combined_total / (1024 * 1024), 2) if combined_total else None,
-                                'speed': speed,
-                                'speed_mbps': round(speed / (1024 * 1024), 2) if speed else 0,
-                            })
-                        elif status == 'finished':
-                            app.logger.info("Progress hook: status='finished' - segmentos baixados")
-                            file_total = d.get('total_bytes') or d.get('total_bytes_estimate') or last_file_bytes
-                            if file_total and last_file_bytes < file_total:
-                                downloaded_total_bytes += (file_total - last_file_bytes)
-                            last_file_bytes = 0
-                            remaining_components = max(0, remaining_components - 1)
-                            
-                            if remaining_components <= 0:
-                                merge_started = True
-                                combined_total = total_expected_bytes or downloaded_total_bytes
-                                progress_callback({
-                                    'status': 'processing',
-                                    'percent': 100,
-                                    'downloaded_bytes': downloaded_total_bytes,
-                                    'total_bytes': combined_total,
-                                    'downloaded_mb': round(downloaded_total_bytes / (1024 * 1024), 2),
-                                    'total_mb': round(combined_total / (1024 * 1024), 2) if combined_total else None,
-                                    'message': 'Processando... Juntando áudio e vídeo (isso pode demorar)'
-                                })
-                        elif status == 'postprocessor':
-                            app.logger.info("Progress hook: status='postprocessor' - merge iniciado")
-                            merge_started = True
-                            progress_callback({
-                                'status': 'processing',
-                                'percent': 100,
-                                'downloaded_bytes': downloaded_total_bytes,
-                                'total_bytes': total_expected_bytes or downloaded_total_bytes,
-                                'downloaded_mb': round(downloaded_total_bytes / (1024 * 1024), 2),
-                                'total_mb': round((total_expected_bytes or downloaded_total_bytes) / (1024 * 1024), 2),
-                                'message': 'Processando... Juntando áudio e vídeo (isso pode demorar)'
-                            })
-                    except Exception as e:
-                        app.logger.error("Erro no progress_hook: %s", str(e))
-                        # Não propagar erro para não quebrar o download
-                
+            
+            # Hooks do próprio yt-dlp informam progresso e pós-processamento (merge)
+            progress_state = None
+            if progress_callback:
+                progress_state, progress_hook, postprocessor_hook = make_ytdlp_progress_hooks(progress_callback)
                 ydl_opts['progress_hooks'] = [progress_hook]
-
-                buffer = BytesIO()
+                ydl_opts['postprocessor_hooks'] = [postprocessor_hook]
+            
+            # Limitar merges simultâneos do ffmpeg (o download espera por uma vaga)
+            def merge_slot_hook(d):
+                if d.get('postprocessor') != 'Merger':
+                    return
+                if d.get('status') == 'started' and not merge_slot['held']:
+                    download_scheduler.acquire_merge_slot()
+                    merge_slot['held'] = True
+                elif d.get('status') == 'finished' and merge_slot['held']:
+                    download_scheduler.release_merge_slot()
+                    merge_slot['held'] = False
+            
+            ydl_opts.setdefault('postprocessor_hooks', []).insert(0, merge_slot_hook)
+            
+            # Usar yt-dlp para baixar em um diretório temporário
+            with tempfile.TemporaryDirectory() as tmpdir:
+                ydl_opts['outtmpl'] = os.path.join(tmpdir, '%(title)s.%(ext)s')
                 
-                # Usar yt-dlp para baixar diretamente para o buffer
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    ydl_opts['outtmpl'] = os.path.join(tmpdir, '%(title)s.%(ext)s')
-                    # Manter quiet=True para não interferir no comportamento padrão
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl, cookie_pool.using(cookies_file):
+                    # Aplicar o seletor de formato deste download sobre o info_dict extraído
+                    info = ydl.process_ie_result(info, download=False)
+                    
+                    if progress_state is not None:
+                        progress_state.update(expected_download_size(info))
+                    
+                    title = info.get('title', 'video')
+                    filename = f"{slugify(title)}.mp4"
+                    
+                    # Mesmo formato resolvido já baixado (ex.: outra qualidade que resolve igual)
+                    cached = video_cache.lookup_format(video_id, quality, info.get('format_id'))
+                    if cached:
+                        app.logger.info("Formato %s já está no cache para vídeo %s", cached.format_id, video_id)
+                        return True, DownloadArtifact(cached.path, cached.filename), cached.filename, None
+                    
+                    # Ritmo das requisições ao YouTube (o download também conta): um token
+                    # por componente buscado na origem (vídeo e áudio de um par DASH)
+                    components = len(info.get('requested_formats') or []) or 1
+                    outbound_limiter.acquire(cookie_identity(cookies_file), priority, cost=components)
+                    
+                    # Perfil de ajuste conforme a qualidade realmente escolhida
+                    ydl.params.update(download_tuning.options_for_info(info))
+                    
+                    if download_tuning.parallel_components and len(info.get('requested_formats') or []) == 2:
+                        # Par DASH: vídeo e áudio baixados ao mesmo tempo
+                        downloaded_file = download_components_parallel(ydl, info, tmpdir, filename)
+                    else:
+                        # Baixar reaproveitando as informações já extraídas. process_ie_result só
+                        # retorna depois do download e do merge, então não há polling do diretório.
+                        info = ydl.process_ie_result(info, download=True)
+                        downloaded_file = get_downloaded_filepath(info)
+                    
+                    if not downloaded_file:
+                        app.logger.warning("yt-dlp não informou o arquivo final em %s: %s", tmpdir, os.listdir(tmpdir))
+                        continue
                     
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        # Obter informações do vídeo primeiro (abordagem simples como na branch local)
-                        info = ydl.extract_info(video_url, download=False)
-
-                        requested_formats = info.get('requested_formats')
-                        if isinstance(requested_formats, list) and requested_formats:
-                            total_components = len([f for f in requested_formats if f])
-                            remaining_components = total_components
-                            total_expected_bytes = 0
-                            for fmt in requested_formats:
-                                if not fmt:
-                                    continue
-                                size = fmt.get('filesize') or fmt.get('filesize_approx')
-                                if size:
-                                    total_expected_bytes += size
-                        else:
-                            size = info.get('filesize') or info.get('filesize_approx')
-                            if size:
-                                total_expected_bytes = size
-                            total_components = 1
-                            remaining_components = 1
-
-                        title = info.get('title', 'video')
-                        filename = f"{slugify(title)}.mp4"
-                        
-                        # Baixar o vídeo em thread para poder monitorar o progresso
-                        
-                        download_complete = threading.Event()
-                        download_error = [None]
-                        final_mp4_files = []
-                        
-                        def download_thread_func():
-                            try:
-                                app.logger.info("Thread: Iniciando ydl.download para %s", video_url)
-                                ydl.download([video_url])
-                                app.logger.info("Thread: ydl.download retornou")
-                                download_complete.set()
-                            except Exception as e:
-                                app.logger.error("Thread: Erro durante ydl.download: %s", str(e))
-                                import traceback
-                                app.logger.error(traceback.format_exc())
-                                download_error[0] = e
-                                download_complete.set()
-                        
-                        download_thread = threading.Thread(target=download_thread_func, daemon=True)
-                        download_thread.start()
-                        app.logger.debug("Monitorando diretório temporário: %s", tmpdir)
-                        
-                        # Monitorar diretório enquanto download está rodando
-                        max_wait = 600  # 10 minutos máximo
-                        wait_start = time.time()
-                        last_log_time = 0
-                        
-                        while not download_complete.is_set() and (time.time() - wait_start) < max_wait:
-                            time.sleep(2)  # Verificar a cada 2 segundos
-                            
-                            try:
-                                all_files = os.listdir(tmpdir)
-                                # Procurar arquivo final (.mp4 que não seja temporário)
-                                # Excluir todos os arquivos temporários do yt-dlp (.f*.mp4, .f*.m4a)
-                                candidate_files = [
-                                    f for f in all_files 
-                                    if f.endswith('.mp4') 
-                                    and os.path.isfile(os.path.join(tmpdir, f))
-                                    and not re.search(r'\.f\d+\.(mp4|m4a)$', f)  # Excluir .f136.mp4, .f137.mp4, etc.
-                                ]
-                                
-                                # Priorizar arquivo final (não .temp.mp4)
-                                final_files = [f for f in candidate_files if not f.endswith('.temp.mp4')]
-                                
-                                # Se não encontrou arquivo final, verificar .temp.mp4
-                                if not final_files:
-                                    temp_files = [f for f in candidate_files if f.endswith('.temp.mp4')]
-                                    if temp_files:
-                                        temp_file = os.path.join(tmpdir, temp_files[0])
-                                        # Verificar se o arquivo temp está estável (FFmpeg terminou)
-                                        temp_size1 = os.path.getsize(temp_file)
-                                        time.sleep(2)
-                                        temp_size2 = os.path.getsize(temp_file)
-                                        if temp_size1 == temp_size2 and temp_size1 > 0:
-                                            app.logger.info("Arquivo .temp.mp4 estável encontrado: %s (%d bytes)", temp_files[0], temp_size1)
-                                            # Usar o temp como final
-                                            final_mp4_files = [temp_files[0]]
-                                            break
-                                
-                                # Se encontrar arquivo final, usar ele
-                                if final_files and not final_mp4_files:
-                                    try:
-                                        file_path = os.path.join(tmpdir, final_files[0])
-                                        if not os.path.exists(file_path):
-                                            continue  # Arquivo foi deletado, continuar monitorando
-                                        
-                                        final_mp4_files = final_files
-                                        app.logger.info("Arquivo final detectado durante download: %s", final_mp4_files[0])
-                                        
-                                        # Aguardar um pouco mais para garantir que está completo
-                                        time.sleep(3)
-                                        
-                                        # Verificar se arquivo ainda existe e está estável
-                                        if not os.path.exists(file_path):
-                                            app.logger.debug("Arquivo removido durante verificação; aguardando FFmpeg")
-                                            final_mp4_files = []  # Reset para continuar procurando
-                                            continue
-                                        
-                                        file_size = os.path.getsize(file_path)
-                                        time.sleep(2)
-                                        
-                                        # Verificar novamente se arquivo ainda existe e está estável
-                                        if not os.path.exists(file_path):
-                                            app.logger.debug("Arquivo removido durante verificação de tamanho; aguardando FFmpeg")
-                                            final_mp4_files = []  # Reset para continuar procurando
-                                            continue
-                                        
-                                        if os.path.getsize(file_path) == file_size:  # Arquivo não mudou
-                                            app.logger.info("Arquivo final estável (tamanho: %d bytes). Finalizando download.", file_size)
-                                            break
-                                    except (OSError, FileNotFoundError) as e:
-                                        app.logger.debug("Arquivo não acessível durante verificação: %s", str(e))
-                                        final_mp4_files = []  # Reset para continuar procurando
-                                        continue
-                                
-                                # Log periódico
-                                elapsed = int(time.time() - wait_start)
-                                if elapsed - last_log_time >= 10:
-                                    app.logger.debug("Monitorando download (%ds, %d arquivos temporários)", 
-                                                     elapsed, len(all_files))
-                                    last_log_time = elapsed
-                            except Exception as e:
-                                app.logger.error("Erro ao monitorar diretório: %s", str(e))
+                    file_size = os.path.getsize(downloaded_file)
+                    app.logger.info("Arquivo final: %s (%d bytes)", downloaded_file, file_size)
                     
-                        # Aguardar thread terminar ou timeout
-                        if not download_complete.wait(timeout=30):
-                            app.logger.warning("Thread de download não completou em 30 segundos após arquivo detectado")
-                        
-                        if download_error[0]:
-                            raise download_error[0]
-                        
-                        app.logger.info("Download e monitoramento concluídos")
-                        
-                        # Encontrar o arquivo baixado
-                        app.logger.info("Listando arquivos finais em %s", tmpdir)
-                        all_files = os.listdir(tmpdir)
-                        app.logger.info("Todos os arquivos encontrados: %s", all_files)
-                        
-                        # Se já encontramos arquivo final durante o monitoramento, usar ele
-                        if final_mp4_files:
-                            downloaded_file = os.path.join(tmpdir, final_mp4_files[0])
-                            if not os.path.exists(downloaded_file):
-                                app.logger.warning("Arquivo encontrado anteriormente não existe mais: %s", downloaded_file)
-                                final_mp4_files = []  # Resetar para procurar novamente
-                            else:
-                                app.logger.info("Usando arquivo final encontrado durante monitoramento: %s", downloaded_file)
-                        
-                        # Se arquivo não existe ou não foi encontrado, procurar novamente
-                        if not final_mp4_files:
-                            # Tentar encontrar agora - primeiro arquivo final, depois .temp.mp4
-                            # Excluir todos os arquivos temporários do yt-dlp (.f*.mp4, .f*.m4a)
-                            final_mp4_files = [
-                                f for f in all_files 
-                                if f.endswith('.mp4') 
-                                and os.path.isfile(os.path.join(tmpdir, f))
-                                and not re.search(r'\.f\d+\.(mp4|m4a)$', f)  # Excluir .f136.mp4, .f137.mp4, etc.
-                                and not f.endswith('.temp.mp4')  # Excluir .temp.mp4 temporariamente
-                            ]
-                            
-                            # Se não encontrou arquivo final, tentar .temp.mp4
-                            if not final_mp4_files:
-                                temp_files = [
-                                    f for f in all_files 
-                                    if f.endswith('.temp.mp4') 
-                                    and os.path.isfile(os.path.join(tmpdir, f))
-                                ]
-                                if temp_files:
-                                    temp_file_path = os.path.join(tmpdir, temp_files[0])
-                                    temp_size = os.path.getsize(temp_file_path)
-                                    app.logger.info("Usando arquivo .temp.mp4 como final: %s (%d bytes)", temp_files[0], temp_size)
-                                    final_mp4_files = temp_files
-                            
-                            if final_mp4_files:
-                                downloaded_file = os.path.join(tmpdir, final_mp4_files[0])
-                                app.logger.info("Arquivo final encontrado após download: %s", downloaded_file)
-                            else:
-                                # Fallback: procurar todos os arquivos de vídeo/áudio (excluindo temporários)
-                                downloaded_files = [f for f in all_files 
-                                                   if os.path.isfile(os.path.join(tmpdir, f)) 
-                                                   and f.endswith(('.mp4', '.webm', '.mkv', '.m4a'))
-                                                   and not re.search(r'\.f\d+\.(mp4|m4a)$', f)  # Excluir .f*.mp4, .f*.m4a
-                                                   and not f.endswith('.temp.mp4')]  # Excluir .temp.mp4 também no fallback
-                                app.logger.info("Arquivos de vídeo/áudio filtrados: %s", downloaded_files)
-                                
-                                if not downloaded_files:
-                                    app.logger.warning("Nenhum arquivo baixado encontrado em %s. Arquivos totais: %s", tmpdir, all_files)
-                                    continue
-                                
-                                # Priorizar arquivos MP4
-                                mp4_files = [f for f in downloaded_files if f.endswith('.mp4')]
-                                downloaded_file = os.path.join(tmpdir, mp4_files[0] if mp4_files else downloaded_files[0])
-                                app.logger.info("Arquivo selecionado para leitura: %s", downloaded_file)
-                        
-                        # Ler o arquivo para o buffer
-                        file_size = os.path.getsize(downloaded_file)
-                        app.logger.info("Tamanho do arquivo: %d bytes", file_size)
-                        
-                        with open(downloaded_file, 'rb') as f:
-                            buffer.write(f.read())
-                        
-                        buffer.seek(0)
-                        buffer_size = buffer.getbuffer().nbytes
-                        app.logger.info("Download concluído com yt-dlp: %s (buffer: %d bytes, arquivo: %d bytes)", 
-                                      filename, buffer_size, file_size)
-                        
-                        if buffer_size == 0:
-                            app.logger.error("Buffer vazio após leitura do arquivo!")
-                            continue
-                            
-                        app.logger.info("Download bem-sucedido com yt-dlp: %s", filename)
-                        return True, buffer, filename, None
+                    if file_size == 0:
+                        app.logger.error("Arquivo vazio após download!")
+                        continue
+                    
+                    # Publicar no cache em disco (move o arquivo para o cache); sem cache,
+                    # o arquivo sai do TemporaryDirectory para um diretório do próprio artefato
+                    cached = video_cache.store(video_id, quality, info.get('format_id'), downloaded_file, filename)
+                    if cached:
+                        artifact = DownloadArtifact(cached.path, filename)
+                    else:
+                        artifact = DownloadArtifact.adopt(downloaded_file, filename)
+                    
+                    cookie_pool.report(cookies_file)
+                    app.logger.info("Download bem-sucedido com yt-dlp: %s (%d bytes)", filename, file_size)
+                    return True, artifact, filename, None
 
+        except RateLimited as exc:
+            app.logger.warning("Download de %s adiado pelo limitador de saída: %s", video_id, exc)
+            return False, None, None, str(exc)
         except Exception as exc:  # pylint: disable=broad-except
             error_msg = str(exc)
+            last_error = exc
             app.logger.warning("Erro ao baixar com yt-dlp (%s): %s", video_url, error_msg)
-            import traceback
-            app.logger.debug(traceback.format_exc())
+            
+            if merge_slot['held']:
+                download_scheduler.release_merge_slot()
+                merge_slot['held'] = False
+            
+            # info_dict em cache pode estar inválido (ex.: URL assinada recusada)
+            info_cache.delete(video_id)
+            app.logger.debug("Detalhes do erro do yt-dlp (%s)", video_url, exc_info=True)
             
             # Verificar se é erro de bloqueio do YouTube (bot detection)
             if is_bot_detection_error(error_msg):
                 app.logger.error("YouTube bloqueou a requisição (detecção de bot) para vídeo: %s", video_id)
+                cookie_pool.report(cookies_file, error_msg, blocked=True)
+                if cookie_pool.available_count():
+                    # Outra identidade do pool ainda não bloqueada
+                    cookies_file = get_cookies_file_path()
+                    continue
                 
                 # Se não há cookies configurados, adicionar aviso específico
                 if not cookies_file:
@@ -967,15 +1330,14 @@ def download_with_ytdlp(video_id: str, quality=None, progress_callback=None):
                         "Configure YOUTUBE_COOKIES_CONTENT no Railway para resolver. "
                         "Veja GUIA_COOKIES.md para instruções."
                     )
-                
-                # Continuar para próxima URL
-                continue
+                # As estratégias de extração já foram tentadas; repetir só agravaria o bloqueio
+                break
             
-            # Para outros erros, também continuar tentando
+            # Para outros erros, tentar novamente com uma extração nova
             continue
     
-    # Se chegou aqui, todas as URLs falharam
-    app.logger.error("Todas as URLs falharam para o vídeo: %s", video_id)
+    # Se chegou aqui, todas as tentativas falharam
+    app.logger.error("Todas as tentativas falharam para o vídeo: %s", video_id)
     
     # Mensagem de erro mais informativa baseada na presença de cookies
     if not cookies_file:
@@ -991,49 +1353,321 @@ def download_with_ytdlp(video_id: str, quality=None, progress_callback=None):
             "Tente novamente em alguns minutos."
         )
     
-    return False, None, None, error_message
+    return False, None, None, DownloadFailure(error_message, last_error)
+
+
+def queue_full_response(exc: QueueFullError):
+    """
+    Resposta imediata quando a fila de downloads está cheia:
+    429 se o limite é do usuário, 503 se é global, sempre com Retry-After.
+    """
+    response = jsonify({
+        "error": "Muitos downloads em andamento",
+        "message": f"Tente novamente em {exc.retry_after} segundos.",
+        "code": "DOWNLOAD_QUEUE_FULL",
+        "retry_after": exc.retry_after,
+    })
+    response.status_code = 429 if exc.per_user else 503
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+def client_ip():
+    """
+    IP do cliente. Atrás de proxies (Railway), usa o endereço adicionado pelo
+    último proxy confiável em X-Forwarded-For; os anteriores vêm do cliente e
+    podem ser forjados.
+    """
+    forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.remote_addr
+
+
+def rate_limited_response(exc: RateLimited):
+    """Resposta 429 com Retry-After para limites de ritmo e cotas diárias."""
+    response = jsonify({
+        "error": "Limite de uso atingido",
+        "message": str(exc),
+        "code": exc.code,
+        "retry_after": exc.retry_after,
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+def meter_response(response, user_id: str):
+    """Soma os bytes da resposta à cota diária do usuário (contados ao enviar, se for streaming)."""
+    if response.content_length is not None:
+        inbound_limiter.record_bytes(user_id, response.content_length)
+        return
+    iterable = response.response
+    
+    def counting():
+        sent = 0
+        try:
+            for chunk in iterable:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            inbound_limiter.record_bytes(user_id, sent)
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    
+    response.response = counting()
+
+
+def inbound_limited(download_cost=1):
+    """
+    Aplica o inbound_limiter ao endpoint: ritmo por usuário e por IP, cotas
+    diárias (downloads e bytes) e cabeçalhos X-Quota-* na resposta.
+    
+    Args:
+        download_cost: quantos downloads a requisição conta na cota (0 para
+                       endpoints que entregam algo já contado, ex.: arquivo de
+                       um job) ou função sem argumentos que calcula o valor a
+                       partir da requisição. Requisições com progress=true (SSE)
+                       não contam: o arquivo é buscado depois em outra requisição.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = user_id_from_request(allow_query_token=True)
+            counted = download_cost() if callable(download_cost) else download_cost
+            if request.args.get('progress', 'false').lower() == 'true':
+                counted = 0
+            try:
+                quota = inbound_limiter.check(user_id, client_ip(), downloads=counted)
+            except RateLimited as exc:
+                app.logger.info("Requisição limitada (%s) para usuário %s", exc.code, user_id)
+                return rate_limited_response(exc)
+            
+            response = make_response(view(*args, **kwargs))
+            if response.status_code >= 400:
+                inbound_limiter.refund_downloads(user_id, counted)
+            elif user_id:
+                meter_response(response, user_id)
+            response.headers.update(InboundLimiter.quota_headers(quota))
+            return response
+        return wrapper
+    return decorator
+
+
+def download_flight_key(video_id: str, quality=None) -> str:
+    """Chave de coalescência dos downloads (download_flights) de um vídeo e qualidade."""
+    return f"{video_id}:{quality or 'best'}"
+
+
+def start_shared_download(video_id: str, quality=None, progress_callback=None, user_key=None,
+                          priority: str = INTERACTIVE) -> Flight:
+    """
+    Inicia (sem bloquear) o download via yt-dlp com coalescência e agendamento.
+    
+    - Cache em disco é consultado antes de entrar na fila (acerto não espera)
+    - Requisições simultâneas do mesmo (videoId, qualidade) compartilham um único
+      fetch/merge, seus eventos de progresso e o resultado; em outros workers,
+      quem espera o lock encontra o vídeo já publicado no cache em disco
+    - O trabalho do líder roda no download_scheduler (concorrência limitada,
+      fila justa por usuário, posição na fila enviada como status 'queued')
+    
+    Raises:
+        QueueFullError: fila cheia (a requisição deve ser recusada com Retry-After)
+    
+    Returns:
+        Flight cujo resultado é (success, artifact, filename, error_message)
+    """
+    key = download_flight_key(video_id, quality)
+    
+    cached = video_cache.lookup(video_id, quality)
+    if cached:
+        app.logger.info("Vídeo servido do cache: %s (formato %s)", video_id, cached.format_id)
+        if progress_callback:
+            progress_callback({'status': 'processing', 'percent': 100, 'message': 'Vídeo encontrado no cache'})
+        return Flight.resolved(key, (True, DownloadArtifact(cached.path, cached.filename), cached.filename, None))
+    
+    def share(result):
+        # Cada participante recebe sua própria referência ao artefato
+        success, artifact = result[0], result[1]
+        if success and artifact is not None:
+            artifact.retain()
+    
+    def runner(execute, flight):
+        def on_position(position):
+            if position:
+                flight.publish({'status': 'queued', 'percent': 0, 'queue_position': position})
+            else:
+                flight.publish({'status': 'starting', 'percent': 0, 'queue_position': 0})
+        
+        download_scheduler.submit(execute, user_key=user_key, on_position=on_position)
+    
+    return download_flights.start(
+        key,
+        lambda publish: download_with_ytdlp(video_id, quality, publish, priority),
+        progress_callback=progress_callback,
+        share=share,
+        runner=runner,
+    )
+
+
+def download_with_ytdlp_shared(video_id: str, quality=None, progress_callback=None, user_key=None,
+                               priority: str = INTERACTIVE):
+    """
+    Versão bloqueante de start_shared_download.
+    Retorna (success, artifact, filename, error_message), como download_with_ytdlp.
+    
+    Raises:
+        QueueFullError: fila de downloads cheia
+    """
+    return start_shared_download(video_id, quality, progress_callback, user_key, priority).wait()
+
+
+def resolve_download_info(video_id: str, quality=None, cookies_file=None):
+    """
+    Resolve, sem baixar, os formatos que download_with_ytdlp usaria para a
+    qualidade pedida (mesmo seletor), reaproveitando o info_dict em cache.
+    
+    Returns:
+        info_dict processado (com 'requested_formats' quando há merge) ou None
+    """
+    info, _, error_msg = get_video_info(video_id, cookies_file)
+    if not info:
+        app.logger.warning("Não foi possível resolver formatos de %s: %s", video_id, error_msg)
+        return None
+    ydl_opts = get_ydl_opts_base(format_selector=get_format_selector(quality), cookies_file=cookies_file,
+                                 quiet=True)
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.process_ie_result(info, download=False)
+
+
+def needs_direct_stream(video_id: str, quality, info: dict) -> bool:
+    """
+    O envio direto não passa pelo cache em disco nem pela coalescência: cada
+    requisição busca o vídeo inteiro na origem. Só vale quando o download
+    compartilhado não ajudaria, ou seja, o cache está desativado ou o vídeo
+    não cabe nele (e não há download do mesmo vídeo em andamento).
+    """
+    if download_flights.in_flight(download_flight_key(video_id, quality)):
+        return False
+    if not video_cache.enabled:
+        return True
+    expected = expected_download_size(info)['total_expected_bytes']
+    return expected > video_cache.max_bytes
+
+
+def stream_video_direct(video_id: str, quality=None, user_key=None):
+    """
+    Envia o vídeo ao cliente enquanto ele é obtido da origem, sem arquivo
+    temporário; o primeiro byte sai em vez de esperar o download inteiro.
+    Só é usado quando needs_direct_stream(): fora isso, o download
+    compartilhado (single-flight, agendador e cache em disco) atende melhor.
+    
+    - Formato progressivo (H.264+AAC no mesmo arquivo): repasse direto dos
+      bytes da origem, com Range do cliente repassado à origem
+    - Par DASH (vídeo e áudio separados): o ffmpeg lê os dois componentes e
+      gera um MP4 fragmentado no stdout, enviado na resposta (sem Range); o
+      mux ocupa um worker do download_scheduler durante todo o envio
+    
+    Returns:
+        Resposta Flask ou None se for preciso usar o caminho com download e
+        merge em disco (ex.: vídeo cabe no cache, protocolo não suportado,
+        origem recusou, ffmpeg ausente ou todos os slots de mux em uso)
+    """
+    try:
+        # Mesma identidade do pool na extração e na busca dos bytes (URLs assinadas para ela)
+        cookies_file = get_cookies_file_path()
+        info = resolve_download_info(video_id, quality, cookies_file)
+        if not info or not needs_direct_stream(video_id, quality, info):
+            return None
+        fmt = select_progressive_format(info)
+        if fmt and PASSTHROUGH_ENABLED and REQUESTS_AVAILABLE:
+            outbound_limiter.acquire(cookie_identity(cookies_file))
+            upstream = open_upstream(fmt, request.headers.get('Range'))
+            filename = f"{slugify(info.get('title', 'video'))}.{fmt['ext']}"
+            app.logger.info("Repassando formato progressivo %s de %s direto ao cliente", fmt['format_id'], video_id)
+            return proxy_response(upstream, filename)
+        
+        pair = select_dash_pair(info)
+        if pair and FMP4_STREAMING_ENABLED:
+            return stream_dash_pair(video_id, info, *pair, cookies_file=cookies_file, user_key=user_key)
+    except (PassthroughError, MuxError) as exc:
+        # URL assinada do info_dict em cache pode ter sido recusada
+        app.logger.warning("Envio direto recusado para %s: %s", video_id, exc)
+        info_cache.delete(video_id)
+    except Exception as exc:  # pylint: disable=broad-except
+        app.logger.warning("Envio direto indisponível para %s: %s", video_id, exc)
+    return None
+
+
+def stream_dash_pair(video_id: str, info: dict, video: dict, audio: dict, cookies_file=None, user_key=None):
+    """
+    Mux em streaming de um par DASH; None se não houver ffmpeg ou slot livre.
+    
+    O processo do ffmpeg só começa quando o download_scheduler libera um
+    worker (mesma fila justa e concorrência dos downloads), que fica ocupado
+    até a resposta terminar; FMP4_MAX_STREAMS limita os processos do worker.
+    O slot de mux só é tomado depois da admissão, para não ficar preso na fila.
+    
+    Raises:
+        QueueFullError: fila de downloads cheia
+    """
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        return None
+    release_worker = download_scheduler.reserve(user_key=user_key)
+    if not fmp4_stream_slots.acquire(blocking=False):
+        release_worker()
+        app.logger.info("Todos os slots de mux em streaming ocupados; usando merge em disco para %s", video_id)
+        return None
+    
+    def release():
+        fmp4_stream_slots.release()
+        release_worker()
+    
+    try:
+        # O ffmpeg abre duas conexões com a origem (vídeo e áudio): dois tokens
+        outbound_limiter.acquire(cookie_identity(cookies_file), cost=2)
+        stream = FragmentedMP4Stream(build_mux_command(ffmpeg, video, audio)).start()
+    except Exception:
+        release()
+        raise
+    
+    filename = f"{slugify(info.get('title', 'video'))}.mp4"
+    app.logger.info("Mux em streaming de %s (%s+%s)", video_id, video.get('format_id'), audio.get('format_id'))
+    return mux_response(stream, filename, on_close=release)
 
 
 def download_with_pytube(video_id: str):
     """
     Tenta baixar o vídeo usando pytube (FALLBACK).
-    Retorna (success, buffer, filename, error_message)
+    Retorna (success, artifact, filename, error_message)
     """
     if not PYTUBE_AVAILABLE:
         return False, None, None, "pytube não está instalado"
 
-    candidate_urls = [
-        f"https://www.youtube.com/watch?v={video_id}",
-        f"https://www.youtube.com/shorts/{video_id}",
-        f"https://youtu.be/{video_id}",
-    ]
-
-    yt = None
-    last_error = None
-
-    for candidate_url in candidate_urls:
-        app.logger.info("Tentando inicializar pytube com URL: %s", candidate_url)
-        try:
-            yt = YouTube(candidate_url, use_oauth=False, allow_oauth_cache=False)
-            video_url = candidate_url
-            break
-        except VideoUnavailable as exc:
-            last_error = exc
-            app.logger.warning("Video indisponivel para URL %s: %s", candidate_url, exc)
-        except HTTPError as http_err:
-            last_error = http_err
-            app.logger.warning("HTTPError ao inicializar pytube com URL %s: %s", candidate_url, http_err)
-        except PytubeError as exc:
-            last_error = exc
-            app.logger.warning("PytubeError ao inicializar pytube com URL %s: %s", candidate_url, exc)
-
-    if yt is None:
+    def pytube_strategy(candidate_url):
+        def init(cancel):
+            if cancel.is_set():
+                raise RuntimeError("Inicialização cancelada")
+            app.logger.info("Tentando inicializar pytube com URL: %s", candidate_url)
+            return YouTube(candidate_url, use_oauth=False, allow_oauth_cache=False), candidate_url
+        return init
+
+    # Variações de URL com partidas escalonadas, como na extração do yt-dlp
+    strategies = [Strategy(f"pytube:{label}", pytube_strategy(candidate_url), group='pytube')
+                  for label, candidate_url in zip(('watch', 'shorts', 'youtu.be'), youtube_candidate_urls(video_id))]
+    try:
+        (yt, video_url), _ = extraction_resolver.resolve('pytube', strategies, client_error=is_client_error)
+    except AllStrategiesFailed as exc:
+        for name, error in exc.errors.items():
+            app.logger.warning("Erro ao inicializar pytube (%s): %s", name, error)
+        last_error = exc.last_error
         error_msg = "Não foi possível inicializar pytube para este vídeo"
         if isinstance(last_error, VideoUnavailable):
             error_msg = "O vídeo está bloqueado ou não pode ser reproduzido"
         elif isinstance(last_error, HTTPError):
             error_msg = "YouTube retornou erro ao tentar acessar o vídeo"
-        return False, None, None, error_msg
+        return False, None, None, DownloadFailure(error_msg, last_error)
 
     app.logger.info("Iniciando download via pytube: %s", video_url)
 
@@ -1066,18 +1700,25 @@ def download_with_pytube(video_id: str):
         return False, None, None, "Nenhum stream compatível encontrado para este vídeo"
 
     try:
-        buffer = BytesIO()
-        stream.stream_to_buffer(buffer)
-        buffer.seek(0)
+        outbound_limiter.acquire()
+    except RateLimited as exc:
+        return False, None, None, str(exc)
+
+    tmpdir = tempfile.mkdtemp(prefix='yt_pytube_')
+    try:
         filename = f"{slugify(yt.title)}.mp4"
+        file_path = stream.download(output_path=tmpdir, filename=filename)
         app.logger.info("Download concluído com pytube: %s", filename)
-        return True, buffer, filename, None
+        return True, DownloadArtifact(file_path, filename, cleanup_dir=tmpdir), filename, None
     except Exception as exc:  # pylint: disable=broad-except
-        app.logger.exception("Erro ao fazer stream para buffer: %s", exc)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        app.logger.exception("Erro ao gravar stream em disco: %s", exc)
         return False, None, None, f"Erro ao processar stream: {str(exc)}"
 
 
 @app.get("/api/download")
+@login_required(allow_query_token=True)
+@inbound_limited()
 def download_video():
     """
     Endpoint principal chamado pelo frontend quando o usuario clica em
@@ -1094,29 +1735,7 @@ def download_video():
     
     Retorna o binário do vídeo MP4 diretamente ou SSE stream com progresso.
     """
-    # Verificar autenticação
-    try:
-        # Tentar obter token do header Authorization
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-        else:
-            # Tentar obter da query string (para SSE)
-            token = request.args.get('token')
-        
-        if not token:
-            return jsonify({"error": "Faça login para continuar."}), 401
-        
-        # Verificar token
-        from flask_jwt_extended import decode_token
-        decoded = decode_token(token)
-        user_id = decoded.get('sub')
-        if not user_id:
-            return jsonify({"error": "Sessão inválida. Faça login novamente."}), 401
-    except Exception as e:
-        app.logger.error(f"Erro ao verificar autenticação: {str(e)}")
-        return jsonify({"error": "Sessão inválida. Faça login novamente."}), 401
-    
+    user_id = g.user_id
     video_id = request.args.get("videoId")
     quality = request.args.get("quality", "best")
     use_progress = request.args.get("progress", "false").lower() == "true"
@@ -1126,58 +1745,82 @@ def download_video():
 
     # Se progresso está habilitado, usar Server-Sent Events (SSE)
     if use_progress:
-        return download_with_progress(video_id, quality)
+        return download_with_progress(video_id, quality, user_id)
 
-    # Verificar se já existe um download concluído em cache (do fluxo de progresso)
-    cached_download = download_progress.get(video_id)
-    if cached_download and cached_download.get('buffer_ready') and cached_download.get('buffer'):
-        app.logger.info("Usando download em cache para vídeo: %s", video_id)
-        buffer = cached_download['buffer']
-        buffer.seek(0)
-        filename = cached_download['filename']
-        
-        # Limpar cache após uso (opcional, mas bom para memória)
-        # del download_progress[video_id] 
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="video/mp4"
-        )
+    # Verificar se já existe um download concluído deste usuário (do fluxo de
+    # progresso). O job guarda apenas o caminho do arquivo, válido até o job
+    # expirar; downloads de outros usuários vêm do cache em disco (video_cache).
+    job = job_store.latest_for_video(video_id, quality, user_id=user_id)
+    artifact = job_store.open_artifact(job)
+    if artifact:
+        app.logger.info("Usando download concluído do job %s para vídeo: %s", job['id'], video_id)
+        return send_artifact(artifact)
 
     # Download normal sem progresso
-    # TENTATIVA 1: yt-dlp (PRIMEIRA PRIORIDADE)
+    # Vídeo já no cache em disco não depende do YouTube: ignora os circuitos
+    cached = video_cache.lookup(video_id, quality, record_stats=False)
+    
+    # TENTATIVA 1: yt-dlp (PRIMEIRA PRIORIDADE), a menos que o circuito esteja aberto
     yt_dlp_error = None
-    if YT_DLP_AVAILABLE:
+    yt_dlp_skipped = False
+    if YT_DLP_AVAILABLE and (cached or extractor_health.allow('download:yt-dlp')):
+        started = time.monotonic()
+        # Fora do cache e sem como guardar/compartilhar o download (needs_direct_stream):
+        # enviar enquanto baixa (progressivo ou mux de DASH), sem esperar o download
+        direct_enabled = (PASSTHROUGH_ENABLED and REQUESTS_AVAILABLE) or FMP4_STREAMING_ENABLED
+        if direct_enabled and not cached:
+            response = stream_video_direct(video_id, quality, user_key=user_id)
+            if response is not None:
+                extractor_health.record('download:yt-dlp', True, time.monotonic() - started)
+                return response
+        
         app.logger.info("Tentando download com yt-dlp (método prioritário) para vídeo: %s (qualidade: %s)", video_id, quality)
-        success, buffer, filename, error_msg = download_with_ytdlp(video_id, quality)
+        try:
+            success, artifact, filename, error_msg = download_with_ytdlp_shared(video_id, quality, user_key=user_id)
+        except QueueFullError as exc:
+            if not cached:
+                # Este pedido pode ser o probe do circuito half-open: não testou o backend
+                extractor_health.release_probe('download:yt-dlp')
+            return queue_full_response(exc)
         
+        if not cached:
+            record_download_health('download:yt-dlp', success, started, error_msg)
         if success:
-            return send_file(
-                buffer,
-                as_attachment=True,
-                download_name=filename,
-                mimetype="video/mp4"
-            )
+            return send_artifact(artifact)
         else:
             yt_dlp_error = error_msg
             app.logger.warning("yt-dlp falhou: %s. Tentando pytube como fallback...", error_msg)
+    elif YT_DLP_AVAILABLE:
+        yt_dlp_skipped = True
+        yt_dlp_error = str(extractor_health.open_error('download:yt-dlp'))
+        app.logger.warning("yt-dlp pulado: %s. Usando pytube...", yt_dlp_error)
     else:
         app.logger.warning("yt-dlp não disponível. Usando pytube...")
 
-    # TENTATIVA 2: pytube (FALLBACK)
+    # TENTATIVA 2: pytube (FALLBACK), a menos que o circuito esteja aberto
+    skipped = ['download:yt-dlp'] if yt_dlp_skipped else []
+    if PYTUBE_AVAILABLE and not extractor_health.allow('download:pytube'):
+        app.logger.warning("pytube pulado: %s", extractor_health.open_error('download:pytube'))
+        skipped.append('download:pytube')
+    if skipped and (not PYTUBE_AVAILABLE or 'download:pytube' in skipped):
+        # Nenhum backend liberado: falhar na hora em vez de esperar um timeout certo
+        retry_after = min(max(1, extractor_health.retry_after(key)) for key in skipped)
+        response = jsonify({
+            "error": "Serviço temporariamente indisponível",
+            "message": "O YouTube bloqueou temporariamente as requisições. Tente novamente em alguns minutos."
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    
     if PYTUBE_AVAILABLE:
         app.logger.info("Tentando download com pytube (fallback) para vídeo: %s", video_id)
-        success, buffer, filename, error_msg = download_with_pytube(video_id)
+        started = time.monotonic()
+        success, artifact, filename, error_msg = download_with_pytube(video_id)
+        record_download_health('download:pytube', success, started, error_msg)
         
         if success:
-            return send_file(
-                buffer,
-                as_attachment=True,
-                download_name=filename,
-                mimetype="video/mp4"
-            )
+            return send_artifact(artifact)
         else:
             app.logger.error("pytube também falhou: %s", error_msg)
             
@@ -1215,154 +1858,117 @@ def download_video():
     }), 503  # Mudar de 500 para 503 (Service Unavailable)
 
 
-# Armazenamento temporário de progresso (em produção, usar Redis ou similar)
-download_progress = {}
-
 @app.get("/api/download/progress")
 def get_download_progress():
     """
     Endpoint para obter progresso do download via polling.
+    Aceita jobId (job específico) ou videoId (job mais recente do vídeo).
     """
+    job_id = request.args.get("jobId")
     video_id = request.args.get("videoId")
-    if not video_id:
+    if not job_id and not video_id:
         return jsonify({"error": "ID do video nao fornecido"}), 400
     
-    progress = download_progress.get(video_id, {'status': 'not_started'})
-    return jsonify(progress)
+    job = job_store.get(job_id) if job_id else job_store.latest_for_video(video_id)
+    return jsonify(JobStore.public_dict(job))
 
 
-def download_with_progress(video_id: str, quality: str):
+def run_download_job(job_id: str, video_id: str, quality: str, user_key: str = None, on_event=None) -> Flight:
+    """
+    Executa o download de um job em segundo plano (download_scheduler),
+    registrando progresso e resultado no job_store. Retorna sem esperar.
+    
+    Args:
+        on_event: Recebe também cada evento de progresso (ex.: para um stream SSE)
+    
+    Raises:
+        QueueFullError: fila cheia (o job é marcado como erro)
+    """
+    def register_result(flight):
+        # Registrar o artefato mesmo que o cliente já tenha desconectado
+        if flight.error is not None:
+            job_store.fail(job_id, 'Não foi possível concluir o download. Tente novamente.')
+            return
+        success, artifact, filename, error_msg = flight.result
+        if success:
+            app.logger.info("Download bem-sucedido. Registrando artefato no job %s (vídeo %s)", job_id, video_id)
+            # Guardar apenas a referência ao arquivo em disco (não o conteúdo);
+            # servido enquanto o job não expirar
+            job_store.complete(job_id, artifact)
+        else:
+            app.logger.error("Download falhou: %s", error_msg)
+            job_store.fail(job_id, error_msg)
+    
+    def progress_callback(data):
+        # Chamado na thread do download, antes de register_result
+        job_store.update_progress(job_id, data)
+        if on_event:
+            on_event(data)
+    
+    try:
+        flight = start_shared_download(video_id, quality, progress_callback, user_key)
+    except QueueFullError as exc:
+        job_store.fail(job_id, str(exc))
+        raise
+    
+    flight.add_done_callback(register_result)
+    return flight
+
+
+def download_with_progress(video_id: str, quality: str, user_key: str = None):
     """
     Download com progresso usando Server-Sent Events (SSE).
     Envia apenas progresso via SSE. O arquivo será baixado via endpoint normal após conclusão.
+    
+    O download roda no download_scheduler (sem thread por requisição) e a posição
+    na fila é enviada como status 'queued'. Com a fila cheia, responde na hora
+    com 429/503 e Retry-After em vez de abrir o stream.
+    
+    Prefira a API de jobs (POST /api/jobs), que não prende o worker durante o download.
+    No modo ASGI (asgi.py) este stream é atendido por um handler assíncrono.
     """
+    progress_queue = queue.Queue()
+    job = job_store.create(video_id, quality, user_key)
+    job_id = job['id']
+    
+    try:
+        flight = run_download_job(job_id, video_id, quality, user_key, on_event=progress_queue.put)
+    except QueueFullError as exc:
+        return queue_full_response(exc)
+    
     def generate():
-        # Verificar autenticação via token na query string (para SSE)
-        token = request.args.get('token')
-        if token:
-            try:
-                from flask_jwt_extended import decode_token
-                decoded = decode_token(token)
-                user_id = decoded.get('sub')
-                if not user_id:
-                    yield f"data: {json.dumps({'status': 'error', 'error': 'Sessão expirada. Faça login novamente.'})}\n\n"
-                    return
-            except Exception as e:
-                app.logger.error(f"Erro ao verificar token SSE: {str(e)}")
-                yield f"data: {json.dumps({'status': 'error', 'error': 'Sessão expirada. Faça login novamente.'})}\n\n"
-                return
-        else:
-            # Tentar verificar via header Authorization (fallback)
-            auth_header = request.headers.get('Authorization')
-            if not auth_header or not auth_header.startswith('Bearer '):
-                yield f"data: {json.dumps({'status': 'error', 'error': 'Faça login para continuar.'})}\n\n"
-                return
-            try:
-                from flask_jwt_extended import decode_token
-                token = auth_header.split(' ')[1]
-                decoded = decode_token(token)
-                user_id = decoded.get('sub')
-                if not user_id:
-                    yield f"data: {json.dumps({'status': 'error', 'error': 'Sessão expirada. Faça login novamente.'})}\n\n"
-                    return
-            except Exception as e:
-                app.logger.error(f"Erro ao verificar token SSE: {str(e)}")
-                yield f"data: {json.dumps({'status': 'error', 'error': 'Sessão expirada. Faça login novamente.'})}\n\n"
-                return
-        progress_data = {'status': 'starting', 'percent': 0, 'downloaded_mb': 0, 'total_mb': 0, 'speed_mbps': 0}
-        download_progress[video_id] = progress_data
-        
-        def progress_callback(data):
-            progress_data.update(data)
-            download_progress[video_id] = progress_data.copy()
-            # Enviar progresso via SSE
-            return f"data: {json.dumps(progress_data)}\n\n"
-        
+        # Autenticação já feita por download_video (login_required)
         try:
             # Iniciar download
-            yield f"data: {json.dumps({'status': 'starting', 'percent': 0})}\n\n"
-            
-            # Fazer download em thread separada e enviar progresso
-            import queue
-            progress_queue = queue.Queue()
-            
-            def download_thread():
-                try:
-                    app.logger.info("Thread de download iniciada para vídeo %s", video_id)
-                    
-                    def callback(data):
-                        try:
-                            progress_queue.put(data)
-                        except Exception as e:
-                            app.logger.error("Erro ao enviar progresso para queue: %s", str(e))
-                    
-                    app.logger.info("Chamando download_with_ytdlp para vídeo %s", video_id)
-                    success, buffer, filename, error_msg = download_with_ytdlp(video_id, quality, callback)
-                    app.logger.info("download_with_ytdlp retornou: success=%s, filename=%s, error=%s", 
-                                  success, filename, error_msg)
-                    
-                    if success:
-                        app.logger.info("Download bem-sucedido. Salvando buffer no cache para vídeo %s", video_id)
-                        # Salvar buffer temporariamente (em produção, usar Redis ou storage)
-                        download_progress[video_id] = {
-                            'status': 'completed',
-                            'percent': 100,
-                            'filename': filename,
-                            'buffer_ready': True,
-                            'buffer': buffer  # Salvar buffer para download imediato
-                        }
-                        progress_queue.put({'status': 'completed', 'percent': 100, 'filename': filename})
-                        app.logger.info("Status 'completed' enviado para queue. Thread finalizando.")
-                    else:
-                        app.logger.error("Download falhou: %s", error_msg)
-                        progress_queue.put({'status': 'error', 'error': error_msg})
-                except Exception as exc:
-                    app.logger.exception("Exceção na thread de download para vídeo %s", video_id)
-                    # Mensagem genérica - não expor detalhes técnicos
-                    progress_queue.put({'status': 'error', 'error': 'Não foi possível concluir o download. Tente novamente.'})
-            
-            thread = threading.Thread(target=download_thread)
-            thread.start()
+            yield f"data: {json.dumps({'status': 'starting', 'percent': 0, 'job_id': job_id})}\n\n"
             
             # Enviar progresso enquanto download está em andamento
             max_wait_time = 600  # 10 minutos máximo
             start_time = time.time()
             
-            while thread.is_alive():
+            while True:
                 # Verificar timeout
                 if time.time() - start_time > max_wait_time:
                     app.logger.error("Timeout no download para vídeo %s", video_id)
                     yield f"data: {json.dumps({'status': 'error', 'error': 'Timeout: Download demorou muito'})}\n\n"
-                    break
-                    
+                    return
+                
                 try:
                     data = progress_queue.get(timeout=0.5)
-                    app.logger.debug("Enviando progresso via SSE: %s", data.get('status'))
-                    yield f"data: {json.dumps(data)}\n\n"
-                    
-                    # Se recebeu status de completed ou error, sair do loop
-                    if data.get('status') in ('completed', 'error'):
-                        break
                 except queue.Empty:
+                    if flight.done.is_set():
+                        break
                     # Enviar progresso atual como heartbeat
-                    current = download_progress.get(video_id, {})
+                    current = JobStore.public_dict(job_store.get(job_id))
                     if current.get('status') not in ('completed', 'error'):
                         yield f"data: {json.dumps(current)}\n\n"
-                    time.sleep(0.5)
-            
-            # Aguardar thread terminar (com timeout de 10 segundos para garantir)
-            thread.join(timeout=10)
-            
-            if thread.is_alive():
-                app.logger.warning("Thread de download ainda está ativa após timeout para vídeo %s", video_id)
-            
-            # Enviar resultado final - garantir que temos o status correto
-            final_data = download_progress.get(video_id, {})
+                    continue
+                
+                app.logger.debug("Enviando progresso via SSE: %s", data.get('status'))
+                yield f"data: {json.dumps(data)}\n\n"
             
-            # Se não temos status completed mas a thread terminou, verificar buffer
-            if final_data.get('status') != 'completed' and final_data.get('buffer_ready'):
-                final_data['status'] = 'completed'
-                app.logger.info("Buffer está pronto, marcando como completed")
+            # Enviar resultado final (registrado por register_result)
+            final_data = JobStore.public_dict(job_store.get(job_id))
             
             app.logger.info("Enviando status final via SSE: %s, filename=%s", 
                           final_data.get('status'), final_data.get('filename'))
@@ -1371,6 +1977,7 @@ def download_with_progress(video_id: str, quality: str):
             final_event = {
                 'status': final_data.get('status', 'unknown'),
                 'percent': final_data.get('percent', 100),
+                'job_id': job_id,
             }
             if final_data.get('filename'):
                 final_event['filename'] = final_data['filename']
@@ -1379,22 +1986,140 @@ def download_with_progress(video_id: str, quality: str):
             
             yield f"data: {json.dumps(final_event)}\n\n"
             
-            # Aguardar um pouco para garantir que o evento foi enviado
-            time.sleep(0.5)
-            
         except Exception as exc:
             app.logger.exception("Erro no download_with_progress para vídeo %s", video_id)
             # Mensagem genérica - não expor detalhes técnicos
             yield f"data: {json.dumps({'status': 'error', 'error': 'Não foi possível concluir o download. Tente novamente.'})}\n\n"
-        finally:
-            # Manter progresso por 5 minutos para download do arquivo
-            pass
     
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 
+# ==================== ENDPOINTS DE JOBS ====================
+
+# Duração máxima de cada conexão SSE de /api/jobs/<id>/events; o EventSource
+# reconecta sozinho, então o worker nunca fica preso durante todo o download
+JOB_EVENTS_MAX_SECONDS = int(os.environ.get('JOB_EVENTS_MAX_SECONDS', '55'))
+
+
+def get_user_job(job_id: str, user_id: str):
+    """Job do usuário ou None (jobs de outros usuários não são revelados)."""
+    job = job_store.get(job_id)
+    if not job or str(job.get('user_id')) != str(user_id):
+        return None
+    return job
+
+
+@app.post("/api/jobs")
+@login_required()
+@inbound_limited()
+def create_job():
+    """
+    Cria um job de download e retorna imediatamente (202) com o ID.
+    O download roda no download_scheduler, fora das threads de requisição.
+    
+    Corpo JSON:
+    - videoId: ID do vídeo (obrigatório)
+    - quality: format_id ou 'best' (opcional)
+    
+    Acompanhe com GET /api/jobs/<id> (polling) ou /api/jobs/<id>/events (SSE)
+    e baixe o arquivo com GET /api/jobs/<id>/file.
+    """
+    user_id = g.user_id
+    
+    data = request.get_json(silent=True) or {}
+    video_id = data.get('videoId')
+    quality = data.get('quality') or 'best'
+    if not video_id:
+        return jsonify({"error": "ID do video nao fornecido"}), 400
+    if not YT_DLP_AVAILABLE:
+        return jsonify({
+            "error": "Serviço indisponível",
+            "message": "Serviço temporariamente indisponível. Tente novamente mais tarde."
+        }), 503
+    
+    job = job_store.create(video_id, quality, user_id)
+    try:
+        run_download_job(job['id'], video_id, quality, user_id)
+    except QueueFullError as exc:
+        return queue_full_response(exc)
+    
+    app.logger.info("Job %s criado para vídeo %s (qualidade: %s)", job['id'], video_id, quality)
+    response = jsonify(JobStore.public_dict(job_store.get(job['id']) or job))
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job['id']}"
+    return response
+
+
+@app.get("/api/jobs/<job_id>")
+@login_required()
+def get_job(job_id):
+    """Estado e progresso de um job."""
+    user_id = g.user_id
+    
+    job = get_user_job(job_id, user_id)
+    if not job:
+        return jsonify({"error": "Job não encontrado ou expirado"}), 404
+    return jsonify(JobStore.public_dict(job))
+
+
+@app.get("/api/jobs/<job_id>/events")
+@login_required(allow_query_token=True)
+def get_job_events(job_id):
+    """
+    Progresso de um job via Server-Sent Events. Lê o job_store (e não o
+    download em si), então funciona em qualquer worker. Cada conexão dura no
+    máximo JOB_EVENTS_MAX_SECONDS; o cliente reconecta e continua de onde parou.
+    """
+    user_id = g.user_id
+    if not get_user_job(job_id, user_id):
+        return jsonify({"error": "Job não encontrado ou expirado"}), 404
+    
+    def generate():
+        yield "retry: 1000\n\n"
+        started = time.time()
+        last_sent = None
+        while time.time() - started < JOB_EVENTS_MAX_SECONDS:
+            job = job_store.get(job_id)
+            if not job:
+                yield f"data: {json.dumps({'status': 'error', 'error': 'Job expirado', 'job_id': job_id})}\n\n"
+                return
+            data = JobStore.public_dict(job)
+            if job['updated_at'] != last_sent:
+                last_sent = job['updated_at']
+                yield f"data: {json.dumps(data)}\n\n"
+            else:
+                # Heartbeat (comentário SSE) para manter a conexão viva em proxies
+                yield ": heartbeat\n\n"
+            if job['status'] in ('completed', 'error'):
+                return
+            time.sleep(0.5)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get("/api/jobs/<job_id>/file")
+@login_required(allow_query_token=True)
+@inbound_limited(download_cost=0)
+def get_job_file(job_id):
+    """Arquivo do job concluído (aceita Range); disponível até o job expirar."""
+    user_id = g.user_id
+    
+    job = get_user_job(job_id, user_id)
+    if not job:
+        return jsonify({"error": "Job não encontrado ou expirado"}), 404
+    if job['status'] != 'completed':
+        return jsonify({"error": "Download ainda não concluído", "status": job['status']}), 409
+    
+    artifact = job_store.open_artifact(job)
+    if not artifact:
+        return jsonify({"error": "Arquivo não está mais disponível. Crie um novo job."}), 410
+    return send_artifact(artifact)
+
+
 @app.get("/api/download-with-metadata")
-@jwt_required()
+@login_required()
+@inbound_limited()
 def download_with_metadata():
     """
     Endpoint para download de vídeo com opções de metadados.
@@ -1411,23 +2136,7 @@ def download_with_metadata():
     - Se apenas vídeo: arquivo MP4 direto
     - Se tem metadados: arquivo ZIP contendo vídeo + metadata.json
     """
-    # Verificar autenticação
-    try:
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-        else:
-            return jsonify({"error": "Faça login para continuar."}), 401
-        
-        from flask_jwt_extended import decode_token
-        decoded = decode_token(token)
-        user_id = decoded.get('sub')
-        if not user_id:
-            return jsonify({"error": "Sessão inválida. Faça login novamente."}), 401
-    except Exception as e:
-        app.logger.error(f"Erro ao verificar autenticação: {str(e)}")
-        return jsonify({"error": "Sessão inválida. Faça login novamente."}), 401
-    
+    user_id = g.user_id
     video_id = request.args.get("videoId")
     quality = request.args.get("quality", "best")
     save_video = request.args.get("saveVideo", "true").lower() == "true"
@@ -1445,142 +2154,481 @@ def download_with_metadata():
         app.logger.info("Download com metadados: videoId=%s, saveVideo=%s, saveDescription=%s, saveLinks=%s", 
                        video_id, save_video, save_description, save_links)
         
-        # URLs candidatas para o vídeo
-        candidate_urls = [
-            f"https://www.youtube.com/watch?v={video_id}",
-            f"https://www.youtube.com/shorts/{video_id}",
-            f"https://youtu.be/{video_id}",
-        ]
-        
-        video_info = None
-        video_url = None
-        video_buffer = None
+        video_artifact = None
         video_filename = None
         
-        # Obter informações do vídeo (sempre necessário para metadados)
-        # Obter cookies de variável de ambiente se disponível
+        # Obter informações do vídeo (sempre necessário para metadados), via cache
         cookies_file = get_cookies_file_path()
-        
-        for url in candidate_urls:
-            try:
-                # Usar configurações otimizadas para evitar detecção de bot
-                info_opts = get_ydl_opts_base(cookies_file=cookies_file, quiet=True)
-                with yt_dlp.YoutubeDL(info_opts) as ydl:
-                    # Obter informações do vídeo
-                    video_info = ydl.extract_info(url, download=False)
-                    
-                    if video_info:
-                        video_url = url
-                        break
-            except Exception as e:
-                app.logger.debug("Tentativa falhou para %s: %s", url, str(e))
-                continue
+        video_info, video_url, _ = get_video_info(video_id, cookies_file)
         
         if not video_info:
             return jsonify({"error": "Não foi possível obter informações do vídeo"}), 404
         
-        # Baixar o vídeo se solicitado
+        # Baixar o vídeo se solicitado (cache em disco e info_dict em cache são
+        # reaproveitados por download_with_ytdlp)
         if save_video:
-            format_selector = get_format_selector(quality)
-            # Obter cookies de variável de ambiente se disponível
-            cookies_file = get_cookies_file_path()
-            
-            # Usar configurações otimizadas para evitar detecção de bot
-            ydl_opts = get_ydl_opts_base(format_selector=format_selector, cookies_file=cookies_file, quiet=True)
-            
-            with tempfile.TemporaryDirectory() as tmpdir:
-                ydl_opts['outtmpl'] = os.path.join(tmpdir, '%(title)s.%(ext)s')
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([video_url])
-                    
-                    # Encontrar arquivo baixado
-                    all_files = os.listdir(tmpdir)
-                    final_files = [
-                        f for f in all_files 
-                        if f.endswith('.mp4') 
-                        and os.path.isfile(os.path.join(tmpdir, f))
-                        and not re.search(r'\.f\d+\.(mp4|m4a)$', f)
-                        and not f.endswith('.temp.mp4')
-                    ]
-                    
-                    if final_files:
-                        downloaded_file = os.path.join(tmpdir, final_files[0])
-                        video_buffer = BytesIO()
-                        with open(downloaded_file, 'rb') as f:
-                            video_buffer.write(f.read())
-                        video_buffer.seek(0)
-                        video_filename = slugify(video_info.get('title', 'video')) + '.mp4'
-                    else:
-                        # Fallback: procurar qualquer arquivo MP4
-                        mp4_files = [f for f in all_files if f.endswith('.mp4')]
-                        if mp4_files:
-                            downloaded_file = os.path.join(tmpdir, mp4_files[0])
-                            video_buffer = BytesIO()
-                            with open(downloaded_file, 'rb') as f:
-                                video_buffer.write(f.read())
-                            video_buffer.seek(0)
-                            video_filename = slugify(video_info.get('title', 'video')) + '.mp4'
+            try:
+                success, video_artifact, video_filename, error_msg = download_with_ytdlp_shared(
+                    video_id, quality, user_key=user_id
+                )
+            except QueueFullError as exc:
+                return queue_full_response(exc)
+            if not success:
+                app.logger.warning("Falha ao baixar vídeo com metadados (%s): %s", video_id, error_msg)
+                video_artifact = None
         
         # Se não baixou vídeo e não quer metadados, retornar erro
         if not save_video and not save_description and not save_links:
             return jsonify({"error": "Nenhuma opção de salvamento selecionada"}), 400
         
-        # Preparar metadados
-        metadata = {
-            'title': video_info.get('title', ''),
-            'channel': video_info.get('channel', ''),
-            'published_at': video_info.get('upload_date', ''),
-            'description': '',
-            'links': []
-        }
-        
-        # Extrair descrição se solicitado
-        if save_description:
-            metadata['description'] = video_info.get('description', '')
-        
-        # Extrair links se solicitado
-        if save_links and metadata.get('description'):
-            links = extract_product_links(metadata['description'], link_filter)
-            metadata['links'] = links
+        # Preparar metadados (descrição e links conforme solicitado)
+        metadata = build_video_metadata(video_info, save_description, save_links, link_filter)
         
         # Criar pacote (ZIP se tem metadados, vídeo direto caso contrário)
         if save_description or save_links:
-            # Criar ZIP com vídeo (se disponível) e metadados
-            package_buffer = create_video_package(
-                video_buffer if (save_video and video_buffer) else BytesIO(),
+            # Criar ZIP com vídeo (se disponível) e metadados, enviado em streaming
+            package_stream = create_video_package(
+                video_artifact if save_video else None,
                 video_filename or 'video.mp4',
                 metadata,
-                save_video and video_buffer is not None,
+                save_video and video_artifact is not None,
                 save_description,
                 save_links
             )
             
             package_filename = slugify(video_info.get('title', 'video')) + '.zip'
             
-            return send_file(
-                package_buffer,
+            response = Response(
+                package_stream,
                 mimetype='application/zip',
-                as_attachment=True,
-                download_name=package_filename
+                headers={'Content-Disposition': f'attachment; filename="{package_filename}"'},
             )
+            if video_artifact:
+                # Liberar o vídeo só depois que o ZIP foi enviado (ou a conexão caiu)
+                response.call_on_close(video_artifact.close)
+            return response
         else:
             # Retornar vídeo direto (sem metadados)
-            if not video_buffer:
+            if not video_artifact:
                 return jsonify({"error": "Nenhum conteúdo para baixar"}), 400
             
-            return send_file(
-                video_buffer,
-                mimetype='video/mp4',
-                as_attachment=True,
-                download_name=video_filename or f'video_{video_id}.mp4'
-            )
+            return send_artifact(video_artifact, download_name=video_filename or f'video_{video_id}.mp4')
             
     except Exception as e:
         app.logger.exception("Erro ao baixar vídeo com metadados: %s", str(e))
         return jsonify({"error": f"Erro ao processar download: {str(e)}"}), 500
 
 
+# Limites do download em lote
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '50'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '3'))
+
+
+def parse_bool(value, default: bool = False) -> bool:
+    """Aceita booleanos JSON ou strings 'true'/'false'."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes', 'sim')
+
+
+def fetch_batch_item(item: dict, user_id: str) -> dict:
+    """
+    Obtém metadados e vídeo de um item do lote. Nunca levanta exceção: falhas
+    são devolvidas em 'error' para entrarem no manifesto.
+    """
+    video_id = item['videoId']
+    result = {'videoId': video_id, 'artifact': None, 'filename': None, 'metadata_json': None, 'error': None}
+    try:
+        # Lotes são trabalho em segundo plano: cedem a vez aos downloads interativos
+        video_info, _, error_msg = get_video_info(video_id, get_cookies_file_path(), priority=BACKGROUND)
+        if not video_info:
+            result['error'] = error_msg or 'Não foi possível obter informações do vídeo'
+            return result
+        result['title'] = video_info.get('title', '')
+        
+        if item['saveDescription'] or item['saveLinks']:
+            metadata = build_video_metadata(video_info, item['saveDescription'], item['saveLinks'], item['linkFilter'])
+            result['metadata_json'] = build_metadata_json(metadata, item['saveDescription'], item['saveLinks'])
+        
+        if item['saveVideo']:
+            for attempt in range(3):
+                try:
+                    success, artifact, filename, error_msg = download_with_ytdlp_shared(
+                        video_id, item['quality'], user_key=user_id, priority=BACKGROUND
+                    )
+                    break
+                except QueueFullError as exc:
+                    if attempt == 2:
+                        raise
+                    # Fila cheia: aguardar um pouco em vez de falhar o item
+                    time.sleep(min(exc.retry_after, 10))
+            if success:
+                result['artifact'], result['filename'] = artifact, filename
+            else:
+                result['error'] = error_msg or 'Não foi possível concluir o download'
+    except Exception as exc:  # pylint: disable=broad-except
+        app.logger.exception("Erro no item %s do download em lote", video_id)
+        result['error'] = str(exc)
+    return result
+
+
+def release_batch_artifact(future):
+    """Libera o vídeo de um item do lote que não entrou no ZIP."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    artifact = future.result()['artifact']
+    if artifact is not None:
+        artifact.close()
+
+
+def batch_zip_entries(items: list, user_id: str):
+    """
+    Gera as entradas do ZIP do lote conforme os itens terminam (concorrência
+    limitada a BATCH_CONCURRENCY) e, ao final, o manifest.json com o resultado
+    de cada item. Itens com falha não interrompem o lote.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, BATCH_CONCURRENCY), thread_name_prefix='batch')
+    futures = [executor.submit(fetch_batch_item, item, user_id) for item in items]
+    manifest = []
+    used_names = set()
+    handed_off = set()  # itens cujo vídeo foi entregue a um ZipEntry (liberado pelo on_done)
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            artifact = result['artifact']
+            base = f"{slugify(result.get('title') or result['videoId'])}_{result['videoId']}"
+            if base in used_names:
+                base = f"{base}_{len(used_names)}"
+            used_names.add(base)
+            
+            files = []
+            if artifact is not None:
+                files.append(f"{base}.mp4")
+                handed_off.add(future)
+                yield ZipEntry(files[-1], path=artifact.path, on_done=artifact.close)
+            if result['metadata_json']:
+                files.append(f"{base}.json")
+                yield ZipEntry(files[-1], data=json.dumps(result['metadata_json'], ensure_ascii=False, indent=2)
+                               .encode('utf-8'), compress=True)
+            
+            entry = {'videoId': result['videoId'], 'status': 'error' if result['error'] else 'ok', 'files': files}
+            if result['error']:
+                entry['error'] = result['error']
+            manifest.append(entry)
+        
+        summary = {
+            'total': len(items),
+            'succeeded': sum(1 for entry in manifest if entry['status'] == 'ok'),
+            'failed': sum(1 for entry in manifest if entry['status'] == 'error'),
+            'items': manifest,
+        }
+        yield ZipEntry('manifest.json', data=json.dumps(summary, ensure_ascii=False, indent=2).encode('utf-8'),
+                       compress=True)
+    finally:
+        # Cliente desconectou: liberar os vídeos que não entraram no ZIP, já
+        # baixados (na hora) ou ainda em andamento (quando terminarem)
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in futures:
+            if future not in handed_off:
+                future.add_done_callback(release_batch_artifact)
+
+
+def batch_download_cost() -> int:
+    """Downloads de um lote na cota diária: um por item com vídeo."""
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items') or data.get('videoIds') or []
+    if not isinstance(raw_items, list):
+        return 1
+    default_save = parse_bool(data.get('saveVideo'), True)
+    return max(1, sum(1 for raw in raw_items[:BATCH_MAX_ITEMS]
+                      if not isinstance(raw, dict) or parse_bool(raw.get('saveVideo', default_save), True)))
+
+
+@app.post("/api/download/batch")
+@login_required()
+@inbound_limited(download_cost=batch_download_cost)
+def download_batch():
+    """
+    Download em lote: um ZIP com vários vídeos, enviado conforme ficam prontos.
+    
+    Corpo JSON:
+    - items: lista de objetos com videoId e, opcionalmente, quality, saveVideo,
+      saveDescription, saveLinks e linkFilter (mesmas opções de
+      /api/download-with-metadata); ou videoIds: lista de IDs
+    - quality, saveVideo, saveDescription, saveLinks, linkFilter: padrões para os itens
+    
+    Os vídeos entram no ZIP sem compressão (MP4 já é comprimido) e o
+    manifest.json no final informa o resultado de cada item.
+    """
+    user_id = g.user_id
+    if not YT_DLP_AVAILABLE:
+        return jsonify({"error": "Serviço temporariamente indisponível"}), 503
+    
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items') or [{'videoId': video_id} for video_id in data.get('videoIds') or []]
+    if not raw_items:
+        return jsonify({"error": "Nenhum vídeo informado"}), 400
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Máximo de {BATCH_MAX_ITEMS} vídeos por lote"}), 400
+    
+    items = []
+    seen = set()
+    for raw in raw_items:
+        if isinstance(raw, str):
+            raw = {'videoId': raw}
+        video_id = (raw.get('videoId') or '').strip() if isinstance(raw, dict) else ''
+        if not video_id:
+            return jsonify({"error": "ID do video nao fornecido em um dos itens"}), 400
+        item = {
+            'videoId': video_id,
+            'quality': raw.get('quality') or data.get('quality') or 'best',
+            'saveVideo': parse_bool(raw.get('saveVideo', data.get('saveVideo')), True),
+            'saveDescription': parse_bool(raw.get('saveDescription', data.get('saveDescription')), False),
+            'saveLinks': parse_bool(raw.get('saveLinks', data.get('saveLinks')), False),
+            'linkFilter': (raw.get('linkFilter') or data.get('linkFilter') or '').strip(),
+        }
+        key = (item['videoId'], item['quality'])
+        if key in seen:
+            continue
+        seen.add(key)
+        items.append(item)
+    
+    app.logger.info("Download em lote: %d vídeo(s) para usuário %s", len(items), user_id)
+    filename = f"shorts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(
+        stream_zip(batch_zip_entries(items, user_id)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# Exportação de metadados em massa (sem baixar vídeos)
+BULK_METADATA_MAX_ITEMS = int(os.environ.get('BULK_METADATA_MAX_ITEMS', '500'))
+BULK_METADATA_CONCURRENCY = int(os.environ.get('BULK_METADATA_CONCURRENCY', '8'))
+BULK_METADATA_FIELDS = ('index', 'videoId', 'status', 'title', 'channel', 'upload_date', 'description', 'links',
+                        'error')
+
+
+def fetch_metadata_item(index: int, video_id: str, save_description: bool, link_filter: str) -> dict:
+    """Metadados de um vídeo para a exportação em massa. Falhas vão em 'error', sem exceção."""
+    record = {'index': index, 'videoId': video_id, 'status': 'ok'}
+    try:
+        # Exportações são trabalho em segundo plano: cedem a vez aos downloads interativos
+        video_info, _, error_msg = get_video_info(video_id, get_cookies_file_path(), priority=BACKGROUND)
+        if not video_info:
+            record.update(status='error', error=error_msg or 'Não foi possível obter informações do vídeo')
+            return record
+        metadata = build_video_metadata(video_info, save_description, True, link_filter)
+        record.update(
+            title=metadata['title'],
+            channel=metadata['channel'],
+            upload_date=metadata['published_at'],
+            description=metadata['description'] if save_description else None,
+            links=metadata['links'],
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        app.logger.exception("Erro no item %s da exportação de metadados", video_id)
+        record.update(status='error', error=str(exc))
+    return record
+
+
+def bulk_metadata_records(video_ids: list, save_description: bool, link_filter: str):
+    """
+    Registros de metadados conforme ficam prontos (fora de ordem; 'index' é a
+    posição do vídeo na requisição), com no máximo BULK_METADATA_CONCURRENCY
+    extrações em paralelo. Vídeos já no info_cache saem na hora.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, BULK_METADATA_CONCURRENCY), thread_name_prefix='bulk-metadata')
+    futures = [executor.submit(fetch_metadata_item, index, video_id, save_description, link_filter)
+               for index, video_id in enumerate(video_ids)]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Cliente desconectou: não extrair os vídeos que ainda não começaram
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_lines(records):
+    """CSV com cabeçalho; links separados por espaço."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=BULK_METADATA_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(dict(record, links=' '.join(record.get('links') or [])))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@app.post("/api/metadata/bulk")
+@login_required()
+@inbound_limited(download_cost=0)
+def bulk_metadata():
+    """
+    Exporta os metadados de muitos vídeos sem baixar nenhum, em streaming:
+    cada vídeo é enviado assim que sua extração termina.
+
+    Corpo JSON:
+    - videoIds: lista de IDs (até BULK_METADATA_MAX_ITEMS; repetidos são ignorados)
+    - format: 'ndjson' (padrão, um objeto JSON por linha) ou 'csv'
+    - saveDescription: incluir a descrição (padrão: true)
+    - linkFilter: mesmo filtro de links de /api/download-with-metadata
+
+    Cada registro traz index (posição em videoIds), videoId, status ('ok' ou
+    'error'), title, channel, upload_date, description, links e error.
+    """
+    user_id = g.user_id
+    if not YT_DLP_AVAILABLE:
+        return jsonify({"error": "Serviço temporariamente indisponível"}), 503
+
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get('videoIds') or []
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return jsonify({"error": "Nenhum vídeo informado"}), 400
+    video_ids = list(dict.fromkeys(str(video_id).strip() for video_id in raw_ids if str(video_id).strip()))
+    if not video_ids:
+        return jsonify({"error": "Nenhum vídeo informado"}), 400
+    if len(video_ids) > BULK_METADATA_MAX_ITEMS:
+        return jsonify({"error": f"Máximo de {BULK_METADATA_MAX_ITEMS} vídeos por exportação"}), 400
+
+    output_format = (data.get('format') or request.args.get('format') or 'ndjson').lower()
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "Formato inválido: use 'ndjson' ou 'csv'"}), 400
+    save_description = parse_bool(data.get('saveDescription'), True)
+    link_filter = (data.get('linkFilter') or '').strip()
+
+    app.logger.info("Exportação de metadados: %d vídeo(s) em %s para usuário %s", len(video_ids), output_format,
+                    user_id)
+    records = bulk_metadata_records(video_ids, save_description, link_filter)
+    if output_format == 'csv':
+        body, mimetype = csv_lines(records), 'text/csv'
+    else:
+        body, mimetype = ndjson_lines(records), 'application/x-ndjson'
+    filename = f"metadata_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{output_format}"
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# ==================== PRÉ-CARREGAMENTO ====================
+
+PREFETCH_MAX_ITEMS = int(os.environ.get('PREFETCH_MAX_ITEMS', '20'))
+PREFETCH_VIDEO_ENABLED = os.environ.get('PREFETCH_VIDEO_ENABLED', 'true').lower() == 'true'
+# Bytes do cache em disco ocupados por vídeos pré-carregados (não conta os baixados pelos usuários)
+prefetch_budget = PrefetchBudget(int(os.environ.get('PREFETCH_DISK_BUDGET', str(512 * 1024 ** 2))))
+
+
+def prefetch_info(video_id: str):
+    """Aquece o cache de informações (e a escada de /api/formats); erro ou None."""
+    info, _, error_msg = get_video_info(video_id, get_cookies_file_path(), priority=BACKGROUND)
+    return None if info else (error_msg or 'Não foi possível obter informações do vídeo')
+
+
+def expected_video_bytes(video_id: str, quality: str) -> int:
+    """Tamanho estimado do download pela escada de qualidades (0 se desconhecido)."""
+    ladder = format_ladders.get(video_id)
+    if ladder is None:
+        info = info_cache.get(video_id)
+        if not info:
+            return 0
+        ladder = format_ladders.build(video_id, info)
+    candidates = [fmt for fmt in ladder.formats if fmt['format_id'] != 'best']
+    if quality and quality != 'best':
+        candidates = [fmt for fmt in candidates if fmt['format_id'] == quality]
+    return (candidates[0]['filesize'] or 0) if candidates else 0
+
+
+def prefetch_video_room(item):
+    """
+    Motivo para não pré-carregar o vídeo agora, ou None. Vídeos só entram
+    com a fila de downloads ociosa e enquanto os vídeos pré-carregados que
+    continuam no cache somarem no máximo PREFETCH_DISK_BUDGET.
+    """
+    if video_cache.lookup(item.video_id, item.quality, record_stats=False):
+        return 'já está no cache'
+    queue_stats = download_scheduler.stats()
+    if queue_stats['queued'] or queue_stats['running'] >= queue_stats['max_concurrent']:
+        return 'downloads de usuários em andamento'
+    expected = expected_video_bytes(item.video_id, item.quality)
+    if expected > video_cache.max_bytes or not prefetch_budget.fits(expected):
+        return 'orçamento de disco do pré-carregamento esgotado'
+    if shutil.disk_usage(video_cache.directory).free < 2 * expected:
+        return 'pouco espaço livre em disco'
+    return None
+
+
+def prefetch_video(item):
+    """Baixa o vídeo para o cache em disco (fila de downloads, prioridade BACKGROUND); erro ou None."""
+    try:
+        success, artifact, _, error_msg = download_with_ytdlp_shared(
+            item.video_id, item.quality, user_key='prefetch', priority=BACKGROUND
+        )
+    except QueueFullError as exc:
+        return str(exc)
+    if artifact is not None:
+        if artifact.cleanup_dir is None and artifact.exists():
+            # Publicado no cache em disco (sem diretório temporário próprio)
+            prefetch_budget.add(artifact.path, artifact.size)
+        artifact.close()
+    return None if success else (error_msg or 'Não foi possível concluir o download')
+
+
+prefetcher = create_prefetcher_from_env(
+    prefetch_info,
+    warm_video=prefetch_video if PREFETCH_VIDEO_ENABLED and video_cache.enabled else None,
+    video_room=prefetch_video_room,
+)
+
+
+@app.post("/api/prefetch")
+@login_required()
+@inbound_limited(download_cost=0)
+def prefetch():
+    """
+    Pré-carrega em segundo plano vídeos que o usuário deve abrir em seguida
+    (sugestões, listas em alta), para que o clique seja servido do cache.
+
+    Corpo JSON:
+    - videoIds: lista de IDs, do mais provável ao menos provável (até PREFETCH_MAX_ITEMS)
+    - priority: 'high', 'normal' (padrão) ou 'low' - ordem na fila de pré-carregamento
+    - video: 'true' para baixar também o vídeo para o cache em disco (padrão: false)
+    - quality: qualidade do vídeo pré-carregado (padrão: 'best')
+
+    Responde 202 na hora com os IDs enfileirados, ignorados (já na fila ou
+    pré-carregados há pouco) e recusados (fila cheia).
+    """
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get('videoIds') or []
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return jsonify({"error": "Nenhum vídeo informado"}), 400
+    video_ids = list(dict.fromkeys(str(video_id).strip() for video_id in raw_ids if str(video_id).strip()))
+    if not video_ids:
+        return jsonify({"error": "Nenhum vídeo informado"}), 400
+    if len(video_ids) > PREFETCH_MAX_ITEMS:
+        return jsonify({"error": f"Máximo de {PREFETCH_MAX_ITEMS} vídeos por pré-carregamento"}), 400
+    priority = (data.get('priority') or 'normal').lower()
+    if priority not in PRIORITY_RANKS:
+        return jsonify({"error": "Prioridade inválida: use 'high', 'normal' ou 'low'"}), 400
+
+    include_video = parse_bool(data.get('video'), False)
+    quality = data.get('quality') or 'best'
+    result = prefetcher.submit([PrefetchItem(video_id, quality, include_video, priority) for video_id in video_ids])
+    app.logger.info("Pré-carregamento: %d vídeo(s) enfileirado(s) para usuário %s (prioridade %s)",
+                    len(result['queued']), g.user_id, priority)
+    result['video'] = include_video and prefetcher.warm_video is not None
+    return jsonify(result), 202
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5000"))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,92 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import send_file
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadArtifact:
+    """
+    Arquivo baixado em disco com um dono responsável pela limpeza.
+
+    Substitui os buffers em memória: as funções de download retornam o caminho
+    do arquivo e quem serve a resposta chama close() quando terminar. Arquivos
+    do cache em disco não têm diretório temporário e close() não remove nada.
+    Quando o mesmo artefato é entregue a várias respostas (downloads
+    coalescidos), cada uma chama retain() e o diretório só é removido no
+    último close().
+    """
+
+    def __init__(self, path: str, filename: str, cleanup_dir: str = None):
+        self.path = path
+        self.filename = filename
+        self.cleanup_dir = cleanup_dir
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def adopt(cls, source_path: str, filename: str):
+        """
+        Move um arquivo (ex.: de um TemporaryDirectory prestes a ser removido)
+        para um diretório temporário próprio do artefato.
+        """
+        owned_dir = tempfile.mkdtemp(prefix='yt_artifact_')
+        target = os.path.join(owned_dir, os.path.basename(source_path))
+        shutil.move(source_path, target)
+        return cls(target, filename, cleanup_dir=owned_dir)
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def retain(self):
+        """Registra mais um dono; cada dono deve chamar close()."""
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def close(self):
+        """Libera uma referência; a última remove o diretório temporário."""
+        with self._lock:
+            if self._refs <= 0:
+                return
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        if self.cleanup_dir:
+            shutil.rmtree(self.cleanup_dir, ignore_errors=True)
+            logger.debug("Diretório temporário removido: %s", self.cleanup_dir)
+
+    def __repr__(self):
+        return f'<DownloadArtifact {self.filename} ({self.path})>'
+
+
+def send_artifact(artifact: DownloadArtifact, mimetype: str = 'video/mp4', download_name: str = None):
+    """
+    Serve um artefato a partir do disco com send_file sobre o caminho.
+
+    Com caminho (e não buffer) o Werkzeug responde a requisições Range
+    (conditional=True) e o servidor WSGI pode usar sendfile via
+    wsgi.file_wrapper. O diretório temporário só é removido quando a resposta
+    é fechada.
+    """
+    try:
+        response = send_file(
+            artifact.path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name or artifact.filename,
+            conditional=True,
+        )
+    except Exception:
+        artifact.close()
+        raise
+    response.call_on_close(artifact.close)
+    return response
@@ -0,0 +1,439 @@
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from flask import jsonify, request
+from werkzeug.wsgi import FileWrapper
+
+from app import (
+    JOB_EVENTS_MAX_SECONDS, InboundLimiter, JobStore, QueueFullError, RateLimited, app as flask_app, client_ip,
+    get_user_job, inbound_limiter, job_store, queue_full_response, rate_limited_response, run_download_job,
+    user_id_from_request,
+)
+from jobs import FINAL_STATES
+
+logger = logging.getLogger(__name__)
+
+# Threads para as views do Flask. /api/download (sem progresso), /api/formats e
+# os lotes continuam bloqueantes: cada requisição ocupa uma thread do pool até
+# o fim (inclusive a espera na fila de downloads), então o modo ASGI não aumenta
+# a concorrência dessas rotas; o pool deve comportar o pico delas
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', '64'))
+# Threads para ler o corpo das respostas e consultar o job_store (operações curtas)
+ASGI_STREAM_THREADS = int(os.environ.get('ASGI_STREAM_THREADS', '32'))
+# Tamanho dos blocos lidos de arquivos (send_file) a cada ida ao pool
+ASGI_FILE_CHUNK = int(os.environ.get('ASGI_FILE_CHUNK', str(256 * 1024)))
+# Intervalo de leitura do job_store e dos heartbeats dos streams SSE
+ASGI_POLL_INTERVAL = float(os.environ.get('ASGI_POLL_INTERVAL', '0.5'))
+ASGI_SSE_HEARTBEAT = float(os.environ.get('ASGI_SSE_HEARTBEAT', '15'))
+# Mesmo limite do stream de progresso do Flask (download_with_progress)
+PROGRESS_MAX_SECONDS = 600
+
+JOB_EVENTS_PATH = re.compile(r'^/api/jobs/([^/]+)/events$')
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+HEARTBEAT = object()
+
+view_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi-view')
+stream_executor = ThreadPoolExecutor(max_workers=ASGI_STREAM_THREADS, thread_name_prefix='asgi-stream')
+
+
+class JobWatcher:
+    """
+    Acompanha no job_store os jobs que têm streams SSE abertos.
+
+    Uma única tarefa lê todos os jobs observados a cada interval segundos (no
+    pool de threads) e acorda as conexões; cada conexão é só uma corrotina
+    esperando o próximo ciclo, sem thread presa, e várias conexões do mesmo
+    job compartilham a mesma leitura.
+    """
+
+    def __init__(self, store: JobStore, executor, interval: float = 0.5):
+        self.store = store
+        self.executor = executor
+        self.interval = interval
+        self._watchers = {}  # job_id -> número de streams
+        self._snapshots = {}
+        self._tick = None
+        self._task = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._tick = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_ids = list(self._watchers)
+            if job_ids:
+                try:
+                    snapshots = await loop.run_in_executor(self.executor, self._read, job_ids)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Erro ao ler os jobs observados")
+                else:
+                    self._snapshots.update(snapshots)
+                    tick, self._tick = self._tick, asyncio.Event()
+                    tick.set()
+            await asyncio.sleep(self.interval)
+
+    def _read(self, job_ids: list) -> dict:
+        return {job_id: self.store.get(job_id) for job_id in job_ids}
+
+    async def watch(self, job_id: str, heartbeat: float):
+        """
+        Gera o job sempre que ele muda (None se expirou) e HEARTBEAT quando
+        passa heartbeat segundos sem mudança. O primeiro valor é o estado atual.
+        """
+        self._ensure_started()
+        self._watchers[job_id] = self._watchers.get(job_id, 0) + 1
+        try:
+            job = await asyncio.get_running_loop().run_in_executor(self.executor, self.store.get, job_id)
+            last = job['updated_at'] if job else None
+            last_sent = time.monotonic()
+            yield job
+            while True:
+                try:
+                    await asyncio.wait_for(self._tick.wait(), timeout=max(heartbeat, self.interval * 4))
+                except asyncio.TimeoutError:
+                    # A tarefa de leitura morreu (ex.: loop reiniciado): recriá-la
+                    self._ensure_started()
+                job = self._snapshots.get(job_id, job)
+                now = time.monotonic()
+                if (job['updated_at'] if job else None) != last:
+                    last = job['updated_at'] if job else None
+                    last_sent = now
+                    yield job
+                elif now - last_sent >= heartbeat:
+                    last_sent = now
+                    yield HEARTBEAT
+        finally:
+            self._watchers[job_id] -= 1
+            if not self._watchers[job_id]:
+                del self._watchers[job_id]
+                self._snapshots.pop(job_id, None)
+
+    def stats(self) -> dict:
+        return {'jobs': len(self._watchers), 'streams': sum(self._watchers.values())}
+
+
+job_watcher = JobWatcher(job_store, stream_executor, interval=ASGI_POLL_INTERVAL)
+
+
+def file_wrapper(file, buffer_size: int = 8192):
+    """wsgi.file_wrapper com blocos maiores: menos idas ao pool por arquivo."""
+    return FileWrapper(file, max(buffer_size, ASGI_FILE_CHUNK))
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """Environ WSGI equivalente à requisição ASGI (para o app Flask)."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': file_wrapper,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+def watch_disconnect(receive) -> asyncio.Task:
+    """Tarefa que termina quando o cliente fecha a conexão (o corpo já deve ter sido lido)."""
+    async def listen():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    return asyncio.get_running_loop().create_task(listen())
+
+
+def encode_headers(headers) -> list:
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+
+async def call_flask(scope, receive, send):
+    """
+    Atende a requisição com o app Flask: a view roda no view_executor e o
+    corpo da resposta é lido um bloco por vez no stream_executor, então
+    nenhuma thread fica presa entre os blocos enviados ao cliente.
+
+    A requisição inteira roda num mesmo contextvars.Context: o contexto do
+    Flask empilhado por stream_with_context em uma thread continua válido
+    quando o gerador é retomado em outra.
+    """
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, await read_body(receive))
+    disconnected = watch_disconnect(receive)
+    context = contextvars.Context()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = encode_headers(headers)
+        return lambda data: None
+
+    try:
+        body = await loop.run_in_executor(view_executor, context.run, flask_app, environ, start_response)
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            iterator = iter(body)
+            while not disconnected.done():
+                chunk = await loop.run_in_executor(stream_executor, context.run, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            # Dispara os call_on_close (ex.: liberar o artefato, encerrar o ffmpeg)
+            if hasattr(body, 'close'):
+                await loop.run_in_executor(stream_executor, context.run, body.close)
+    finally:
+        disconnected.cancel()
+
+
+def finish_response(rv):
+    """
+    Resposta do Flask para rv com os after_request aplicados, como nas views
+    (CORS do Flask-CORS: origem refletida e credenciais; Server-Timing). Deve
+    ser chamada dentro do request_context da requisição.
+    """
+    return flask_app.process_response(flask_app.make_response(rv))
+
+
+def sse_headers(response) -> list:
+    """Cabeçalhos do stream SSE mais os da resposta processada pelo Flask (CORS, cotas)."""
+    extra = [(name, value) for name, value in response.headers.items()
+             if name.lower() not in ('content-type', 'content-length')]
+    return SSE_HEADERS + encode_headers(extra)
+
+
+async def send_flask_response(send, response):
+    """Envia uma resposta curta do Flask (ex.: erro antes de abrir um stream)."""
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': encode_headers(response.headers.items())})
+    await send({'type': 'http.response.body', 'body': response.get_data(), 'more_body': False})
+
+
+async def send_event(send, text: str):
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+
+def sse_data(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def start_progress_job(environ: dict):
+    """
+    Parte síncrona de /api/download?progress=true: autenticação, limites e
+    início do job no download_scheduler.
+
+    Returns:
+        (job_id, cabeçalhos do stream) ou (None, resposta de erro do Flask)
+    """
+    with flask_app.request_context(environ):
+        user_id = user_id_from_request(allow_query_token=True)
+        if not user_id:
+            return None, finish_response((jsonify({"error": "Faça login para continuar."}), 401))
+        video_id = request.args.get("videoId")
+        quality = request.args.get("quality", "best")
+        if not video_id:
+            return None, finish_response((jsonify({"error": "ID do video nao fornecido"}), 400))
+        try:
+            # Como no Flask, o stream de progresso não conta na cota de downloads
+            quota = inbound_limiter.check(user_id, client_ip(), downloads=0)
+        except RateLimited as exc:
+            return None, finish_response(rate_limited_response(exc))
+        job = job_store.create(video_id, quality, user_id)
+        try:
+            run_download_job(job['id'], video_id, quality, user_id)
+        except QueueFullError as exc:
+            return None, finish_response(queue_full_response(exc))
+        return job['id'], sse_headers(finish_response(('', 200, InboundLimiter.quota_headers(quota))))
+
+
+def authorize_job_events(environ: dict, job_id: str):
+    """
+    Returns:
+        (True, cabeçalhos do stream) ou (False, resposta de erro do Flask) se o
+        usuário não pode acompanhar o job
+    """
+    with flask_app.request_context(environ):
+        user_id = user_id_from_request(allow_query_token=True)
+        if not user_id:
+            return False, finish_response((jsonify({"error": "Faça login para continuar."}), 401))
+        if not get_user_job(job_id, user_id):
+            return False, finish_response((jsonify({"error": "Job não encontrado ou expirado"}), 404))
+        return True, sse_headers(finish_response(('', 200)))
+
+
+async def progress_stream(scope, receive, send):
+    """
+    /api/download?progress=true com a mesma sequência de eventos do Flask
+    (starting, progresso, evento final com filename ou error), mas o stream é
+    uma corrotina alimentada pelo job_watcher em vez de uma thread presa.
+    """
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, await read_body(receive))
+    job_id, result = await loop.run_in_executor(view_executor, start_progress_job, environ)
+    if job_id is None:
+        await send_flask_response(send, result)
+        return
+
+    disconnected = watch_disconnect(receive)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': result})
+    watch = job_watcher.watch(job_id, ASGI_SSE_HEARTBEAT)
+    try:
+        await send_event(send, sse_data({'status': 'starting', 'percent': 0, 'job_id': job_id}))
+        started = time.monotonic()
+        async for job in watch:
+            if disconnected.done():
+                return
+            if time.monotonic() - started > PROGRESS_MAX_SECONDS:
+                logger.error("Timeout no stream de progresso do job %s", job_id)
+                await send_event(send, sse_data({'status': 'error', 'error': 'Timeout: Download demorou muito'}))
+                break
+            if job is HEARTBEAT:
+                await send_event(send, ": heartbeat\n\n")
+                continue
+            if job is None:
+                await send_event(send, sse_data({'status': 'error', 'error': 'Job expirado', 'job_id': job_id}))
+                break
+            data = JobStore.public_dict(job)
+            if job['status'] not in FINAL_STATES:
+                await send_event(send, sse_data(data))
+                continue
+            final_event = {'status': data.get('status', 'unknown'), 'percent': data.get('percent', 100),
+                           'job_id': job_id}
+            if data.get('filename'):
+                final_event['filename'] = data['filename']
+            if data.get('error'):
+                final_event['error'] = data['error']
+            await send_event(send, sse_data(final_event))
+            break
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        await watch.aclose()
+        disconnected.cancel()
+
+
+async def job_events_stream(scope, receive, send, job_id: str):
+    """
+    /api/jobs/<id>/events: mesmos eventos da versão Flask. A conexão ainda
+    dura no máximo JOB_EVENTS_MAX_SECONDS para manter o comportamento de
+    reconexão do cliente igual nos dois modos.
+    """
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, await read_body(receive))
+    allowed, result = await loop.run_in_executor(view_executor, authorize_job_events, environ, job_id)
+    if not allowed:
+        await send_flask_response(send, result)
+        return
+
+    disconnected = watch_disconnect(receive)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': result})
+    watch = job_watcher.watch(job_id, ASGI_SSE_HEARTBEAT)
+    try:
+        await send_event(send, "retry: 1000\n\n")
+        started = time.monotonic()
+        async for job in watch:
+            if disconnected.done() or time.monotonic() - started >= JOB_EVENTS_MAX_SECONDS:
+                break
+            if job is HEARTBEAT:
+                await send_event(send, ": heartbeat\n\n")
+                continue
+            if job is None:
+                await send_event(send, sse_data({'status': 'error', 'error': 'Job expirado', 'job_id': job_id}))
+                break
+            await send_event(send, sse_data(JobStore.public_dict(job)))
+            if job['status'] in FINAL_STATES:
+                break
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        await watch.aclose()
+        disconnected.cancel()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            logger.info("Modo ASGI: %d threads para views, %d para streams", ASGI_THREADS, ASGI_STREAM_THREADS)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            view_executor.shutdown(wait=False, cancel_futures=True)
+            stream_executor.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    Aplicação ASGI: streams de progresso assíncronos e o restante da API
+    (incluindo /api/formats e /api/download sem progresso) pelo app Flask.
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'GET':
+        if scope['path'] == '/api/download':
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            if query.get('progress', ['false'])[0].lower() == 'true':
+                await progress_stream(scope, receive, send)
+                return
+        match = JOB_EVENTS_PATH.match(scope['path'])
+        if match:
+            await job_events_stream(scope, receive, send, match.group(1))
+            return
+    await call_flask(scope, receive, send)
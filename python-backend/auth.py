@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class AuthError(Exception):
+    """Token inválido, expirado ou revogado"""
+
+
+class Identity:
+    """Dados de um token já validado"""
+
+    __slots__ = ('user_id', 'jti', 'expires_at')
+
+    def __init__(self, user_id: str, jti: str = None, expires_at: float = None):
+        self.user_id = user_id
+        self.jti = jti
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return f'<Identity {self.user_id} ({self.jti})>'
+
+
+class Authenticator:
+    """
+    Camada única de autenticação por JWT dos endpoints.
+
+    - authenticate(token): o token é decodificado (assinatura e expiração)
+      uma única vez e o resultado fica em cache por cache_ttl segundos (nunca
+      além da expiração do token); requisições seguidas e reconexões de SSE
+      do mesmo usuário não pagam a decodificação de novo
+    - revoke(): logout real; o jti entra na denylist, gravada por
+      store_revoked (ex.: no banco), e o token deixa de ser aceito na hora
+      neste worker
+    - a denylist fica em memória e é sincronizada a cada sync_interval
+      segundos com load_revoked, de forma incremental (só as revogações
+      novas), então os outros workers recusam o token em até sync_interval
+    - a cada purge_interval segundos, purge_revoked apaga do armazenamento as
+      revogações de tokens já expirados (a denylist persistida fica limitada)
+    - user_profile(): perfil do usuário em cache pelo mesmo cache_ttl, para
+      /api/auth/verify não consultar o banco a cada chamada
+    - stats(): taxa de acerto do cache e custo por requisição (médio e p95)
+
+    Args:
+        decode: Função token -> claims; levanta exceção se o token for inválido
+        load_revoked: Função cursor -> (lista de (jti, expira_em), novo cursor)
+        store_revoked: Função (jti, user_id, expira_em) que persiste a revogação
+        purge_revoked: Função sem argumentos que apaga as revogações expiradas
+    """
+
+    def __init__(self, decode, load_revoked=None, store_revoked=None, cache_ttl: float = 300.0,
+                 max_entries: int = 10000, sync_interval: float = 5.0, purge_revoked=None,
+                 purge_interval: float = 3600.0):
+        self.decode = decode
+        self.load_revoked = load_revoked
+        self.store_revoked = store_revoked
+        self.purge_revoked = purge_revoked
+        self.sync_interval = sync_interval
+        self.purge_interval = purge_interval
+        self._tokens = TTLCache(max_entries, cache_ttl)
+        self._profiles = TTLCache(max_entries, cache_ttl)
+        self._revoked = {}  # jti -> expira_em
+        self._cursor = None
+        self._next_sync = 0.0
+        self._next_purge = 0.0
+        self._sync_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+        self._samples = deque(maxlen=1024)  # (duração, acerto no cache)
+
+    def authenticate(self, token: str) -> Identity:
+        """
+        Identidade do token.
+
+        Raises:
+            AuthError: token inválido, expirado, sem identidade ou revogado
+        """
+        started = time.perf_counter()
+        self._sync()
+        identity = self._tokens.get(token)
+        hit = identity is not None
+        try:
+            if identity is None:
+                try:
+                    claims = self.decode(token)
+                except Exception as exc:
+                    raise AuthError(str(exc)) from exc
+                if not claims.get('sub'):
+                    raise AuthError('Token sem identidade')
+                identity = Identity(str(claims['sub']), claims.get('jti'), claims.get('exp'))
+                self._tokens.set(token, identity, expires_at=identity.expires_at)
+            if identity.jti and identity.jti in self._revoked:
+                raise AuthError('Token revogado')
+            return identity
+        except AuthError:
+            with self._lock:
+                self._failures += 1
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                if hit:
+                    self._hits += 1
+                else:
+                    self._misses += 1
+                self._samples.append((duration, hit))
+
+    def revoke(self, identity: Identity):
+        """Revoga o token (logout); sem jti não há o que revogar."""
+        if not identity.jti:
+            return
+        with self._lock:
+            self._revoked[identity.jti] = identity.expires_at
+        if self.store_revoked:
+            self.store_revoked(identity.jti, identity.user_id, identity.expires_at)
+        logger.info("Token %s do usuário %s revogado", identity.jti, identity.user_id)
+
+    def _sync(self):
+        if self.load_revoked is None or time.monotonic() < self._next_sync:
+            return
+        # Só uma thread sincroniza; as demais seguem com a denylist atual
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = time.monotonic() + self.sync_interval
+            entries, self._cursor = self.load_revoked(self._cursor)
+            now = time.time()
+            with self._lock:
+                for jti, expires_at in entries:
+                    self._revoked[jti] = expires_at
+                # Tokens expirados já são recusados pelo decode: não precisam ficar na lista
+                for jti in [jti for jti, expires_at in self._revoked.items() if expires_at and expires_at <= now]:
+                    del self._revoked[jti]
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Erro ao sincronizar a denylist de tokens")
+        try:
+            if self.purge_revoked and time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + self.purge_interval
+                removed = self.purge_revoked()
+                if removed:
+                    logger.info("%d revogação(ões) expirada(s) removida(s) da denylist", removed)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Erro ao limpar revogações expiradas")
+        finally:
+            self._sync_lock.release()
+
+    def user_profile(self, user_id, loader):
+        """Perfil do usuário via loader(user_id), em cache (None também é guardado)."""
+        profile = self._profiles.get(user_id, _MISSING)
+        if profile is _MISSING:
+            profile = loader(user_id)
+            self._profiles.set(user_id, profile)
+        return profile
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = list(self._samples)
+            hits, misses, failures = self._hits, self._misses, self._failures
+            revoked = len(self._revoked)
+
+        def summary(durations):
+            if not durations:
+                return None
+            durations = sorted(durations)
+            return {
+                'avg_us': round(sum(durations) / len(durations) * 1e6, 1),
+                'p95_us': round(durations[round(0.95 * (len(durations) - 1))] * 1e6, 1),
+            }
+
+        return {
+            'cached_tokens': len(self._tokens),
+            'cached_profiles': len(self._profiles),
+            'revoked_tokens': revoked,
+            'hits': hits,
+            'misses': misses,
+            'failures': failures,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            'latency': summary([duration for duration, _ in samples]),
+            'latency_hit': summary([duration for duration, hit in samples if hit]),
+            'latency_miss': summary([duration for duration, hit in samples if not hit]),
+        }
+
+
+def create_authenticator_from_env(decode, load_revoked=None, store_revoked=None,
+                                  purge_revoked=None) -> Authenticator:
+    """
+    Cria o autenticador a partir das variáveis de ambiente:
+    - AUTH_CACHE_TTL: segundos que um token validado fica em cache (padrão: 300; 0 desativa)
+    - AUTH_CACHE_SIZE: limite de tokens (e de perfis) em cache (padrão: 10000)
+    - AUTH_DENYLIST_SYNC: intervalo de sincronização da denylist entre workers (padrão: 5)
+    - AUTH_DENYLIST_PURGE: intervalo da limpeza das revogações expiradas (padrão: 3600)
+    """
+    return Authenticator(
+        decode,
+        load_revoked=load_revoked,
+        store_revoked=store_revoked,
+        cache_ttl=float(os.environ.get('AUTH_CACHE_TTL', '300')),
+        max_entries=int(os.environ.get('AUTH_CACHE_SIZE', '10000')),
+        sync_interval=float(os.environ.get('AUTH_DENYLIST_SYNC', '5')),
+        purge_revoked=purge_revoked,
+        purge_interval=float(os.environ.get('AUTH_DENYLIST_PURGE', '3600')),
+    )
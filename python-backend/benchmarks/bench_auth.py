@@ -0,0 +1,99 @@
+"""
+Benchmark do custo de autenticação por requisição (auth.Authenticator).
+
+Simula o tráfego real: poucos usuários fazendo muitas requisições seguidas
+(downloads, polling de jobs, reconexões de SSE a cada JOB_EVENTS_MAX_SECONDS)
+em várias threads. Compara a validação sem cache (decodificar o JWT e, em
+/api/auth/verify, consultar o banco a cada requisição, como antes) com o
+cache de tokens validados e de perfis.
+
+Uso:
+    python benchmarks/bench_auth.py [--users 50] [--requests 20000] [--threads 8]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_auth.db')}")
+os.environ['JOB_STORE_BACKEND'] = 'memory'
+os.environ['RATE_LIMIT_BACKEND'] = 'memory'
+
+import app as backend  # noqa: E402
+from auth import Authenticator  # noqa: E402
+
+
+def make_authenticator(cache_ttl: float) -> Authenticator:
+    return Authenticator(backend.decode_access_token, backend.load_revoked_tokens, backend.store_revoked_token,
+                         cache_ttl=cache_ttl)
+
+
+def create_tokens(users: int) -> list:
+    tokens = []
+    client = backend.app.test_client()
+    for index in range(users):
+        response = client.post('/api/auth/register', json={
+            'email': f'bench-{time.time_ns()}-{index}@example.com', 'password': 'benchmark',
+        })
+        tokens.append(response.json['access_token'])
+    return tokens
+
+
+def run(authenticator: Authenticator, tokens: list, requests: int, threads: int) -> list:
+    def one(token):
+        started = time.perf_counter()
+        authenticator.authenticate(token)
+        return time.perf_counter() - started
+
+    picks = [random.choice(tokens) for _ in range(requests)]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return sorted(executor.map(one, picks))
+
+
+def run_verify(tokens: list, requests: int) -> list:
+    client = backend.app.test_client()
+    durations = []
+    for _ in range(requests):
+        headers = {'Authorization': f'Bearer {random.choice(tokens)}'}
+        started = time.perf_counter()
+        response = client.get('/api/auth/verify', headers=headers)
+        durations.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.json
+    return sorted(durations)
+
+
+def report(label: str, durations: list):
+    p95 = durations[round(0.95 * (len(durations) - 1))]
+    print(f'{label:<34} {statistics.mean(durations) * 1e6:>10.1f} {statistics.median(durations) * 1e6:>10.1f} '
+          f'{p95 * 1e6:>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    tokens = create_tokens(args.users)
+    print(f'{args.users} usuários, {args.requests} requisições, {args.threads} threads\n')
+    print(f"{'cenário':<34} {'média (us)':>10} {'p50 (us)':>10} {'p95 (us)':>10}")
+    report('authenticate sem cache', run(make_authenticator(0), tokens, args.requests, args.threads))
+    report('authenticate com cache', run(make_authenticator(300), tokens, args.requests, args.threads))
+
+    verify_requests = min(args.requests, 2000)
+    backend.authenticator = make_authenticator(0)
+    report('GET /api/auth/verify sem cache', run_verify(tokens, verify_requests))
+    backend.authenticator = make_authenticator(300)
+    report('GET /api/auth/verify com cache', run_verify(tokens, verify_requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark da latência extra de download_with_ytdlp em relação ao tempo de
+transferência puro.
+
+Um extrator falso (subclasse de YoutubeDL) devolve um info_dict apontando para
+um servidor HTTP local que serve um MP4 sintético, então o pipeline real do
+yt-dlp (seleção de formato, downloader HTTP, hooks) é exercitado sem acessar o
+YouTube. A diferença entre o tempo total e o tempo de um GET direto no mesmo
+servidor é o overhead do nosso código (antes: 5-7 s de polling do diretório).
+
+Uso:
+    python benchmarks/bench_download_latency.py [--runs 5] [--size-mb 8]
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Banco em memória e cache desativado para medir sempre o caminho completo
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ['VIDEO_CACHE_MAX_BYTES'] = '0'
+
+import app as backend  # noqa: E402
+
+
+def start_fixture_server(payload: bytes):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/fixture.mp4'
+
+
+def make_fake_youtubedl(fixture_url: str, size: int):
+    class FakeExtractorYoutubeDL(backend.yt_dlp.YoutubeDL):
+        """YoutubeDL cujo extract_info não acessa a rede do YouTube."""
+
+        def extract_info(self, url, download=True, *args, **kwargs):
+            ie_result = {
+                'id': 'benchShort01',
+                'title': 'Benchmark Short',
+                'webpage_url': url,
+                'extractor': 'fake',
+                'extractor_key': 'Fake',
+                'formats': [{
+                    'format_id': '18',
+                    'url': fixture_url,
+                    'ext': 'mp4',
+                    'protocol': 'http',
+                    'vcodec': 'avc1.42001E',
+                    'acodec': 'mp4a.40.2',
+                    'width': 360,
+                    'height': 640,
+                    'filesize': size,
+                }],
+            }
+            return self.process_ie_result(ie_result, download=download)
+
+    return FakeExtractorYoutubeDL
+
+
+def time_raw_get(url: str) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        while response.read(1024 * 1024):
+            pass
+    return time.perf_counter() - start
+
+
+def time_download(video_id: str) -> float:
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        success, artifact, _, error = backend.download_with_ytdlp(video_id, 'best', lambda data: None)
+    elapsed = time.perf_counter() - start
+    if not success:
+        raise RuntimeError(f'download falhou: {error}')
+    artifact.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--size-mb', type=float, default=8)
+    args = parser.parse_args()
+
+    backend.app.logger.setLevel('ERROR')
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    server, fixture_url = start_fixture_server(payload)
+    backend.yt_dlp.YoutubeDL = make_fake_youtubedl(fixture_url, len(payload))
+    os.environ.pop('YOUTUBE_COOKIES_FILE', None)
+
+    raw, total = [], []
+    for i in range(args.runs):
+        raw.append(time_raw_get(fixture_url))
+        total.append(time_download(f'bench{i:03d}'))
+
+    overhead = [t - r for t, r in zip(total, raw)]
+    print(f'arquivo: {args.size_mb} MB, execuções: {args.runs}')
+    print(f'GET direto         (mediana): {statistics.median(raw) * 1000:8.1f} ms')
+    print(f'download_with_ytdlp (mediana): {statistics.median(total) * 1000:8.1f} ms')
+    print(f'overhead            (mediana): {statistics.median(overhead) * 1000:8.1f} ms')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
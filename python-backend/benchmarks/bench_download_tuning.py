@@ -0,0 +1,176 @@
+"""
+Benchmark dos perfis de ajuste de download (download_tuning) no caminho com
+merge de download_with_ytdlp.
+
+Os componentes DASH sintéticos (vídeo H.264 e áudio AAC gerados pelo ffmpeg)
+são segmentados pelo próprio ffmpeg e descritos como formatos fragmentados
+(http_dash_segments) em um info_dict falso. Um servidor HTTP local limita a
+banda de cada conexão, como o YouTube faz, então o ganho vem de baixar
+fragmentos e componentes em paralelo. Compara o perfil 'none' (padrão do
+yt-dlp: tudo sequencial) com os perfis configurados.
+
+Uso:
+    python benchmarks/bench_download_tuning.py [--runs 2] [--seconds 30] [--rate-mbps 8]
+    (ffmpeg no PATH ou em FFMPEG_BINARY)
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ['VIDEO_CACHE_MAX_BYTES'] = '0'
+os.environ['JOB_STORE_BACKEND'] = 'memory'
+
+import app as backend  # noqa: E402
+from bench_fmp4_stream import make_fixtures, validate_output  # noqa: E402
+from download_tuning import DownloadTuning  # noqa: E402
+from fmp4_mux import find_ffmpeg  # noqa: E402
+
+
+def segment(ffmpeg: str, source: str, directory: str) -> list:
+    """Segmenta um componente em init.m4s + seg-N.m4s (fragmentos DASH)."""
+    os.makedirs(directory)
+    subprocess.run([
+        ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', source, '-c', 'copy',
+        '-f', 'dash', '-seg_duration', '1', '-use_template', '0', '-use_timeline', '0',
+        '-init_seg_name', 'init.m4s', '-media_seg_name', 'seg-$Number$.m4s',
+        os.path.join(directory, 'manifest.mpd'),
+    ], check=True)
+    segments = sorted((name for name in os.listdir(directory) if name.startswith('seg-')),
+                      key=lambda name: int(name[4:-4]))
+    return ['init.m4s'] + segments
+
+
+def start_segment_server(root: str, rate_bytes_per_s: float, block_size: int = 16 * 1024):
+    """Servidor local com banda limitada por conexão."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            path = os.path.join(root, self.path.lstrip('/'))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                payload = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            for position in range(0, len(payload), block_size):
+                block = payload[position:position + block_size]
+                try:
+                    self.wfile.write(block)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                time.sleep(len(block) / rate_bytes_per_s)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def make_fake_fragmented_youtubedl(base_url: str, video_fragments: list, audio_fragments: list):
+    class FakeFragmentedYoutubeDL(backend.yt_dlp.YoutubeDL):
+        """YoutubeDL cujo extract_info devolve formatos DASH fragmentados locais."""
+
+        def extract_info(self, url, download=True, *args, **kwargs):
+            ie_result = {
+                'id': 'benchFrag01',
+                'title': 'Benchmark Fragmentos',
+                'webpage_url': url,
+                'extractor': 'fake',
+                'extractor_key': 'Fake',
+                'formats': [{
+                    'format_id': '137',
+                    'url': f'{base_url}/video/manifest.mpd',
+                    'fragment_base_url': f'{base_url}/video/',
+                    'fragments': [{'path': name} for name in video_fragments],
+                    'ext': 'mp4',
+                    'protocol': 'http_dash_segments',
+                    'vcodec': 'avc1.640028',
+                    'acodec': 'none',
+                    'width': 1080,
+                    'height': 1920,
+                }, {
+                    'format_id': '140',
+                    'url': f'{base_url}/audio/manifest.mpd',
+                    'fragment_base_url': f'{base_url}/audio/',
+                    'fragments': [{'path': name} for name in audio_fragments],
+                    'ext': 'm4a',
+                    'protocol': 'http_dash_segments',
+                    'vcodec': 'none',
+                    'acodec': 'mp4a.40.2',
+                }],
+            }
+            return self.process_ie_result(ie_result, download=download)
+
+    return FakeFragmentedYoutubeDL
+
+
+def time_download(video_id: str, output_dir: str = None) -> float:
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        success, artifact, _, error = backend.download_with_ytdlp(video_id, 'best', lambda data: None)
+    elapsed = time.perf_counter() - start
+    if not success:
+        raise RuntimeError(f'download falhou: {error}')
+    if output_dir:
+        validate_output(find_ffmpeg(), artifact.path)
+    artifact.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--seconds', type=int, default=30, help='duração do vídeo sintético')
+    parser.add_argument('--rate-mbps', type=float, default=8, help='banda por conexão em megabits/s')
+    parser.add_argument('--profiles', default='none,conservative,balanced,aggressive')
+    args = parser.parse_args()
+
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        sys.exit('ffmpeg não encontrado (instale ou defina FFMPEG_BINARY)')
+    os.environ['FFMPEG_BINARY'] = ffmpeg
+    os.environ.pop('YOUTUBE_COOKIES_FILE', None)
+    backend.app.logger.setLevel('ERROR')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        video_path, audio_path = os.path.join(tmpdir, 'video.mp4'), os.path.join(tmpdir, 'audio.m4a')
+        make_fixtures(ffmpeg, tmpdir, args.seconds)
+        video_fragments = segment(ffmpeg, video_path, os.path.join(tmpdir, 'video'))
+        audio_fragments = segment(ffmpeg, audio_path, os.path.join(tmpdir, 'audio'))
+        total_mb = (os.path.getsize(video_path) + os.path.getsize(audio_path)) / 1024 / 1024
+
+        server, base_url = start_segment_server(tmpdir, args.rate_mbps * 1e6 / 8)
+        backend.yt_dlp.YoutubeDL = make_fake_fragmented_youtubedl(base_url, video_fragments, audio_fragments)
+
+        print(f'componentes: {total_mb:.1f} MB em {len(video_fragments)} + {len(audio_fragments)} fragmentos, '
+              f'{args.rate_mbps} Mbit/s por conexão, execuções: {args.runs}\n')
+        print(f"{'perfil':<14} {'tempo (s)':>10} {'vazão (Mbit/s)':>15}")
+        for profile in args.profiles.split(','):
+            backend.download_tuning = DownloadTuning(profile)
+            time_download(f'check{profile}', output_dir=tmpdir)
+            elapsed = statistics.median(time_download(f'{profile}{i}') for i in range(args.runs))
+            print(f'{profile:<14} {elapsed:>10.2f} {total_mb * 8 * 1.048576 / elapsed:>15.1f}')
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
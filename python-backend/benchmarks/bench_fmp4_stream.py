@@ -0,0 +1,171 @@
+"""
+Benchmark (e verificação offline) do mux em streaming de pares DASH.
+
+Gera com o ffmpeg um componente só de vídeo (H.264) e um só de áudio (AAC),
+como os formatos DASH do YouTube, e os serve por um servidor HTTP local com
+banda limitada. Um extrator falso do yt-dlp aponta os formatos para ele.
+Compara GET /api/download com:
+- mux em streaming (ffmpeg -> MP4 fragmentado no stdout -> resposta)
+- caminho com arquivo temporário (download dos componentes + merge em disco)
+
+A saída do streaming é validada com o próprio ffmpeg (precisa ter um stream de
+vídeo e um de áudio e decodificar sem erros).
+
+Uso:
+    python benchmarks/bench_fmp4_stream.py [--runs 3] [--seconds 30] [--rate-mbps 20]
+    (ffmpeg no PATH ou em FFMPEG_BINARY)
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ['VIDEO_CACHE_MAX_BYTES'] = '0'
+os.environ['JOB_STORE_BACKEND'] = 'memory'
+
+import app as backend  # noqa: E402
+from bench_passthrough_ttfb import start_throttled_server  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from fmp4_mux import find_ffmpeg  # noqa: E402
+
+
+def make_fixtures(ffmpeg: str, directory: str, seconds: int):
+    """Componentes DASH sintéticos: vídeo H.264 sem áudio e áudio AAC sem vídeo."""
+    video_path = os.path.join(directory, 'video.mp4')
+    audio_path = os.path.join(directory, 'audio.m4a')
+    common = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y']
+    subprocess.run(common + [
+        '-f', 'lavfi', '-i', f'testsrc2=size=720x1280:rate=30:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', '60', '-pix_fmt', 'yuv420p',
+        '-movflags', 'faststart', video_path,
+    ], check=True)
+    subprocess.run(common + [
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:a', 'aac', '-b:a', '128k', '-movflags', 'faststart', audio_path,
+    ], check=True)
+    with open(video_path, 'rb') as f:
+        video = f.read()
+    with open(audio_path, 'rb') as f:
+        audio = f.read()
+    return video, audio
+
+
+def make_fake_dash_youtubedl(video_url: str, video_size: int, audio_url: str, audio_size: int):
+    class FakeDashYoutubeDL(backend.yt_dlp.YoutubeDL):
+        """YoutubeDL cujo extract_info devolve apenas formatos DASH locais."""
+
+        def extract_info(self, url, download=True, *args, **kwargs):
+            ie_result = {
+                'id': 'benchDash01',
+                'title': 'Benchmark DASH',
+                'webpage_url': url,
+                'extractor': 'fake',
+                'extractor_key': 'Fake',
+                'formats': [{
+                    'format_id': '136',
+                    'url': video_url,
+                    'ext': 'mp4',
+                    'protocol': 'http',
+                    'vcodec': 'avc1.4d401f',
+                    'acodec': 'none',
+                    'width': 720,
+                    'height': 1280,
+                    'filesize': video_size,
+                }, {
+                    'format_id': '140',
+                    'url': audio_url,
+                    'ext': 'm4a',
+                    'protocol': 'http',
+                    'vcodec': 'none',
+                    'acodec': 'mp4a.40.2',
+                    'filesize': audio_size,
+                }],
+            }
+            return self.process_ie_result(ie_result, download=download)
+
+    return FakeDashYoutubeDL
+
+
+def time_request(client, token: str, video_id: str, streaming: bool, output_path: str = None):
+    backend.FMP4_STREAMING_ENABLED = streaming
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        response = client.get(f'/api/download?videoId={video_id}&quality=best',
+                              headers={'Authorization': f'Bearer {token}'}, buffered=False)
+        if response.status_code != 200:
+            raise RuntimeError(f'download falhou: HTTP {response.status_code}')
+        chunks = response.iter_encoded()
+        first = next(chunks)
+        ttfb = time.perf_counter() - start
+        with open(output_path or os.devnull, 'wb') as out:
+            out.write(first)
+            for chunk in chunks:
+                out.write(chunk)
+        response.close()
+    return ttfb, time.perf_counter() - start
+
+
+def validate_output(ffmpeg: str, path: str):
+    result = subprocess.run([ffmpeg, '-hide_banner', '-i', path, '-f', 'null', '-'],
+                            capture_output=True, text=True)
+    has_video = 'Video: h264' in result.stderr
+    has_audio = 'Audio: aac' in result.stderr
+    if result.returncode != 0 or not (has_video and has_audio):
+        raise RuntimeError(f'saída do mux inválida:\n{result.stderr[-1000:]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seconds', type=int, default=30, help='duração do vídeo sintético')
+    parser.add_argument('--rate-mbps', type=float, default=20, help='banda da origem em megabits/s')
+    args = parser.parse_args()
+
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        sys.exit('ffmpeg não encontrado (instale ou defina FFMPEG_BINARY)')
+    os.environ['FFMPEG_BINARY'] = ffmpeg
+    backend.app.logger.setLevel('ERROR')
+    backend.PASSTHROUGH_ENABLED = False
+    os.environ.pop('YOUTUBE_COOKIES_FILE', None)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        video, audio = make_fixtures(ffmpeg, tmpdir, args.seconds)
+        rate = args.rate_mbps * 1e6 / 8
+        video_server, video_url = start_throttled_server(video, rate)
+        audio_server, audio_url = start_throttled_server(audio, rate)
+        backend.yt_dlp.YoutubeDL = make_fake_dash_youtubedl(video_url, len(video), audio_url, len(audio))
+
+        with backend.app.app_context():
+            token = create_access_token(identity='1')
+        client = backend.app.test_client()
+
+        # Verificação: a saída do streaming é um MP4 válido com vídeo e áudio
+        output_path = os.path.join(tmpdir, 'streamed.mp4')
+        time_request(client, token, 'fmp4check', True, output_path)
+        validate_output(ffmpeg, output_path)
+
+        total_mb = (len(video) + len(audio)) / 1024 / 1024
+        print(f'componentes: {total_mb:.1f} MB, origem: {args.rate_mbps} Mbit/s, execuções: {args.runs}')
+        print('saída do mux em streaming validada (h264 + aac)\n')
+        print(f"{'modo':<16} {'TTFB (ms)':>10} {'total (ms)':>11}")
+        for label, streaming in (('merge em disco', False), ('fMP4 streaming', True)):
+            results = [time_request(client, token, f'fmp4{int(streaming)}{i}', streaming) for i in range(args.runs)]
+            print(f"{label:<16} {statistics.median(r[0] for r in results) * 1000:>10.1f} "
+                  f"{statistics.median(r[1] for r in results) * 1000:>11.1f}")
+
+        video_server.shutdown()
+        audio_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
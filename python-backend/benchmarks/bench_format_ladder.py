@@ -0,0 +1,125 @@
+"""
+Benchmark de /api/formats com a escada de qualidades (format_ladder).
+
+Parte 1 - montagem da escada: a implementação anterior (lista recriada a cada
+variante H.264 que substitui uma altura, quadrática no número de formatos)
+contra build_format_ladder (uma passada), em info_dicts sintéticos com cada
+vez mais formatos por altura (VP9 antes de H.264, como o YouTube lista).
+
+Parte 2 - GET /api/formats com o info_dict já no cache de informações:
+- sem a escada em cache (desserializar o info_dict e montar a escada)
+- com a escada em cache
+- revalidação com If-None-Match (304)
+
+Uso:
+    python benchmarks/bench_format_ladder.py [--formats 100,1000,5000] [--requests 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_formats.db')}")
+os.environ['JOB_STORE_BACKEND'] = 'memory'
+os.environ['RATE_LIMIT_BACKEND'] = 'memory'
+
+import app as backend  # noqa: E402
+from format_ladder import build_format_ladder  # noqa: E402
+
+HEIGHTS = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+
+
+def legacy_formats(info: dict) -> list:
+    formats = []
+    seen_qualities = set()
+    for fmt in info.get('formats', []):
+        vcodec = fmt.get('vcodec', 'none')
+        if vcodec == 'none' or 'av01' in vcodec.lower():
+            continue
+        height = fmt.get('height')
+        filesize = fmt.get('filesize') or fmt.get('filesize_approx', 0)
+        if height:
+            quality_key = f"{height}p"
+            if quality_key not in seen_qualities or 'avc1' in vcodec.lower():
+                if quality_key in seen_qualities:
+                    formats = [f for f in formats if f.get('height') != height]
+                seen_qualities.add(quality_key)
+                formats.append({'format_id': fmt.get('format_id'), 'height': height, 'filesize': filesize,
+                                'filesize_mb': round(filesize / (1024 * 1024), 2) if filesize else None})
+    formats.sort(key=lambda x: x['height'], reverse=True)
+    return formats
+
+
+def synthetic_info(video_id: str, count: int, rng: random.Random) -> dict:
+    formats = [{'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'ext': 'm4a', 'abr': 129,
+                'filesize': 2_000_000, 'url': 'https://example.invalid/a'}]
+    for index in range(count):
+        height = HEIGHTS[index % len(HEIGHTS)]
+        vcodec = 'vp09.00.40.08' if index < count // 2 else 'avc1.64001F'
+        formats.append({
+            'format_id': str(1000 + index), 'vcodec': vcodec, 'acodec': 'none', 'ext': 'mp4', 'height': height,
+            'width': height * 16 // 9, 'tbr': rng.randint(100, 5000), 'filesize': rng.randint(10 ** 6, 10 ** 8),
+            'url': f'https://example.invalid/{index}',
+        })
+    return {'id': video_id, 'title': 'Vídeo de teste', 'formats': formats}
+
+
+def best_time(fn, runs: int = 3) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def request_times(client, video_id: str, requests: int, headers=None, before=None) -> list:
+    durations = []
+    for _ in range(requests):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = client.get(f'/api/formats?videoId={video_id}', headers=headers or {})
+        durations.append(time.perf_counter() - started)
+        assert response.status_code in (200, 304), response.status_code
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--formats', default='100,1000,5000', help='formatos de vídeo por info_dict')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print(f"{'formatos':>9} {'anterior (ms)':>14} {'escada (ms)':>12}")
+    for count in (int(value) for value in args.formats.split(',')):
+        info = synthetic_info('bench', count, rng)
+        legacy = best_time(lambda: legacy_formats(info))
+        ladder = best_time(lambda: build_format_ladder('bench', info))
+        print(f'{count:>9} {legacy * 1000:>14.2f} {ladder * 1000:>12.3f}')
+
+    # Info_dict com tamanho típico de um Short (~40 formatos)
+    video_id = 'benchFormat'
+    backend.info_cache.set(video_id, synthetic_info(video_id, 40, rng))
+    client = backend.app.test_client()
+    etag = client.get(f'/api/formats?videoId={video_id}').headers['ETag']
+
+    print(f"\n{'GET /api/formats':<28} {'média (us)':>10} {'p50 (us)':>10}")
+    for label, durations in (
+        ('sem escada em cache', request_times(client, video_id, args.requests // 10,
+                                              before=lambda: backend.format_ladders._ladders.pop(video_id))),
+        ('escada em cache', request_times(client, video_id, args.requests)),
+        ('If-None-Match (304)', request_times(client, video_id, args.requests, headers={'If-None-Match': etag})),
+    ):
+        print(f'{label:<28} {statistics.mean(durations) * 1e6:>10.1f} {statistics.median(durations) * 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark do expansor de links encurtados (link_expander.LinkExpander) contra
+um encurtador local: um ThreadingHTTPServer que responde com redirecionamentos
+(/short/<n> -> /short/hop/<n> -> https://shopee.com.br/...) após um atraso
+fixo, recusa HEAD em parte dos links (405, para exercitar o GET) e conta as
+requisições simultâneas.
+
+Compara:
+- sequencial: requests.head(..., allow_redirects=True) link a link, sem pool
+  de conexões (a loja final nunca é visitada: o stand-in para no último salto)
+- expansor, cache frio: concorrência limitada e no máximo --per-host
+  requisições simultâneas no encurtador
+- expansor, cache quente: mesmos links de novo (cache SQLite)
+
+Uso:
+    python benchmarks/bench_link_expander.py [--links 40] [--delay 0.05] [--concurrency 8] [--per-host 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from link_expander import LinkExpander, SQLiteLinkCache  # noqa: E402
+from link_extractor import LinkExtractor  # noqa: E402
+
+
+class Shortener(BaseHTTPRequestHandler):
+    delay = 0.05
+    active = 0
+    peak = 0
+    total = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _redirect(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.total += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            time.sleep(cls.delay)
+            parts = self.path.strip('/').split('/')
+            if self.command == 'HEAD' and int(parts[-1]) % 5 == 0:
+                self.send_response(405)
+            elif parts[1] == 'hop':
+                self.send_response(301)
+                self.send_header('Location', f'https://shopee.com.br/produto-i.{parts[-1]}')
+            else:
+                self.send_response(302)
+                self.send_header('Location', f'/short/hop/{parts[-1]}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    do_HEAD = _redirect
+    do_GET = _redirect
+
+
+def sequential(urls: list) -> dict:
+    results = {}
+    for url in urls:
+        # Sem pool: cada link abre suas próprias conexões
+        response = requests.head(url, allow_redirects=False, timeout=5)
+        if response.status_code == 405:
+            response = requests.get(url, allow_redirects=False, timeout=5, stream=True)
+        hop = requests.compat.urljoin(url, response.headers['Location'])
+        response = requests.head(hop, allow_redirects=False, timeout=5)
+        if response.status_code == 405:
+            response = requests.get(hop, allow_redirects=False, timeout=5, stream=True)
+        results[url] = response.headers['Location']
+    return results
+
+
+def measure(label: str, fn, urls: list):
+    Shortener.peak = Shortener.total = 0
+    started = time.perf_counter()
+    results = fn(urls)
+    elapsed = time.perf_counter() - started
+    print(f'{label:<26} {elapsed * 1000:>10.0f} {len(results):>10} {Shortener.total:>12} {Shortener.peak:>10}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--links', type=int, default=40)
+    parser.add_argument('--delay', type=float, default=0.05, help='atraso de cada resposta do encurtador (s)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--per-host', type=int, default=4)
+    args = parser.parse_args()
+
+    Shortener.delay = args.delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Shortener)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    urls = [f'{base}/short/{n}' for n in range(1, args.links + 1)]
+
+    extractor = LinkExtractor(shortener_domains=('127.0.0.1/short/',))
+    cache = SQLiteLinkCache(os.path.join(tempfile.mkdtemp(), 'bench_links.db'))
+    expander = LinkExpander(cache, max_concurrency=args.concurrency, per_host=args.per_host, budget=60,
+                            is_shortener=extractor.is_shortener, allow_private_hosts=True)
+
+    print(f'{args.links} links, atraso {args.delay * 1000:.0f} ms, concorrência {args.concurrency}, '
+          f'por host {args.per_host}\n')
+    print(f"{'cenário':<26} {'tempo (ms)':>10} {'expandidos':>10} {'requisições':>12} {'pico host':>10}")
+    expected = measure('sequencial', sequential, urls)
+    cold = measure('expansor, cache frio', expander.expand_many, urls)
+    warm = measure('expansor, cache quente', expander.expand_many, urls)
+    assert cold == expected and warm == expected, 'expansões divergentes'
+    print(f'\n{expander.stats()}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Micro-benchmark do extrator de links de produtos (link_extractor.LinkExtractor)
+contra a implementação anterior (três re.findall com re.IGNORECASE, um deles
+sem âncora: https?://[^\\s\\)]+(?:shopee|amazon|...)[^\\s\\)]*).
+
+Dois corpora sintéticos em tamanhos crescentes:
+- típico: texto com links de lojas, encurtadores e outros sites
+- adversarial: um token longo sem espaços com vários 'https://' encadeados
+  (redirecionadores, URLs coladas), onde o padrão sem âncora percorre o
+  resto do token a cada ocorrência e o tempo cresce de forma quadrática
+
+O tempo por KB do novo extrator deve ficar constante (linear no tamanho).
+
+Uso:
+    python benchmarks/bench_link_extractor.py [--sizes 4,16,64] [--runs 3]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from link_extractor import LinkExtractor, LinkFilter  # noqa: E402
+
+WORDS = ('produto', 'oferta', 'confira', 'link', 'na', 'descrição', 'cupom', 'frete', 'grátis', 'vídeo', 'novo')
+LINKS = (
+    'https://shopee.com.br/produto-i.{n}.{m}?sp_atk=abc',
+    'https://amzn.to/{n}x',
+    'https://www.amazon.com.br/dp/B0{n}?tag=canal-20',
+    'https://bit.ly/{n}',
+    'https://instagram.com/canal{n}',
+    'https://www.mercadolivre.com.br/p/MLB{n}',
+    '(https://s.shopee.com.br/{n})',
+)
+
+
+def legacy_extract(description: str, link_filter: str = None) -> list:
+    patterns = [
+        r'https?://(?:www\.)?(?:shopee|amazon|aliexpress|magazineluiza|mercadolivre|americanas|submarino|shoptime)\.(?:com\.br|com)/[^\s\)]+',
+        r'https?://(?:amzn\.to|bit\.ly|t\.co|short\.link|tinyurl)/[^\s\)]+',
+        r'https?://[^\s\)]+(?:shopee|amazon|aliexpress|magazineluiza|mercadolivre)[^\s\)]*',
+    ]
+    links = set()
+    for pattern in patterns:
+        for match in re.findall(pattern, description, re.IGNORECASE):
+            url = match.rstrip('.,;:!?)]}')
+            if link_filter and link_filter.strip() and link_filter.lower() not in url.lower():
+                continue
+            links.add(url)
+    return sorted(links)
+
+
+def typical_description(size_kb: int, rng: random.Random) -> str:
+    parts = []
+    total = 0
+    while total < size_kb * 1024:
+        if rng.random() < 0.1:
+            part = rng.choice(LINKS).format(n=rng.randint(1, 10 ** 6), m=rng.randint(1, 10 ** 6))
+        else:
+            part = rng.choice(WORDS)
+        parts.append(part)
+        total += len(part) + 1
+    return ' '.join(parts)
+
+
+def adversarial_description(size_kb: int, rng: random.Random) -> str:
+    # Um único token sem espaços, com 'https://' a cada ~40 caracteres e sem nome de loja
+    parts = []
+    total = 0
+    while total < size_kb * 1024:
+        parts.append(f'https://r{len(parts)}.example.net/?u=' + 'x' * rng.randint(5, 25))
+        total += len(parts[-1])
+    return ''.join(parts)
+
+
+def best_time(fn, text: str, runs: int) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='4,16,64', help='tamanhos das descrições em KB')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    extractor = LinkExtractor()
+    link_filter = LinkFilter.parse('shopee')
+
+    print(f"{'corpus':<12} {'KB':>6} {'anterior (ms)':>14} {'novo (ms)':>10} {'anterior us/KB':>15} "
+          f"{'novo us/KB':>11} {'links':>6}")
+    for corpus, build in (('típico', typical_description), ('adversarial', adversarial_description)):
+        for size in (int(value) for value in args.sizes.split(',')):
+            text = build(size, rng)
+            legacy = best_time(lambda t: legacy_extract(t, 'shopee'), text, args.runs)
+            new = best_time(lambda t: extractor.extract(t, link_filter), text, args.runs)
+            found = len(extractor.extract(text))
+            print(f'{corpus:<12} {size:>6} {legacy * 1000:>14.1f} {new * 1000:>10.1f} {legacy * 1e6 / size:>15.0f} '
+                  f'{new * 1e6 / size:>11.0f} {found:>6}')
+
+
+if __name__ == '__main__':
+    main()
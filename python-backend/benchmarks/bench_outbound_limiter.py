@@ -0,0 +1,79 @@
+"""
+Benchmark do limitador de saída (rate_limit.OutboundLimiter) compartilhado
+entre processos, como os workers do gunicorn.
+
+Vários processos disputam o mesmo balde SQLite: parte faz requisições
+interativas e parte em segundo plano (batch/prefetch). Mede a vazão
+sustentada (deve ficar no ritmo configurado, sem rajadas acima do burst) e a
+espera de cada prioridade (a interativa deve esperar bem menos).
+
+Uso:
+    python benchmarks/bench_outbound_limiter.py [--workers 4] [--seconds 10] [--rate 120] [--burst 10]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import BACKGROUND, INTERACTIVE, OutboundLimiter, RateLimited, SQLiteBucketBackend  # noqa: E402
+
+
+def worker(path: str, priority: str, rate: float, burst: float, seconds: float, results):
+    limiter = OutboundLimiter(SQLiteBucketBackend(path), global_rate_per_minute=rate, global_burst=burst,
+                              identity_rate_per_minute=0, max_wait={INTERACTIVE: seconds, BACKGROUND: seconds})
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            waited = limiter.acquire(priority=priority)
+        except RateLimited:
+            continue
+        results.put((priority, time.time(), waited))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='processos por prioridade')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=120, help='requisições por minuto')
+    parser.add_argument('--burst', type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'buckets.db')
+        SQLiteBucketBackend(path)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(path, priority, args.rate, args.burst,
+                                                                    args.seconds, results))
+                     for priority in (INTERACTIVE, BACKGROUND) for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        samples = []
+        while not results.empty():
+            samples.append(results.get())
+
+    # Teto teórico no intervalo realmente observado: burst inicial + reposição
+    span = max(t for _, t, _ in samples) - min(t for _, t, _ in samples) if samples else 0.0
+    allowed = args.burst + args.rate / 60 * span
+    print(f'{len(processes)} processos, {args.rate:.0f}/min, burst {args.burst:.0f}, {args.seconds:.0f}s')
+    print(f'requisições liberadas: {len(samples)} (teto teórico: {allowed:.0f}), '
+          f'vazão após o burst: {(len(samples) - args.burst) / span * 60 if span else 0:.0f}/min\n')
+    print(f"{'prioridade':<12} {'liberadas':>10} {'espera p50 (ms)':>16} {'espera p95 (ms)':>16}")
+    for priority in (INTERACTIVE, BACKGROUND):
+        waits = sorted(waited for p, _, waited in samples if p == priority)
+        if not waits:
+            print(f'{priority:<12} {0:>10}')
+            continue
+        p95 = waits[round(0.95 * (len(waits) - 1))]
+        print(f'{priority:<12} {len(waits):>10} {statistics.median(waits) * 1000:>16.0f} {p95 * 1000:>16.0f}')
+
+
+if __name__ == '__main__':
+    main()
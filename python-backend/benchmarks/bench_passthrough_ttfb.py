@@ -0,0 +1,118 @@
+"""
+Benchmark do tempo até o primeiro byte (TTFB) de GET /api/download para um
+formato progressivo: repasse direto (PASSTHROUGH_ENABLED) x caminho com
+arquivo temporário (download completo pelo yt-dlp antes de responder).
+
+Um servidor HTTP local serve um MP4 sintético limitado a --rate-mbps (com
+suporte a Range), e um extrator falso do yt-dlp aponta o formato 18
+(progressivo) para ele, então nada acessa o YouTube.
+
+Uso:
+    python benchmarks/bench_passthrough_ttfb.py [--runs 3] [--size-mb 8] [--rate-mbps 40]
+"""
+import argparse
+import contextlib
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ['VIDEO_CACHE_MAX_BYTES'] = '0'
+os.environ['JOB_STORE_BACKEND'] = 'memory'
+
+import app as backend  # noqa: E402
+from bench_download_latency import make_fake_youtubedl  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+
+def start_throttled_server(payload: bytes, rate_bytes_per_s: float, block_size: int = 64 * 1024):
+    """Servidor local com Range e banda limitada (simula a CDN do YouTube)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2) or end), end)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            position = start
+            while position <= end:
+                block = payload[position:min(position + block_size, end + 1)]
+                try:
+                    self.wfile.write(block)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                position += len(block)
+                time.sleep(len(block) / rate_bytes_per_s)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/fixture.mp4'
+
+
+def time_request(client, token: str, video_id: str, passthrough: bool):
+    backend.PASSTHROUGH_ENABLED = passthrough
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        response = client.get(f'/api/download?videoId={video_id}&quality=best',
+                              headers={'Authorization': f'Bearer {token}'}, buffered=False)
+        chunks = response.iter_encoded()
+        first = next(chunks)
+        ttfb = time.perf_counter() - start
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        response.close()
+    if response.status_code != 200:
+        raise RuntimeError(f'download falhou: HTTP {response.status_code}')
+    return ttfb, time.perf_counter() - start, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--size-mb', type=float, default=8)
+    parser.add_argument('--rate-mbps', type=float, default=40, help='banda da origem em megabits/s')
+    args = parser.parse_args()
+
+    backend.app.logger.setLevel('ERROR')
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    server, fixture_url = start_throttled_server(payload, args.rate_mbps * 1e6 / 8)
+    backend.yt_dlp.YoutubeDL = make_fake_youtubedl(fixture_url, len(payload))
+    os.environ.pop('YOUTUBE_COOKIES_FILE', None)
+
+    with backend.app.app_context():
+        token = create_access_token(identity='1')
+    client = backend.app.test_client()
+
+    print(f'arquivo: {args.size_mb} MB, origem: {args.rate_mbps} Mbit/s, execuções: {args.runs}\n')
+    print(f"{'modo':<16} {'TTFB (ms)':>10} {'total (ms)':>11}")
+    for label, passthrough in (('arquivo temp.', False), ('pass-through', True)):
+        results = [time_request(client, token, f'ttfb{label[:4]}{i}', passthrough) for i in range(args.runs)]
+        assert all(size == len(payload) for _, _, size in results)
+        print(f"{label:<16} {statistics.median(r[0] for r in results) * 1000:>10.1f} "
+              f"{statistics.median(r[1] for r in results) * 1000:>11.1f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Teste de carga dos streams de progresso (SSE) nos dois modos de execução:
+
+- sync: gunicorn app:app com workers síncronos (como no Procfile)
+- async: uvicorn asgi:app (modo ASGI)
+
+Sobe cada servidor com um banco e um job_store SQLite temporários, cria um
+usuário e um job que nunca termina, e abre N conexões simultâneas em
+/api/jobs/<id>/events. Mede quantas recebem o primeiro evento dentro do
+timeout, o tempo até o primeiro evento e quantas continuam abertas até o fim.
+No modo sync cada stream prende um worker (ou thread), então as conexões
+além de workers x threads ficam na fila.
+
+Requer gunicorn e uvicorn instalados (o modo ausente é pulado).
+
+Uso:
+    python benchmarks/bench_sse_concurrency.py [--connections 1000] [--hold 10] [--timeout 5]
+        [--modes sync,async] [--sync-workers 1] [--sync-threads 1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode: str, port: int, args) -> list:
+    if mode == 'sync':
+        if not shutil.which('gunicorn'):
+            return None
+        return ['gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--workers', str(args.sync_workers),
+                '--threads', str(args.sync_threads), '--timeout', '120', '--log-level', 'warning']
+    try:
+        import uvicorn  # noqa: F401  pylint: disable=unused-import,import-outside-toplevel
+    except ImportError:
+        return None
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+            '--log-level', 'warning', '--backlog', str(max(2048, args.connections))]
+
+
+def wait_ready(base: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base + '/api/health', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('servidor não respondeu a /api/health')
+
+
+def register(base: str) -> tuple:
+    body = json.dumps({'email': f'bench{time.time_ns()}@example.com', 'password': 'benchmark'}).encode()
+    request = urllib.request.Request(base + '/api/auth/register', data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    data = json.loads(urllib.request.urlopen(request, timeout=10).read())
+    return data['access_token'], str(data['user']['id'])
+
+
+def rss_mb(pid: int) -> float:
+    """Memória residente do servidor e dos seus processos filhos (workers)."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration):
+            continue
+    return total / 1024
+
+
+async def open_stream(port: int, path: str, timeout: float, hold_until: float) -> dict:
+    result = {'first_event': None, 'alive': False}
+    started = time.monotonic()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        await writer.drain()
+        while True:
+            line = await asyncio.wait_for(reader.readline(), max(0.01, started + timeout - time.monotonic()))
+            if not line:
+                return result
+            if line.startswith(b'data:'):
+                result['first_event'] = time.monotonic() - started
+                break
+        # Manter a conexão aberta até o fim, lendo heartbeats/eventos
+        while time.monotonic() < hold_until:
+            try:
+                line = await asyncio.wait_for(reader.readline(), hold_until - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                return result
+        result['alive'] = True
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+    return result
+
+
+async def run_load(port: int, path: str, connections: int, timeout: float, hold: float) -> list:
+    hold_until = time.monotonic() + timeout + hold
+    return await asyncio.gather(*(open_stream(port, path, timeout, hold_until) for _ in range(connections)))
+
+
+def bench_mode(mode: str, args) -> dict:
+    port = free_port()
+    command = server_command(mode, port, args)
+    if command is None:
+        return None
+    tmpdir = tempfile.mkdtemp(prefix='bench_sse_')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{tmpdir}/users.db',
+        JOB_STORE_BACKEND='sqlite',
+        JOB_STORE_PATH=os.path.join(tmpdir, 'jobs.db'),
+        JOB_ARTIFACT_DIR=os.path.join(tmpdir, 'artifacts'),
+        JOB_EVENTS_MAX_SECONDS=str(int(args.timeout + args.hold + 60)),
+        RATE_LIMIT_BACKEND='memory',
+        VIDEO_CACHE_MAX_BYTES='0',
+        JWT_SECRET_KEY='bench-secret-key-with-enough-length-for-hs256',
+    )
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        wait_ready(base)
+        token, user_id = register(base)
+
+        # O job fica em 'queued' para sempre: cada stream permanece aberto
+        from jobs import JobStore, SQLiteJobBackend  # pylint: disable=import-outside-toplevel
+        job = JobStore(SQLiteJobBackend(env['JOB_STORE_PATH']), ttl_seconds=3600,
+                       artifact_dir=env['JOB_ARTIFACT_DIR']).create('bench', 'best', user_id)
+
+        path = f"/api/jobs/{job['id']}/events?token={token}"
+        results = asyncio.run(run_load(port, path, args.connections, args.timeout, args.hold))
+        memory = rss_mb(server.pid)
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    first = sorted(r['first_event'] for r in results if r['first_event'] is not None)
+    return {
+        'connected': len(first),
+        'alive': sum(1 for r in results if r['alive']),
+        'p50': statistics.median(first) * 1000 if first else None,
+        'p95': first[round(0.95 * (len(first) - 1))] * 1000 if first else None,
+        'rss': memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--hold', type=float, default=10, help='segundos com os streams abertos')
+    parser.add_argument('--timeout', type=float, default=5, help='espera máxima pelo primeiro evento')
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--sync-workers', type=int, default=1)
+    parser.add_argument('--sync-threads', type=int, default=1)
+    args = parser.parse_args()
+
+    # Cada conexão usa um descritor no cliente e outro no servidor
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.connections * 2 + 100 > hard:
+        print(f'aviso: limite de arquivos abertos ({hard}) pode ser baixo para {args.connections} conexões')
+
+    print(f'{args.connections} conexões SSE simultâneas, timeout {args.timeout:.0f}s, '
+          f'mantidas por {args.hold:.0f}s (sync: {args.sync_workers} worker(s) x {args.sync_threads} thread(s))\n')
+    print(f"{'modo':<6} {'conectadas':>10} {'abertas':>8} {'1º evento p50 (ms)':>19} "
+          f"{'1º evento p95 (ms)':>19} {'RSS (MB)':>9}")
+    for mode in args.modes.split(','):
+        result = bench_mode(mode.strip(), args)
+        if result is None:
+            print(f'{mode:<6} (servidor não instalado)')
+            continue
+        p50 = f"{result['p50']:.0f}" if result['p50'] is not None else '-'
+        p95 = f"{result['p95']:.0f}" if result['p95'] is not None else '-'
+        print(f"{mode:<6} {result['connected']:>10} {result['alive']:>8} {p50:>19} {p95:>19} {result['rss']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
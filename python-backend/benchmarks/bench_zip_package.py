@@ -0,0 +1,124 @@
+"""
+Benchmark do empacotamento ZIP de /api/download-with-metadata.
+
+Compara o create_video_package atual (ZIP em streaming, vídeo em ZIP_STORED)
+com a versão anterior (ZIP inteiro em BytesIO com ZIP_DEFLATED após
+video_buffer.read()), medindo tempo de CPU e pico de memória (RSS).
+
+Cada variante roda em um subprocesso próprio, para que o pico de RSS de uma
+não contamine a outra. O conteúdo do vídeo é aleatório, como um MP4 real
+(já comprimido).
+
+Uso:
+    python benchmarks/bench_zip_package.py [--size-mb 64] [--runs 3]
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+METADATA = {
+    'title': 'Benchmark Short',
+    'channel': 'Canal',
+    'published_at': '20240101',
+    'description': 'Descrição com link https://amzn.to/abc123 ' * 20,
+    'links': ['https://amzn.to/abc123'],
+}
+
+
+def legacy_create_video_package(video_buffer: BytesIO, video_filename: str, metadata: dict) -> BytesIO:
+    """Implementação anterior (referência): ZIP completo em memória com deflate."""
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        video_buffer.seek(0)
+        zip_file.writestr(video_filename, video_buffer.read())
+        json_content = json.dumps(metadata, ensure_ascii=False, indent=2)
+        zip_file.writestr('metadata.json', json_content.encode('utf-8'))
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(variant: str, video_path: str) -> dict:
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    import app as backend
+    from artifacts import DownloadArtifact
+
+    rss_before = max_rss_mb()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    total = 0
+
+    if variant == 'legacy':
+        # O fluxo antigo recebia o vídeo inteiro em um BytesIO
+        with open(video_path, 'rb') as f:
+            video_buffer = BytesIO(f.read())
+        zip_buffer = legacy_create_video_package(video_buffer, 'video.mp4', METADATA)
+        total = len(zip_buffer.getvalue())
+    else:
+        artifact = DownloadArtifact(video_path, 'video.mp4')
+        for chunk in backend.create_video_package(artifact, 'video.mp4', METADATA, True, True, True):
+            total += len(chunk)
+
+    return {
+        'variant': variant,
+        'cpu_s': time.process_time() - cpu_start,
+        'wall_s': time.perf_counter() - wall_start,
+        'peak_rss_mb': max_rss_mb(),
+        'rss_growth_mb': max_rss_mb() - rss_before,
+        'zip_bytes': total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--variant', choices=('legacy', 'stream'), help=argparse.SUPPRESS)
+    parser.add_argument('--video', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.video)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        video_path = os.path.join(tmpdir, 'video.mp4')
+        with open(video_path, 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        print(f"Vídeo sintético: {args.size_mb} MB, {args.runs} execução(ões) por variante\n")
+        print(f"{'variante':<8} {'CPU (s)':>9} {'total (s)':>10} {'pico RSS (MB)':>14} {'+RSS (MB)':>10} {'ZIP (MB)':>9}")
+        for variant in ('legacy', 'stream'):
+            results = []
+            for _ in range(args.runs):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--variant', variant, '--video', video_path],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+            print(f"{variant:<8} "
+                  f"{statistics.median(r['cpu_s'] for r in results):>9.2f} "
+                  f"{statistics.median(r['wall_s'] for r in results):>10.2f} "
+                  f"{statistics.median(r['peak_rss_mb'] for r in results):>14.1f} "
+                  f"{statistics.median(r['rss_growth_mb'] for r in results):>10.1f} "
+                  f"{results[0]['zip_bytes'] / 1024 / 1024:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import glob
+import http.cookiejar
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Mesmo parser do yt-dlp (aceita as variações de cookies.txt que ele aceita)
+    from yt_dlp.cookies import YoutubeDLCookieJar as CookieJar
+except ImportError:
+    CookieJar = http.cookiejar.MozillaCookieJar
+
+
+class CookieIdentity:
+    """Um arquivo de cookies (conta) do pool"""
+
+    def __init__(self, name: str, path: str, cookie_count: int, mtime: float):
+        self.name = name
+        self.path = path
+        self.cookie_count = cookie_count
+        self.mtime = mtime
+        self.in_flight = 0
+        self.uses = 0
+        self.failures = 0
+        self.blocks = 0
+        self.consecutive_blocks = 0
+        self.quarantined_until = 0.0
+        self.last_error = None
+
+    def quarantined(self, now: float) -> bool:
+        return now < self.quarantined_until
+
+
+def parse_cookie_file(path: str) -> int:
+    """
+    Valida o arquivo no formato Netscape (cookies.txt) e retorna quantos
+    cookies ele tem. Levanta exceção se o arquivo for inválido.
+    """
+    jar = CookieJar(path)
+    jar.load(ignore_discard=True, ignore_expires=True)
+    return len(jar)
+
+
+class CookiePool:
+    """
+    Pool de identidades (arquivos de cookies) usadas pelo yt-dlp.
+
+    - pick(): escolhe a identidade da próxima requisição, em rodízio
+      ('round_robin') ou pela menor quantidade de requisições em andamento
+      ('least_loaded', desempate pela menos usada)
+    - using(path): marca a identidade como em uso durante a requisição
+    - report(path, error, blocked): uma detecção de bot coloca a identidade em
+      quarentena por quarantine_seconds, dobrando a cada bloqueio seguido
+      (até max_quarantine); um sucesso zera a contagem
+
+    Os arquivos são validados uma única vez no carregamento (e de novo só se
+    forem modificados); se todas as identidades estiverem em quarentena, a que
+    sai primeiro é usada, já que seguir sem cookies seria pior.
+    """
+
+    def __init__(self, sources: list, mode: str = 'least_loaded', quarantine_seconds: float = 600.0,
+                 max_quarantine: float = 3600.0):
+        self.mode = mode if mode in ('least_loaded', 'round_robin') else 'least_loaded'
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine = max_quarantine
+        self._identities = []
+        self._by_path = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        for name, path in sources:
+            self._add(name, path)
+
+    def _add(self, name: str, path: str):
+        try:
+            count = parse_cookie_file(path)
+        except (OSError, http.cookiejar.LoadError) as exc:
+            logger.error("Arquivo de cookies inválido (%s): %s", name, exc)
+            return
+        if not count:
+            logger.warning("Arquivo de cookies sem cookies (%s); ignorando", name)
+            return
+        identity = CookieIdentity(name, path, count, os.path.getmtime(path))
+        self._identities.append(identity)
+        self._by_path[path] = identity
+
+    def __len__(self):
+        return len(self._identities)
+
+    def available_count(self) -> int:
+        """Quantas identidades não estão em quarentena."""
+        now = time.time()
+        with self._lock:
+            return sum(1 for identity in self._identities if not identity.quarantined(now))
+
+    def identity_for(self, path: str):
+        return self._by_path.get(path)
+
+    def pick(self):
+        """Caminho do arquivo de cookies para a próxima requisição (None se o pool estiver vazio)."""
+        if not self._identities:
+            return None
+        now = time.time()
+        with self._lock:
+            available = [identity for identity in self._identities if not identity.quarantined(now)]
+            if not available:
+                identity = min(self._identities, key=lambda item: item.quarantined_until)
+            elif self.mode == 'round_robin':
+                identity = available[self._next % len(available)]
+                self._next += 1
+            else:
+                identity = min(available, key=lambda item: (item.in_flight, item.uses))
+            identity.uses += 1
+        self._refresh(identity)
+        return identity.path
+
+    def _refresh(self, identity: CookieIdentity):
+        """Revalida o arquivo se foi modificado (ex.: cookies renovados pelo yt-dlp)."""
+        try:
+            mtime = os.path.getmtime(identity.path)
+        except OSError:
+            return
+        if mtime == identity.mtime:
+            return
+        try:
+            identity.cookie_count = parse_cookie_file(identity.path)
+        except (OSError, http.cookiejar.LoadError) as exc:
+            logger.warning("Arquivo de cookies %s ficou inválido: %s", identity.name, exc)
+        identity.mtime = mtime
+
+    @contextmanager
+    def using(self, path: str):
+        identity = self._by_path.get(path)
+        if identity is None:
+            yield None
+            return
+        with self._lock:
+            identity.in_flight += 1
+        try:
+            yield identity
+        finally:
+            with self._lock:
+                identity.in_flight -= 1
+
+    def report(self, path: str, error=None, blocked: bool = False):
+        """Registra o resultado de uma requisição feita com a identidade."""
+        identity = self._by_path.get(path)
+        if identity is None:
+            return
+        with self._lock:
+            if error is None:
+                identity.consecutive_blocks = 0
+                return
+            identity.failures += 1
+            identity.last_error = str(error)[:300]
+            if not blocked or identity.quarantined(time.time()):
+                return
+            identity.blocks += 1
+            identity.consecutive_blocks += 1
+            duration = min(self.quarantine_seconds * 2 ** (identity.consecutive_blocks - 1), self.max_quarantine)
+            identity.quarantined_until = time.time() + duration
+        logger.warning("Identidade de cookies %s em quarentena por %.0fs após bloqueio", identity.name, duration)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            identities = [{
+                'name': identity.name,
+                'cookies': identity.cookie_count,
+                'in_flight': identity.in_flight,
+                'uses': identity.uses,
+                'failures': identity.failures,
+                'blocks': identity.blocks,
+                'quarantined_for': max(0, int(identity.quarantined_until - now)),
+            } for identity in self._identities]
+        return {
+            'mode': self.mode,
+            'size': len(identities),
+            'available': sum(1 for identity in identities if not identity['quarantined_for']),
+            'identities': identities,
+        }
+
+
+def _write_temp_cookie_file(content: str) -> str:
+    fd, path = tempfile.mkstemp(prefix='yt_cookies_', suffix='.txt', text=True)
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    return path
+
+
+def load_cookie_sources_from_env() -> list:
+    """
+    Fontes de cookies, em ordem:
+    - YOUTUBE_COOKIES_FILE: caminho de um arquivo (ou vários, separados por os.pathsep)
+    - YOUTUBE_COOKIES_DIR: todos os arquivos *.txt do diretório
+    - YOUTUBE_COOKIES_CONTENT e YOUTUBE_COOKIES_CONTENT_<N>: conteúdo dos arquivos
+      (gravado uma vez em arquivos temporários)
+
+    Returns:
+        Lista de (nome, caminho)
+    """
+    sources = []
+    for path in (os.environ.get('YOUTUBE_COOKIES_FILE') or '').split(os.pathsep):
+        if path and os.path.exists(path):
+            sources.append((os.path.basename(path), path))
+
+    cookies_dir = os.environ.get('YOUTUBE_COOKIES_DIR')
+    if cookies_dir:
+        for path in sorted(glob.glob(os.path.join(cookies_dir, '*.txt'))):
+            sources.append((os.path.basename(path), path))
+
+    contents = []
+    if (os.environ.get('YOUTUBE_COOKIES_CONTENT') or '').strip():
+        contents.append(('env', os.environ['YOUTUBE_COOKIES_CONTENT']))
+    numbered = sorted((key for key in os.environ if key.startswith('YOUTUBE_COOKIES_CONTENT_')),
+                      key=lambda key: (len(key), key))
+    for key in numbered:
+        if os.environ[key].strip():
+            contents.append((f"env-{key.rsplit('_', 1)[-1].lower()}", os.environ[key]))
+    for name, content in contents:
+        try:
+            sources.append((name, _write_temp_cookie_file(content)))
+        except OSError as exc:
+            logger.error("Erro ao criar arquivo de cookies temporário (%s): %s", name, exc)
+
+    # O mesmo arquivo pode aparecer em mais de uma fonte
+    unique = {}
+    for name, path in sources:
+        unique.setdefault(os.path.realpath(path), (name, path))
+    return list(unique.values())
+
+
+def create_cookie_pool_from_env() -> CookiePool:
+    """
+    Cria o pool a partir das variáveis de ambiente (fontes em
+    load_cookie_sources_from_env) e de:
+    - YOUTUBE_COOKIES_ROTATION: 'least_loaded' (padrão) ou 'round_robin'
+    - YOUTUBE_COOKIES_QUARANTINE: quarentena após bloqueio em segundos (padrão: 600)
+    - YOUTUBE_COOKIES_MAX_QUARANTINE: limite da quarentena em segundos (padrão: 3600)
+    """
+    return CookiePool(
+        load_cookie_sources_from_env(),
+        mode=os.environ.get('YOUTUBE_COOKIES_ROTATION', 'least_loaded').lower(),
+        quarantine_seconds=float(os.environ.get('YOUTUBE_COOKIES_QUARANTINE', '600')),
+        max_quarantine=float(os.environ.get('YOUTUBE_COOKIES_MAX_QUARANTINE', '3600')),
+    )
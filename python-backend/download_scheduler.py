@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Fila de downloads cheia (global ou do usuário)"""
+
+    def __init__(self, message: str, retry_after: int, per_user: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.per_user = per_user
+
+
+class DownloadTicket:
+    """Trabalho aguardando (ou em execução) no agendador"""
+
+    def __init__(self, job, user_key: str, on_position=None):
+        self.job = job
+        self.user_key = user_key
+        self.on_position = on_position
+        self.position = None
+        self.enqueued_at = time.time()
+
+    def notify_position(self, position):
+        if position == self.position or self.on_position is None:
+            return
+        self.position = position
+        try:
+            self.on_position(position)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Erro ao informar posição na fila: %s", exc)
+
+
+class DownloadScheduler:
+    """
+    Agendador central de downloads com concorrência limitada.
+
+    - max_concurrent: quantos downloads (yt-dlp) rodam ao mesmo tempo
+    - max_merges: quantos merges do ffmpeg rodam ao mesmo tempo
+      (acquire_merge_slot()/release_merge_slot())
+    - max_queue / max_queue_per_user: tamanho da fila; acima disso submit()
+      falha imediatamente com QueueFullError (e um Retry-After estimado)
+
+    A fila é justa entre usuários: cada usuário tem sua própria fila e os
+    workers atendem os usuários em rodízio (round-robin), então quem enfileira
+    muitos vídeos não atrasa quem pediu apenas um.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_merges: int = 1, max_queue: int = 50,
+                 max_queue_per_user: int = 5):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self._merge_slots = threading.BoundedSemaphore(max_merges)
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._avg_duration = 30.0
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0}
+
+    # -------------------------------------------------------------- workers
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_concurrent:
+            worker = threading.Thread(target=self._worker_loop, name=f'download-worker-{len(self._workers)}',
+                                      daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._queued:
+                    self._cond.wait()
+                ticket = self._pop_next()
+                self._running += 1
+                self._notify_positions()
+
+            ticket.notify_position(0)
+            started = time.time()
+            try:
+                ticket.job()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Erro não tratado em trabalho de download")
+            finally:
+                duration = time.time() - started
+                with self._cond:
+                    self._running -= 1
+                    self._stats['completed'] += 1
+                    # Média móvel exponencial para estimar o Retry-After
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def _pop_next(self) -> DownloadTicket:
+        """Retira o próximo trabalho em rodízio entre usuários."""
+        user_key, queue = next(iter(self._queues.items()))
+        ticket = queue.popleft()
+        del self._queues[user_key]
+        if queue:
+            # Usuário volta para o fim do rodízio
+            self._queues[user_key] = queue
+        self._queued -= 1
+        return ticket
+
+    def _dispatch_order(self):
+        """Ordem em que os trabalhos enfileirados serão atendidos."""
+        queues = [list(q) for q in self._queues.values()]
+        order = []
+        depth = 0
+        while True:
+            layer = [q[depth] for q in queues if len(q) > depth]
+            if not layer:
+                return order
+            order.extend(layer)
+            depth += 1
+
+    def _notify_positions(self):
+        for position, ticket in enumerate(self._dispatch_order(), start=1):
+            ticket.notify_position(position)
+
+    # --------------------------------------------------------------- API
+
+    def retry_after(self) -> int:
+        """Estimativa (segundos) até haver espaço na fila."""
+        backlog = self._queued + self._running
+        return max(1, int(self._avg_duration * backlog / max(1, self.max_concurrent)))
+
+    def submit(self, job, user_key: str = None, on_position=None) -> DownloadTicket:
+        """
+        Enfileira job() para execução por um worker.
+
+        Args:
+            job: Função sem argumentos
+            user_key: Identificador do usuário (para a justiça da fila)
+            on_position: Chamado com a posição na fila (0 = em execução)
+
+        Raises:
+            QueueFullError: Fila global ou do usuário cheia
+        """
+        user_key = user_key or 'anonymous'
+        with self._cond:
+            user_queue = self._queues.get(user_key)
+            if self._queued >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise QueueFullError("Fila de downloads cheia", self.retry_after())
+            if user_queue is not None and len(user_queue) >= self.max_queue_per_user:
+                self._stats['rejected'] += 1
+                raise QueueFullError("Muitos downloads na fila para este usuário", self.retry_after(), per_user=True)
+
+            ticket = DownloadTicket(job, user_key, on_position)
+            if user_queue is None:
+                user_queue = self._queues[user_key] = deque()
+            user_queue.append(ticket)
+            self._queued += 1
+            self._stats['submitted'] += 1
+            self._ensure_workers()
+            self._notify_positions()
+            self._cond.notify()
+        return ticket
+
+    def reserve(self, user_key: str = None, on_position=None):
+        """
+        Ocupa um worker até a função devolvida ser chamada, para trabalho que
+        roda fora do agendador mas deve respeitar a mesma concorrência e a
+        fila justa (ex.: mux em streaming, que dura o envio inteiro da
+        resposta). Bloqueia até a vez na fila.
+
+        Returns:
+            release(): libera o worker (pode ser chamada mais de uma vez)
+
+        Raises:
+            QueueFullError: Fila global ou do usuário cheia
+        """
+        admitted = threading.Event()
+        released = threading.Event()
+
+        def job():
+            admitted.set()
+            released.wait()
+
+        self.submit(job, user_key=user_key, on_position=on_position)
+        admitted.wait()
+        return released.set
+
+    def acquire_merge_slot(self):
+        self._merge_slots.acquire()
+
+    def release_merge_slot(self):
+        self._merge_slots.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'queued': self._queued,
+                'running': self._running,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'users_waiting': len(self._queues),
+            })
+        return data
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+# Faixas de qualidade pelo lado menor do vídeo (Shorts são verticais: 1080x1920 é "1080p")
+TIERS = ('sd', 'hd', 'fhd')
+
+# Opções do yt-dlp ajustadas pelos perfis
+TUNING_KEYS = (
+    'concurrent_fragment_downloads',
+    'http_chunk_size',
+    'retries',
+    'fragment_retries',
+    'socket_timeout',
+    'buffersize',
+)
+
+# http_chunk_size de ~10 MiB evita o estrangulamento do YouTube em conexões longas;
+# fragmentos em paralelo compensam a banda limitada por conexão
+PROFILES = {
+    'conservative': {
+        'sd': {'concurrent_fragment_downloads': 1, 'http_chunk_size': 10 * MIB, 'retries': 3,
+               'fragment_retries': 3, 'socket_timeout': 20, 'buffersize': 64 * 1024},
+        'hd': {'concurrent_fragment_downloads': 2, 'http_chunk_size': 10 * MIB, 'retries': 5,
+               'fragment_retries': 5, 'socket_timeout': 20, 'buffersize': 64 * 1024},
+        'fhd': {'concurrent_fragment_downloads': 2, 'http_chunk_size': 10 * MIB, 'retries': 5,
+                'fragment_retries': 5, 'socket_timeout': 30, 'buffersize': 128 * 1024},
+    },
+    'balanced': {
+        'sd': {'concurrent_fragment_downloads': 2, 'http_chunk_size': 10 * MIB, 'retries': 5,
+               'fragment_retries': 5, 'socket_timeout': 15, 'buffersize': 64 * 1024},
+        'hd': {'concurrent_fragment_downloads': 4, 'http_chunk_size': 10 * MIB, 'retries': 10,
+               'fragment_retries': 10, 'socket_timeout': 20, 'buffersize': 128 * 1024},
+        'fhd': {'concurrent_fragment_downloads': 8, 'http_chunk_size': 10 * MIB, 'retries': 10,
+                'fragment_retries': 10, 'socket_timeout': 30, 'buffersize': 256 * 1024},
+    },
+    'aggressive': {
+        'sd': {'concurrent_fragment_downloads': 4, 'http_chunk_size': 5 * MIB, 'retries': 10,
+               'fragment_retries': 10, 'socket_timeout': 10, 'buffersize': 128 * 1024},
+        'hd': {'concurrent_fragment_downloads': 8, 'http_chunk_size': 5 * MIB, 'retries': 10,
+               'fragment_retries': 10, 'socket_timeout': 15, 'buffersize': 256 * 1024},
+        'fhd': {'concurrent_fragment_downloads': 16, 'http_chunk_size': 5 * MIB, 'retries': 15,
+                'fragment_retries': 15, 'socket_timeout': 20, 'buffersize': 512 * 1024},
+    },
+}
+
+
+def tier_for_height(height) -> str:
+    if not height:
+        return 'hd'
+    if height <= 480:
+        return 'sd'
+    if height <= 1080:
+        return 'hd'
+    return 'fhd'
+
+
+def tier_for_format(fmt: dict) -> str:
+    """Faixa de um formato ou info_dict processado (usa o vídeo do par DASH)."""
+    if not fmt:
+        return 'hd'
+    for requested in fmt.get('requested_formats') or []:
+        if requested.get('vcodec') not in (None, 'none'):
+            fmt = requested
+            break
+    sides = [side for side in (fmt.get('width'), fmt.get('height')) if side]
+    return tier_for_height(min(sides) if sides else None)
+
+
+class DownloadTuning:
+    """
+    Perfil de ajuste dos downloads do yt-dlp por faixa de qualidade.
+
+    O perfil 'none' não altera nada (comportamento padrão do yt-dlp: fragmentos
+    e componentes DASH baixados um de cada vez). overrides permite ajustar
+    opções por faixa, ex.: {"fhd": {"concurrent_fragment_downloads": 12}}.
+    """
+
+    def __init__(self, profile: str = 'balanced', overrides: dict = None, parallel_components: bool = True):
+        if profile != 'none' and profile not in PROFILES:
+            logger.warning("Perfil de download desconhecido '%s'; usando 'balanced'", profile)
+            profile = 'balanced'
+        self.profile = profile
+        self.overrides = overrides or {}
+        self.parallel_components = parallel_components and profile != 'none'
+
+    def options_for_tier(self, tier: str) -> dict:
+        """Opções do yt-dlp para a faixa (apenas chaves de TUNING_KEYS)."""
+        if self.profile == 'none':
+            return {}
+        options = dict(PROFILES[self.profile].get(tier) or PROFILES[self.profile]['hd'])
+        options.update({key: value for key, value in (self.overrides.get(tier) or {}).items()
+                        if key in TUNING_KEYS})
+        return options
+
+    def options_for_info(self, info: dict) -> dict:
+        return self.options_for_tier(tier_for_format(info))
+
+    def stats(self) -> dict:
+        return {
+            'profile': self.profile,
+            'parallel_components': self.parallel_components,
+            'tiers': {tier: self.options_for_tier(tier) for tier in TIERS},
+        }
+
+
+def create_download_tuning_from_env() -> DownloadTuning:
+    """
+    Cria o perfil a partir das variáveis de ambiente:
+    - DOWNLOAD_TUNING_PROFILE: 'balanced' (padrão), 'conservative', 'aggressive' ou 'none'
+    - DOWNLOAD_TUNING_OVERRIDES: JSON com ajustes por faixa (sd/hd/fhd)
+    - DOWNLOAD_PARALLEL_COMPONENTS: baixar vídeo e áudio DASH em paralelo (padrão: true)
+    """
+    overrides = {}
+    raw_overrides = os.environ.get('DOWNLOAD_TUNING_OVERRIDES')
+    if raw_overrides:
+        try:
+            overrides = json.loads(raw_overrides)
+        except ValueError as exc:
+            logger.warning("DOWNLOAD_TUNING_OVERRIDES inválido (%s); ignorando", exc)
+    return DownloadTuning(
+        profile=os.environ.get('DOWNLOAD_TUNING_PROFILE', 'balanced').lower(),
+        overrides=overrides,
+        parallel_components=os.environ.get('DOWNLOAD_PARALLEL_COMPONENTS', 'true').lower() == 'true',
+    )
@@ -0,0 +1,236 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """O circuito do backend/estratégia está aberto; a chamada nem foi tentada"""
+
+    def __init__(self, key: str, retry_after: int, last_error: str = None):
+        self.key = key
+        self.retry_after = retry_after
+        self.last_error = last_error
+        message = f"Circuito aberto para {key}; nova tentativa em {retry_after}s"
+        if last_error:
+            # Mantém a mensagem original para que is_bot_detection_error continue reconhecendo bloqueios
+            message += f" (último erro: {last_error})"
+        super().__init__(message)
+
+
+class _Circuit:
+    def __init__(self):
+        self.samples = deque()  # (timestamp, sucesso, latência)
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.probe_until = 0.0
+        self.trips = 0
+        self.blocks = 0
+        self.last_error = None
+
+
+class HealthTracker:
+    """
+    Saúde por backend/estratégia (ex.: 'download:yt-dlp', 'yt-dlp:ios',
+    'pytube') em uma janela deslizante, com circuit breaker:
+
+    - closed: chamadas liberadas; abre quando a taxa de falha na janela passa
+      de failure_threshold (com pelo menos min_samples amostras)
+    - open: chamadas recusadas até open_until; cada abertura seguida dobra o
+      tempo (open_seconds, 2x, 4x... até max_backoff)
+    - half_open: uma única chamada de teste (probe) é liberada; sucesso fecha
+      o circuito, falha reabre com o tempo dobrado
+
+    Erros classificados como bloqueio (detecção de bot) abrem o circuito na
+    hora, com backoff exponencial próprio a partir de block_backoff.
+    """
+
+    def __init__(self, window_seconds: float = 300.0, min_samples: int = 5, failure_threshold: float = 0.5,
+                 open_seconds: float = 30.0, block_backoff: float = 60.0, max_backoff: float = 1800.0,
+                 probe_timeout: float = 120.0):
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.block_backoff = block_backoff
+        self.max_backoff = max_backoff
+        self.probe_timeout = probe_timeout
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, key: str) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit()
+        return circuit
+
+    def _prune(self, circuit: _Circuit, now: float):
+        while circuit.samples and now - circuit.samples[0][0] > self.window_seconds:
+            circuit.samples.popleft()
+
+    def allow(self, key: str) -> bool:
+        """
+        True se a chamada pode ser feita agora. Com o circuito half_open, só
+        o primeiro chamador recebe True (o probe); o probe que não registrar
+        resultado em probe_timeout segundos libera um novo.
+        """
+        now = time.time()
+        with self._lock:
+            circuit = self._circuit(key)
+            if circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN:
+                if now < circuit.open_until:
+                    return False
+                circuit.state = HALF_OPEN
+                circuit.probe_until = 0.0
+            if now < circuit.probe_until:
+                return False
+            circuit.probe_until = now + self.probe_timeout
+            logger.info("Circuito %s em teste (half-open)", key)
+            return True
+
+    def retry_after(self, key: str) -> int:
+        """Segundos até o circuito aceitar uma nova tentativa (0 se liberado)."""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.state == CLOSED:
+                return 0
+            until = circuit.open_until if circuit.state == OPEN else circuit.probe_until
+            return max(0, int(until - time.time() + 0.999))
+
+    def open_error(self, key: str) -> CircuitOpenError:
+        with self._lock:
+            last_error = self._circuits[key].last_error if key in self._circuits else None
+        return CircuitOpenError(key, max(1, self.retry_after(key)), last_error)
+
+    def release_probe(self, key: str):
+        """
+        Libera o probe do circuito half_open sem registrar resultado (a
+        chamada admitida por allow() não chegou a testar o backend, ex.: fila
+        cheia ou erro do próprio pedido); o próximo allow() admite outro.
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None and circuit.state == HALF_OPEN:
+                circuit.probe_until = 0.0
+
+    def record(self, key: str, success: bool, latency: float, error=None, blocked: bool = False):
+        """
+        Registra o resultado de uma chamada.
+
+        Args:
+            key: Backend ou estratégia
+            success: Se a chamada teve sucesso
+            latency: Duração em segundos
+            error: Erro da falha (guardado para as respostas com circuito aberto)
+            blocked: Falha classificada como bloqueio (detecção de bot)
+        """
+        now = time.time()
+        with self._lock:
+            circuit = self._circuit(key)
+            circuit.samples.append((now, success, latency))
+            self._prune(circuit, now)
+
+            if success:
+                if circuit.state != CLOSED:
+                    logger.info("Circuito %s fechado após probe bem-sucedido", key)
+                    # Falhas antigas da janela não devem reabrir o circuito recém-recuperado
+                    circuit.samples = deque([(now, success, latency)])
+                circuit.state = CLOSED
+                circuit.trips = 0
+                circuit.blocks = 0
+                return
+
+            circuit.last_error = str(error)[:300] if error else circuit.last_error
+            if circuit.state == OPEN:
+                # Chamadas iniciadas antes da abertura não aumentam o backoff
+                return
+            if blocked:
+                circuit.blocks += 1
+                self._open(key, circuit, now, self.block_backoff * 2 ** (circuit.blocks - 1))
+            elif circuit.state == HALF_OPEN:
+                self._open(key, circuit, now, self._trip_duration(circuit))
+            elif circuit.state == CLOSED and self._should_trip(circuit):
+                self._open(key, circuit, now, self._trip_duration(circuit))
+
+    def latency_percentile(self, key: str, percentile: float = 0.95):
+        """
+        Latência (segundos) das chamadas bem-sucedidas na janela no percentil
+        pedido, ou None com menos de min_samples amostras.
+        """
+        now = time.time()
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                return None
+            self._prune(circuit, now)
+            latencies = sorted(latency for _, success, latency in circuit.samples if success)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[round(percentile * (len(latencies) - 1))]
+
+    def _should_trip(self, circuit: _Circuit) -> bool:
+        if len(circuit.samples) < self.min_samples:
+            return False
+        failures = sum(1 for _, success, _ in circuit.samples if not success)
+        return failures / len(circuit.samples) >= self.failure_threshold
+
+    def _trip_duration(self, circuit: _Circuit) -> float:
+        circuit.trips += 1
+        return self.open_seconds * 2 ** (circuit.trips - 1)
+
+    def _open(self, key: str, circuit: _Circuit, now: float, duration: float):
+        duration = min(duration, self.max_backoff)
+        circuit.state = OPEN
+        circuit.open_until = now + duration
+        circuit.probe_until = 0.0
+        logger.warning("Circuito %s aberto por %.0fs (último erro: %s)", key, duration, circuit.last_error)
+
+    def stats(self) -> dict:
+        now = time.time()
+        data = {}
+        with self._lock:
+            for key, circuit in self._circuits.items():
+                self._prune(circuit, now)
+                samples = circuit.samples
+                latencies = sorted(latency for _, _, latency in samples)
+                successes = sum(1 for _, success, _ in samples if success)
+                data[key] = {
+                    'state': circuit.state,
+                    'samples': len(samples),
+                    'success_rate': round(successes / len(samples), 3) if samples else None,
+                    'latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                    'latency_p95_ms': round(latencies[round(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None,
+                    'retry_after': max(0, int(circuit.open_until - now)) if circuit.state == OPEN else 0,
+                    'consecutive_blocks': circuit.blocks,
+                    'last_error': circuit.last_error,
+                }
+        return data
+
+
+def create_health_tracker_from_env() -> HealthTracker:
+    """
+    Cria o rastreador a partir das variáveis de ambiente:
+    - EXTRACTOR_HEALTH_WINDOW: janela deslizante em segundos (padrão: 300)
+    - EXTRACTOR_MIN_SAMPLES: amostras mínimas para abrir por taxa de falha (padrão: 5)
+    - EXTRACTOR_FAILURE_THRESHOLD: taxa de falha que abre o circuito (padrão: 0.5)
+    - EXTRACTOR_OPEN_SECONDS: primeira abertura por taxa de falha (padrão: 30)
+    - EXTRACTOR_BLOCK_BACKOFF: primeira abertura após detecção de bot (padrão: 60)
+    - EXTRACTOR_MAX_BACKOFF: limite do backoff exponencial (padrão: 1800)
+    """
+    return HealthTracker(
+        window_seconds=float(os.environ.get('EXTRACTOR_HEALTH_WINDOW', '300')),
+        min_samples=int(os.environ.get('EXTRACTOR_MIN_SAMPLES', '5')),
+        failure_threshold=float(os.environ.get('EXTRACTOR_FAILURE_THRESHOLD', '0.5')),
+        open_seconds=float(os.environ.get('EXTRACTOR_OPEN_SECONDS', '30')),
+        block_backoff=float(os.environ.get('EXTRACTOR_BLOCK_BACKOFF', '60')),
+        max_backoff=float(os.environ.get('EXTRACTOR_MAX_BACKOFF', '1800')),
+    )
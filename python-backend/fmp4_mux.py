@@ -0,0 +1,148 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Protocolos que o ffmpeg lê direto por HTTP (com Range) sem manifestos
+SUPPORTED_PROTOCOLS = ('http', 'https')
+
+
+class MuxError(Exception):
+    """O ffmpeg falhou antes de produzir o primeiro byte"""
+
+
+def find_ffmpeg():
+    """Caminho do ffmpeg (FFMPEG_BINARY ou PATH) ou None se não estiver instalado."""
+    configured = os.environ.get('FFMPEG_BINARY')
+    if configured:
+        return configured if os.path.isfile(configured) else shutil.which(configured)
+    return shutil.which('ffmpeg')
+
+
+def select_dash_pair(info: dict):
+    """
+    Par (vídeo, áudio) escolhido pelo yt-dlp quando o seletor resolve para
+    componentes separados, ou None se não for um par HTTP simples.
+
+    Args:
+        info: info_dict já processado por process_ie_result(download=False)
+    """
+    requested = (info or {}).get('requested_formats') or []
+    if len(requested) != 2:
+        return None
+    video = next((f for f in requested if f.get('vcodec') not in (None, 'none')), None)
+    audio = next((f for f in requested if f.get('acodec') not in (None, 'none') and f is not video), None)
+    if not video or not audio:
+        return None
+    if any(f.get('protocol') not in SUPPORTED_PROTOCOLS or not f.get('url') for f in (video, audio)):
+        return None
+    return video, audio
+
+
+def _headers_arg(fmt: dict) -> str:
+    headers = fmt.get('http_headers') or {}
+    return ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+
+
+def build_mux_command(ffmpeg: str, video: dict, audio: dict) -> list:
+    """
+    Comando do ffmpeg que lê os dois componentes por HTTP e escreve um MP4
+    fragmentado no stdout, copiando os streams (sem recodificar).
+
+    frag_keyframe+empty_moov coloca o moov vazio no início e grava fragmentos
+    (moof+mdat) a cada keyframe, então a saída pode ser enviada enquanto é
+    gerada, sem seek e sem arquivos intermediários (.fNNN.mp4/.temp.mp4).
+    """
+    command = [ffmpeg, '-hide_banner', '-nostdin', '-loglevel', 'error']
+    for fmt in (video, audio):
+        headers = _headers_arg(fmt)
+        if headers:
+            command += ['-headers', headers]
+        command += ['-reconnect', '1', '-reconnect_streamed', '1', '-i', fmt['url']]
+    command += [
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c', 'copy',
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-f', 'mp4', 'pipe:1',
+    ]
+    return command
+
+
+class FragmentedMP4Stream:
+    """
+    Processo do ffmpeg produzindo o MP4 fragmentado. start() espera o
+    primeiro bloco da saída, para que falhas (URL recusada, formato inválido)
+    sejam detectadas antes de enviar o status HTTP e o chamador possa usar o
+    caminho com merge em disco.
+    """
+
+    def __init__(self, command: list, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.command = command
+        self.chunk_size = chunk_size
+        self.process = None
+        self._stderr = None
+        self._first_chunk = b''
+
+    def start(self):
+        # stderr em arquivo temporário: um PIPE não lido poderia travar o ffmpeg
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                        stderr=self._stderr)
+        self._first_chunk = self.process.stdout.read1(self.chunk_size)
+        if not self._first_chunk:
+            self.process.wait()
+            error = self._read_stderr()
+            self.close()
+            raise MuxError(f"ffmpeg terminou sem saída (código {self.process.returncode}): {error}")
+        return self
+
+    def _read_stderr(self) -> str:
+        try:
+            self._stderr.seek(0)
+            return self._stderr.read().decode('utf-8', 'replace').strip()[-500:]
+        except (OSError, ValueError):
+            return ''
+
+    def __iter__(self):
+        try:
+            yield self._first_chunk
+            while True:
+                chunk = self.process.stdout.read1(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            if self.process.wait() != 0:
+                logger.error("ffmpeg terminou com código %s: %s", self.process.returncode, self._read_stderr())
+        finally:
+            self.close()
+
+    def close(self):
+        """Encerra o ffmpeg (ex.: cliente desconectou) e libera os descritores."""
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+
+
+def mux_response(stream: FragmentedMP4Stream, filename: str, on_close=None):
+    """Resposta Flask (chunked) com a saída do ffmpeg; Range não é suportado."""
+    response = Response(iter(stream), mimetype='video/mp4', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Accept-Ranges': 'none',
+        'X-Accel-Buffering': 'no',
+    })
+    response.call_on_close(stream.close)
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
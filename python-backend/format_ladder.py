@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+
+from ttl_cache import TTLCache
+
+BEST_ENTRY = {
+    'format_id': 'best',
+    'quality': 'Melhor qualidade disponível',
+    'height': None,
+    'width': None,
+    'filesize': None,
+    'filesize_mb': None,
+    'vcodec': None,
+    'ext': 'mp4',
+}
+
+
+def quality_label(height: int) -> str:
+    if height >= 2160:
+        return "4K (2160p)"
+    if height >= 1440:
+        return "2K (1440p)"
+    if height >= 1080:
+        return "Full HD (1080p)"
+    if height >= 720:
+        return "HD (720p)"
+    if height >= 480:
+        return "SD (480p)"
+    if height >= 360:
+        return "360p"
+    return f"{height}p"
+
+
+def _size(fmt: dict) -> int:
+    return fmt.get('filesize') or fmt.get('filesize_approx') or 0
+
+
+def _video_rank(fmt: dict) -> tuple:
+    # H.264 primeiro (compatível com qualquer player), depois MP4 e maior bitrate
+    return ('avc1' in (fmt.get('vcodec') or '').lower(), fmt.get('ext') == 'mp4', fmt.get('tbr') or 0)
+
+
+def _audio_rank(fmt: dict) -> tuple:
+    # Mesma preferência de get_format_selector: bestaudio[acodec^=mp4a][ext=m4a]
+    return ((fmt.get('acodec') or '').lower().startswith('mp4a'), fmt.get('ext') == 'm4a',
+            fmt.get('abr') or fmt.get('tbr') or 0)
+
+
+class FormatLadder:
+    """
+    Tabela de qualidades de um vídeo, pronta para /api/formats: corpo JSON já
+    serializado e ETag (hash do conteúdo).
+    """
+
+    __slots__ = ('video_id', 'title', 'formats', 'etag', 'body')
+
+    def __init__(self, video_id: str, title: str, formats: list):
+        self.video_id = video_id
+        self.title = title
+        self.formats = formats
+        payload = {'formats': formats, 'video_id': video_id, 'title': title}
+        self.body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()[:20]
+
+
+def build_format_ladder(video_id: str, info: dict) -> FormatLadder:
+    """
+    Monta a escada de qualidades em uma única passada pelos formatos:
+    - por altura, o melhor candidato de vídeo (H.264 preferido; AV1 nunca)
+    - o melhor áudio, somado ao tamanho dos formatos só de vídeo (DASH), para
+      que filesize/filesize_mb correspondam ao download final (vídeo + áudio)
+    """
+    best_by_height = {}
+    best_audio = None
+    for fmt in info.get('formats') or []:
+        vcodec = (fmt.get('vcodec') or 'none').lower()
+        if vcodec == 'none':
+            if (fmt.get('acodec') or 'none') != 'none' and (best_audio is None
+                                                              or _audio_rank(fmt) > _audio_rank(best_audio)):
+                best_audio = fmt
+            continue
+        height = fmt.get('height')
+        if not height or 'av01' in vcodec:
+            continue
+        current = best_by_height.get(height)
+        if current is None or _video_rank(fmt) > _video_rank(current):
+            best_by_height[height] = fmt
+
+    audio_size = _size(best_audio) if best_audio else 0
+    formats = [BEST_ENTRY]
+    for height in sorted(best_by_height, reverse=True):
+        fmt = best_by_height[height]
+        filesize = _size(fmt)
+        if filesize and (fmt.get('acodec') or 'none') == 'none':
+            filesize += audio_size
+        formats.append({
+            'format_id': fmt.get('format_id'),
+            'quality': quality_label(height),
+            'height': height,
+            'width': fmt.get('width'),
+            'filesize': filesize,
+            'filesize_mb': round(filesize / (1024 * 1024), 2) if filesize else None,
+            'vcodec': fmt.get('vcodec'),
+            'ext': fmt.get('ext', 'mp4'),
+        })
+    return FormatLadder(video_id, info.get('title', 'Video'), formats)
+
+
+class FormatLadderCache:
+    """
+    Escadas de qualidade por vídeo, em memória, com a mesma validade do cache
+    de informações: /api/formats não precisa desserializar o info_dict inteiro
+    nem refazer a escada a cada chamada.
+    """
+
+    def __init__(self, ttl: float = 1800, max_entries: int = 2048):
+        self._ladders = TTLCache(max_entries, ttl)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'builds': 0}
+
+    def get(self, video_id: str):
+        ladder = self._ladders.get(video_id)
+        with self._lock:
+            self._stats['hits' if ladder is not None else 'misses'] += 1
+        return ladder
+
+    def build(self, video_id: str, info: dict) -> FormatLadder:
+        """Monta e guarda a escada do info_dict (chamado ao obter informações novas)."""
+        ladder = build_format_ladder(video_id, info)
+        self._ladders.set(video_id, ladder)
+        with self._lock:
+            self._stats['builds'] += 1
+        return ladder
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+        data['entries'] = len(self._ladders)
+        return data
+
+
+def create_format_ladder_cache_from_env(ttl: float) -> FormatLadderCache:
+    """
+    Cria o cache de escadas de qualidade (ttl: validade do cache de informações):
+    - FORMAT_LADDER_CACHE_SIZE: limite de vídeos em memória (padrão: 2048)
+    """
+    return FormatLadderCache(ttl=ttl, max_entries=int(os.environ.get('FORMAT_LADDER_CACHE_SIZE', '2048')))
@@ -0,0 +1,226 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class Strategy:
+    """
+    Uma forma de obter o resultado (ex.: yt-dlp com a URL /shorts/, yt-dlp com
+    outro player_client, pytube). fn(cancel_event) retorna o resultado ou
+    levanta exceção; estratégias em andamento devem checar cancel_event
+    quando puderem (o yt-dlp não interrompe uma extração já iniciada).
+
+    Estratégias do mesmo group falham juntas em bloqueios: depois de um erro
+    classificado como bloqueio (skip_group_on), as demais do grupo não iniciam.
+    """
+
+    def __init__(self, name: str, fn, group: str = None):
+        self.name = name
+        self.fn = fn
+        self.group = group or name
+
+    def __repr__(self):
+        return f'<Strategy {self.name}>'
+
+
+class AllStrategiesFailed(Exception):
+    """Nenhuma estratégia teve sucesso; errors mapeia nome -> exceção"""
+
+    def __init__(self, errors: dict):
+        self.errors = errors
+        last = list(errors.values())[-1] if errors else None
+        super().__init__(str(last) if last else 'Nenhuma estratégia disponível')
+        self.last_error = last
+
+
+class _NotStarted(Exception):
+    """before_start recusou a estratégia (ex.: limitador de saída); error é o motivo"""
+
+    def __init__(self, error: Exception):
+        super().__init__(str(error))
+        self.error = error
+
+
+class HedgedResolver:
+    """
+    Executa estratégias com partidas escalonadas (hedging): a primeira começa
+    na hora e, se não terminar no tempo de escalonamento, a próxima começa em
+    paralelo (ou imediatamente, se a anterior falhar). O primeiro sucesso
+    vence; as que ainda não começaram são canceladas e os resultados das que
+    já estavam rodando são descartados.
+
+    O tempo de escalonamento é stagger_seconds ou, com health, o p95 da
+    latência da estratégia em andamento, se for maior: a próxima só começa
+    quando a atual já está mais lenta que 95% das suas chamadas bem-sucedidas,
+    e não em toda extração normal.
+
+    A estratégia vencedora de cada escopo é lembrada por winner_ttl segundos
+    e passa a ser tentada primeiro nas próximas requisições.
+
+    Com health (HealthTracker), cada grupo tem um circuit breaker: grupos com
+    o circuito aberto não são iniciados, e o resultado de toda estratégia
+    (inclusive das perdedoras) alimenta a saúde do seu grupo.
+    """
+
+    def __init__(self, stagger_seconds: float = 4.0, winner_ttl: float = 600.0, max_workers: int = 16,
+                 health=None):
+        self.stagger_seconds = stagger_seconds
+        self.winner_ttl = winner_ttl
+        self.health = health
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resolver')
+        self._winners = {}
+        self._lock = threading.Lock()
+        self._stats = {'resolved': 0, 'failed': 0, 'hedged_starts': 0, 'wins': {}}
+
+    def _ordered(self, scope: str, strategies: list) -> list:
+        with self._lock:
+            winner = self._winners.get(scope)
+        if not winner or time.time() - winner[1] > self.winner_ttl:
+            return list(strategies)
+        preferred = [s for s in strategies if s.name == winner[0]]
+        return preferred + [s for s in strategies if s.name != winner[0]]
+
+    def _record_win(self, scope: str, name: str):
+        with self._lock:
+            self._winners[scope] = (name, time.time())
+            self._stats['resolved'] += 1
+            wins = self._stats['wins'].setdefault(scope, {})
+            wins[name] = wins.get(name, 0) + 1
+
+    def _stagger(self, strategy: Strategy) -> float:
+        if self.health is None:
+            return self.stagger_seconds
+        observed = self.health.latency_percentile(strategy.group, 0.95)
+        return max(self.stagger_seconds, observed or 0.0)
+
+    def _run(self, strategy: Strategy, cancel: threading.Event, before_start, skip_group_on, client_error):
+        """
+        Executa a estratégia na thread do pool, registrando a saúde só se ela de
+        fato começou e a falha não foi do próprio pedido (client_error).
+        """
+        if cancel.is_set():
+            raise _NotStarted(RuntimeError("Estratégia cancelada antes de começar"))
+        if before_start is not None:
+            try:
+                before_start(strategy)
+            except Exception as exc:  # pylint: disable=broad-except
+                raise _NotStarted(exc) from exc
+        if cancel.is_set():
+            raise _NotStarted(RuntimeError("Estratégia cancelada antes de começar"))
+        started = time.monotonic()
+        try:
+            result = strategy.fn(cancel)
+        except Exception as exc:
+            if self.health is not None and client_error is not None and client_error(exc):
+                self.health.release_probe(strategy.group)
+            elif self.health is not None:
+                blocked = skip_group_on is not None and skip_group_on(exc)
+                self.health.record(strategy.group, False, time.monotonic() - started, error=exc, blocked=blocked)
+            raise
+        if self.health is not None:
+            self.health.record(strategy.group, True, time.monotonic() - started)
+        return result
+
+    def resolve(self, scope: str, strategies: list, skip_group_on=None, before_start=None, client_error=None):
+        """
+        Args:
+            scope: Escopo da memória da vencedora (ex.: 'extract')
+            strategies: Lista de Strategy em ordem de preferência
+            skip_group_on: skip_group_on(exc) -> True se o erro deve descartar as
+                           estratégias pendentes do mesmo grupo (ex.: bloqueio);
+                           também é a classificação de bloqueio usada por health
+            before_start: before_start(strategy) roda na thread da estratégia antes
+                          de fn (ex.: token do limitador de saída, um por estratégia
+                          iniciada); se levantar exceção, a estratégia não começa e
+                          nenhuma outra é iniciada depois dela
+            client_error: client_error(exc) -> True se a falha é do próprio pedido
+                          (ex.: vídeo privado ou inexistente): não conta na saúde
+                          do grupo, e as estratégias pendentes do mesmo grupo não
+                          são iniciadas, pois falhariam do mesmo jeito
+
+        Returns:
+            (resultado, nome da estratégia vencedora)
+
+        Raises:
+            AllStrategiesFailed: todas falharam
+        """
+        pending = self._ordered(scope, strategies)
+        cancel = threading.Event()
+        running = {}
+        errors = {}
+        skipped_groups = set()
+
+        def start_next():
+            while pending:
+                strategy = pending.pop(0)
+                if strategy.group in skipped_groups:
+                    continue
+                if self.health is not None and not self.health.allow(strategy.group):
+                    errors[strategy.name] = self.health.open_error(strategy.group)
+                    logger.debug("Estratégia %s pulada: circuito aberto (%s)", strategy.name, scope)
+                    continue
+                logger.debug("Iniciando estratégia %s (%s)", strategy.name, scope)
+                future = self._executor.submit(self._run, strategy, cancel, before_start, skip_group_on,
+                                               client_error)
+                running[future] = strategy
+                return strategy
+            return None
+
+        started = start_next()
+        next_start = time.monotonic() + (self._stagger(started) if started else 0.0)
+        try:
+            while running:
+                timeout = max(0.0, next_start - time.monotonic()) if pending else None
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    # A atual está demorando: começar a próxima em paralelo
+                    started = start_next()
+                    if started:
+                        with self._lock:
+                            self._stats['hedged_starts'] += 1
+                        next_start = time.monotonic() + self._stagger(started)
+                    continue
+
+                for future in done:
+                    strategy = running.pop(future)
+                    try:
+                        result = future.result()
+                    except _NotStarted as exc:
+                        # Sem token (ou já cancelada): não iniciar as próximas
+                        errors[strategy.name] = exc.error
+                        logger.info("Estratégia %s não iniciada (%s): %s", strategy.name, scope, exc.error)
+                        pending.clear()
+                        continue
+                    except Exception as exc:  # pylint: disable=broad-except
+                        errors[strategy.name] = exc
+                        logger.info("Estratégia %s falhou (%s): %s", strategy.name, scope, exc)
+                        if (skip_group_on is not None and skip_group_on(exc)) or (
+                                client_error is not None and client_error(exc)):
+                            skipped_groups.add(strategy.group)
+                        # Falha libera a próxima imediatamente, sem esperar o escalonamento
+                        started = start_next()
+                        if started:
+                            next_start = time.monotonic() + self._stagger(started)
+                        continue
+                    self._record_win(scope, strategy.name)
+                    if running:
+                        logger.debug("Descartando %d estratégia(s) perdedora(s) (%s)", len(running), scope)
+                    return result, strategy.name
+        finally:
+            cancel.set()
+
+        with self._lock:
+            self._stats['failed'] += 1
+        raise AllStrategiesFailed(errors)
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = {key: (dict(value) if isinstance(value, dict) else value) for key, value in self._stats.items()}
+            data['winners'] = {scope: name for scope, (name, at) in self._winners.items()
+                               if time.time() - at <= self.winner_ttl}
+        data['stagger_seconds'] = self.stagger_seconds
+        return data
@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# URLs assinadas do YouTube trazem a expiração como ?expire=<unix> ou /expire/<unix>/
+EXPIRE_PARAM_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+
+class MemoryInfoBackend:
+    """LRU em memória (por processo)"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, payload: str, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteInfoBackend:
+    """Backend SQLite compartilhado entre os workers do gunicorn"""
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS info_cache ('
+                'key TEXT PRIMARY KEY, payload TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT payload FROM info_cache WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE info_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return row[0] if row else None
+
+    def set(self, key: str, payload: str, expires_at: float):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO info_cache (key, payload, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, payload, expires_at, now)
+            )
+            conn.execute('DELETE FROM info_cache WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'DELETE FROM info_cache WHERE key IN ('
+                'SELECT key FROM info_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM info_cache WHERE key = ?', (key,))
+
+
+class RedisInfoBackend:
+    """Backend compatível com o protocolo Redis (expiração feita pelo servidor)"""
+
+    def __init__(self, url: str, prefix: str = 'yt:info:'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str):
+        payload = self.client.get(self.prefix + key)
+        return payload.decode('utf-8') if payload else None
+
+    def set(self, key: str, payload: str, expires_at: float):
+        ttl = int(expires_at - time.time())
+        if ttl > 0:
+            self.client.setex(self.prefix + key, ttl, payload)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+
+class InfoCache:
+    """
+    Cache com TTL de info_dicts sanitizados do yt-dlp, por ID de vídeo.
+
+    Há sempre uma LRU em memória na frente e, opcionalmente, um backend
+    compartilhado (SQLite ou Redis). A validade de cada entrada é o menor valor
+    entre o TTL configurado e a expiração das URLs assinadas dos formatos
+    (menos uma margem), para que um download nunca use uma URL vencida.
+    """
+
+    def __init__(self, ttl_seconds: int = 1800, shared_backend=None, max_memory_entries: int = 512,
+                 url_expiry_margin: int = 300):
+        self.ttl_seconds = ttl_seconds
+        self.url_expiry_margin = url_expiry_margin
+        self.memory = MemoryInfoBackend(max_memory_entries)
+        self.shared = shared_backend
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def expires_at(self, info: dict) -> float:
+        """Calcula a validade respeitando a expiração das URLs assinadas."""
+        now = time.time()
+        expires = now + self.ttl_seconds
+        formats = list(info.get('formats') or []) + list(info.get('requested_formats') or [])
+        for fmt in formats:
+            match = EXPIRE_PARAM_RE.search((fmt or {}).get('url') or '')
+            if match:
+                expires = min(expires, int(match.group(1)) - self.url_expiry_margin)
+        return expires
+
+    def get(self, video_id: str):
+        """
+        Returns:
+            Cópia independente do info_dict ou None
+        """
+        if not self.enabled:
+            return None
+
+        payload = self.memory.get(video_id)
+        if payload is None and self.shared is not None:
+            try:
+                payload = self.shared.get(video_id)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Erro ao consultar cache compartilhado de informações: %s", exc)
+                payload = None
+            if payload is not None:
+                info = json.loads(payload)
+                self.memory.set(video_id, payload, self.expires_at(info))
+                self._count('hits')
+                return info
+
+        self._count('hits' if payload is not None else 'misses')
+        return json.loads(payload) if payload is not None else None
+
+    def set(self, video_id: str, info: dict):
+        """Armazena um info_dict já sanitizado (serializável em JSON)."""
+        if not self.enabled or not info:
+            return
+
+        expires = self.expires_at(info)
+        if expires <= time.time():
+            return
+
+        payload = json.dumps(info, ensure_ascii=False, default=str)
+        self.memory.set(video_id, payload, expires)
+        if self.shared is not None:
+            try:
+                self.shared.set(video_id, payload, expires)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Erro ao gravar no cache compartilhado de informações: %s", exc)
+        self._count('stores')
+
+    def delete(self, video_id: str):
+        self.memory.delete(video_id)
+        if self.shared is not None:
+            try:
+                self.shared.delete(video_id)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Erro ao remover do cache compartilhado de informações: %s", exc)
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+        data['enabled'] = self.enabled
+        data['backend'] = type(self.shared).__name__ if self.shared is not None else 'memory'
+        return data
+
+
+def create_info_cache_from_env() -> InfoCache:
+    """
+    Cria o cache a partir das variáveis de ambiente:
+    - INFO_CACHE_TTL: validade máxima em segundos (padrão: 1800, 0 desativa)
+    - INFO_CACHE_BACKEND: 'memory' (padrão), 'sqlite' ou 'redis'
+    - INFO_CACHE_PATH: arquivo SQLite (padrão: <tmp>/youtube_shorts_info.db)
+    - INFO_CACHE_URL: URL do servidor compatível com Redis (ex.: redis://localhost:6379/0)
+    """
+    ttl = int(os.environ.get('INFO_CACHE_TTL', '1800'))
+    backend_name = os.environ.get('INFO_CACHE_BACKEND', 'memory').lower()
+
+    shared = None
+    if backend_name == 'sqlite':
+        path = os.environ.get('INFO_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'youtube_shorts_info.db')
+        shared = SQLiteInfoBackend(path)
+    elif backend_name == 'redis':
+        if REDIS_AVAILABLE and os.environ.get('INFO_CACHE_URL'):
+            shared = RedisInfoBackend(os.environ['INFO_CACHE_URL'])
+        else:
+            logger.warning("INFO_CACHE_BACKEND=redis requer o pacote redis e INFO_CACHE_URL; usando memória")
+
+    return InfoCache(ttl_seconds=ttl, shared_backend=shared)
@@ -0,0 +1,388 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from artifacts import DownloadArtifact
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Estados de um job de download
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'error'
+
+FINAL_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+# Status de progresso do yt-dlp/agendador -> estado do job
+PROGRESS_STATES = {
+    'queued': JOB_QUEUED,
+    'starting': JOB_RUNNING,
+    'downloading': JOB_RUNNING,
+    'processing': JOB_RUNNING,
+}
+
+
+class MemoryJobBackend:
+    """Jobs em memória (por processo) - indicado para testes e um único worker"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def put(self, job: dict):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def set_latest(self, index_key: str, job_id: str, expires_at: float):
+        with self._lock:
+            self._index[index_key] = job_id
+
+    def get_latest(self, index_key: str):
+        with self._lock:
+            return self._index.get(index_key)
+
+    def pop_expired(self, now: float) -> list:
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job['expires_at'] <= now]
+            for job in expired:
+                del self._jobs[job['id']]
+            expired_ids = {job['id'] for job in expired}
+            for key in [k for k, v in self._index.items() if v in expired_ids]:
+                del self._index[key]
+        return expired
+
+
+class SQLiteJobBackend:
+    """Jobs em SQLite - compartilhado entre os workers do gunicorn na mesma máquina"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_index ('
+                'key TEXT PRIMARY KEY, job_id TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, job: dict):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (id, data, expires_at) VALUES (?, ?, ?)',
+                (job['id'], json.dumps(job, default=str), job['expires_at'])
+            )
+
+    def delete(self, job_id: str):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def set_latest(self, index_key: str, job_id: str, expires_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO job_index (key, job_id, expires_at) VALUES (?, ?, ?)',
+                (index_key, job_id, expires_at)
+            )
+
+    def get_latest(self, index_key: str):
+        with self._connect() as conn:
+            row = conn.execute('SELECT job_id FROM job_index WHERE key = ?', (index_key,)).fetchone()
+        return row[0] if row else None
+
+    def pop_expired(self, now: float) -> list:
+        with self._connect() as conn:
+            rows = conn.execute('SELECT data FROM jobs WHERE expires_at <= ?', (now,)).fetchall()
+            conn.execute('DELETE FROM jobs WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM job_index WHERE expires_at <= ?', (now,))
+        return [json.loads(row[0]) for row in rows]
+
+
+class RedisJobBackend:
+    """Jobs em servidor compatível com o protocolo Redis (vários hosts)"""
+
+    def __init__(self, url: str, prefix: str = 'yt:job:'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.artifacts_key = prefix + 'artifacts'
+
+    def get(self, job_id: str):
+        payload = self.client.get(self.prefix + job_id)
+        return json.loads(payload) if payload else None
+
+    def put(self, job: dict):
+        ttl = max(1, int(job['expires_at'] - time.time()))
+        pipe = self.client.pipeline()
+        pipe.setex(self.prefix + job['id'], ttl, json.dumps(job, default=str))
+        if job.get('artifact_dir'):
+            # O Redis expira o job sozinho; o diretório do artefato é limpo por pop_expired
+            pipe.zadd(self.artifacts_key, {job['artifact_dir']: job['expires_at']})
+        pipe.execute()
+
+    def delete(self, job_id: str):
+        self.client.delete(self.prefix + job_id)
+
+    def set_latest(self, index_key: str, job_id: str, expires_at: float):
+        ttl = max(1, int(expires_at - time.time()))
+        self.client.setex(self.prefix + 'latest:' + index_key, ttl, job_id)
+
+    def get_latest(self, index_key: str):
+        job_id = self.client.get(self.prefix + 'latest:' + index_key)
+        return job_id.decode('utf-8') if job_id else None
+
+    def pop_expired(self, now: float) -> list:
+        dirs = self.client.zrangebyscore(self.artifacts_key, 0, now)
+        if dirs:
+            self.client.zremrangebyscore(self.artifacts_key, 0, now)
+        return [{'artifact_dir': d.decode('utf-8')} for d in dirs]
+
+
+class JobStore:
+    """
+    Jobs de download com ID, estado, progresso e expiração (TTL).
+
+    Os artefatos são guardados por referência (caminho em disco), nunca o
+    conteúdo. Artefatos temporários são vinculados (hard link) a um diretório
+    do próprio job, para que outros workers possam servi-los e para que sejam
+    removidos junto com o job quando ele expirar. Vídeos do cache em disco são
+    referenciados diretamente (o cache cuida da remoção).
+    """
+
+    def __init__(self, backend, ttl_seconds: int = 900, artifact_dir: str = None,
+                 progress_write_interval: float = 0.5):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.artifact_dir = artifact_dir or os.path.join(tempfile.gettempdir(), 'youtube_shorts_jobs')
+        self.progress_write_interval = progress_write_interval
+        self._last_progress_write = {}
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.artifact_dir, exist_ok=True)
+
+    @staticmethod
+    def _index_key(video_id: str, quality: str = None, user_id: str = None) -> str:
+        key = f"{video_id}:{quality or 'best'}"
+        return f"user:{user_id}:{key}" if user_id else key
+
+    def create(self, video_id: str, quality: str = None, user_id: str = None, **extra) -> dict:
+        self.purge_expired()
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'video_id': video_id,
+            'quality': quality or 'best',
+            'user_id': user_id,
+            'status': JOB_QUEUED,
+            'progress': {'status': 'starting', 'percent': 0},
+            'filename': None,
+            'artifact_path': None,
+            'artifact_dir': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'expires_at': now + self.ttl_seconds,
+        }
+        job.update(extra)
+        self.backend.put(job)
+        self.backend.set_latest(video_id, job['id'], job['expires_at'])
+        self.backend.set_latest(self._index_key(video_id, quality), job['id'], job['expires_at'])
+        if user_id:
+            self.backend.set_latest(self._index_key(video_id, quality, user_id), job['id'], job['expires_at'])
+        return job
+
+    def get(self, job_id: str):
+        job = self.backend.get(job_id)
+        if job and job['expires_at'] <= time.time():
+            return None
+        return job
+
+    def latest_for_video(self, video_id: str, quality: str = None, user_id: str = None):
+        """
+        Job mais recente do vídeo (opcionalmente da qualidade específica).
+        Com user_id, apenas entre os jobs desse usuário (obrigatório para
+        entregar o arquivo de um job).
+        """
+        if user_id:
+            key = self._index_key(video_id, quality, user_id)
+        else:
+            key = self._index_key(video_id, quality) if quality else video_id
+        job_id = self.backend.get_latest(key)
+        job = self.get(job_id) if job_id else None
+        if job and user_id and str(job.get('user_id')) != str(user_id):
+            return None
+        return job
+
+    def update(self, job_id: str, **fields):
+        job = self.backend.get(job_id)
+        if not job:
+            return None
+        job.update(fields)
+        job['updated_at'] = time.time()
+        if job['status'] in FINAL_STATES:
+            # Jobs concluídos ficam disponíveis por um TTL completo após o término
+            job['expires_at'] = job['updated_at'] + self.ttl_seconds
+        self.backend.put(job)
+        return job
+
+    def update_progress(self, job_id: str, data: dict):
+        """Registra um evento de progresso (gravações limitadas a cada intervalo)."""
+        now = time.time()
+        status = data.get('status')
+        with self._lock:
+            last = self._last_progress_write.get(job_id, 0.0)
+            if status == 'downloading' and now - last < self.progress_write_interval:
+                return
+            self._last_progress_write[job_id] = now
+
+        job = self.backend.get(job_id)
+        if not job or job['status'] in FINAL_STATES:
+            return
+        progress = dict(job.get('progress') or {})
+        progress.update(data)
+        self.update(job_id, progress=progress, status=PROGRESS_STATES.get(status, job['status']))
+
+    def complete(self, job_id: str, artifact: DownloadArtifact):
+        """
+        Marca o job como concluído guardando o artefato por referência. A
+        referência recebida passa a ser do job (é liberada aqui).
+        """
+        artifact_path, artifact_dir = artifact.path, None
+        if artifact.cleanup_dir:
+            artifact_dir = os.path.join(self.artifact_dir, job_id)
+            os.makedirs(artifact_dir, exist_ok=True)
+            artifact_path = os.path.join(artifact_dir, os.path.basename(artifact.path))
+            try:
+                os.link(artifact.path, artifact_path)
+            except OSError:
+                shutil.copyfile(artifact.path, artifact_path)
+            artifact.close()
+
+        with self._lock:
+            self._last_progress_write.pop(job_id, None)
+        return self.update(
+            job_id,
+            status=JOB_COMPLETED,
+            progress={'status': JOB_COMPLETED, 'percent': 100, 'filename': artifact.filename},
+            filename=artifact.filename,
+            artifact_path=artifact_path,
+            artifact_dir=artifact_dir,
+        )
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._last_progress_write.pop(job_id, None)
+        return self.update(job_id, status=JOB_FAILED, error=error,
+                           progress={'status': JOB_FAILED, 'error': error})
+
+    def open_artifact(self, job: dict):
+        """
+        Retorna um DownloadArtifact para servir o arquivo do job (sem remover
+        nada ao fechar: o job é o dono) ou None se o arquivo não existir mais.
+        """
+        if not job or job.get('status') != JOB_COMPLETED or not job.get('artifact_path'):
+            return None
+        if not os.path.isfile(job['artifact_path']):
+            return None
+        return DownloadArtifact(job['artifact_path'], job.get('filename') or 'video.mp4')
+
+    def purge_expired(self, min_interval: float = 30.0):
+        """Remove jobs expirados e seus diretórios de artefatos."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < min_interval:
+                return
+            self._last_purge = now
+        try:
+            expired = self.backend.pop_expired(now)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Erro ao expirar jobs: %s", exc)
+            return
+        for job in expired:
+            if job.get('artifact_dir'):
+                shutil.rmtree(job['artifact_dir'], ignore_errors=True)
+        if expired:
+            logger.info("%d job(s) expirado(s) removido(s)", len(expired))
+
+    @staticmethod
+    def public_dict(job: dict) -> dict:
+        """Dados do job seguros para retornar ao cliente (sem caminhos internos)."""
+        if not job:
+            return {'status': 'not_started'}
+        data = dict(job.get('progress') or {})
+        data.update({
+            'job_id': job['id'],
+            'video_id': job['video_id'],
+            'quality': job['quality'],
+            'status': job['status'] if job['status'] in FINAL_STATES else data.get('status', job['status']),
+            'state': job['status'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+            'expires_at': job['expires_at'],
+        })
+        if job.get('filename'):
+            data['filename'] = job['filename']
+        if job.get('error'):
+            data['error'] = job['error']
+        return data
+
+    def stats(self) -> dict:
+        return {'backend': type(self.backend).__name__, 'ttl_seconds': self.ttl_seconds}
+
+
+def create_job_store_from_env() -> JobStore:
+    """
+    Cria o armazenamento de jobs a partir das variáveis de ambiente:
+    - JOB_STORE_BACKEND: 'sqlite' (padrão, compartilhado entre workers), 'memory' ou 'redis'
+    - JOB_STORE_PATH: arquivo SQLite (padrão: <tmp>/youtube_shorts_jobs.db)
+    - JOB_STORE_URL: URL do servidor compatível com Redis
+    - JOB_TTL: validade dos jobs em segundos (padrão: 900)
+    - JOB_ARTIFACT_DIR: diretório dos artefatos dos jobs
+    """
+    backend_name = os.environ.get('JOB_STORE_BACKEND', 'sqlite').lower()
+    ttl = int(os.environ.get('JOB_TTL', '900'))
+
+    if backend_name == 'memory':
+        backend = MemoryJobBackend()
+    elif backend_name == 'redis' and REDIS_AVAILABLE and os.environ.get('JOB_STORE_URL'):
+        backend = RedisJobBackend(os.environ['JOB_STORE_URL'])
+    else:
+        if backend_name == 'redis':
+            logger.warning("JOB_STORE_BACKEND=redis requer o pacote redis e JOB_STORE_URL; usando SQLite")
+        path = os.environ.get('JOB_STORE_PATH') or os.path.join(tempfile.gettempdir(), 'youtube_shorts_jobs.db')
+        backend = SQLiteJobBackend(path)
+
+    return JobStore(backend, ttl_seconds=ttl, artifact_dir=os.environ.get('JOB_ARTIFACT_DIR'))
@@ -0,0 +1,249 @@
+import ipaddress
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger(__name__)
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+USER_AGENT = 'Mozilla/5.0 (compatible; YoutubeShortAPI link expander)'
+
+
+class SQLiteLinkCache:
+    """
+    Cache persistente de encurtador -> URL final (compartilhado entre workers).
+    Falhas também são guardadas (final_url NULL), por um TTL menor.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 86400, failure_ttl: float = 3600,
+                 max_entries: int = 100000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS short_links ('
+                'url TEXT PRIMARY KEY, final_url TEXT, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS short_links_expires ON short_links (expires_at)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get_many(self, urls: list) -> dict:
+        """{url: URL final ou None (falha recente)} para as URLs em cache."""
+        if not urls:
+            return {}
+        now = time.time()
+        found = {}
+        with self._connect() as conn:
+            # Lotes dentro do limite de parâmetros do SQLite
+            for start in range(0, len(urls), 500):
+                batch = urls[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT url, final_url FROM short_links WHERE expires_at > ? AND url IN "
+                    f"({','.join('?' * len(batch))})", [now, *batch]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def set(self, url: str, final_url):
+        now = time.time()
+        ttl = self.ttl_seconds if final_url else self.failure_ttl
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO short_links (url, final_url, expires_at) VALUES (?, ?, ?)',
+                         (url, final_url, now + ttl))
+            conn.execute('DELETE FROM short_links WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'DELETE FROM short_links WHERE url IN ('
+                'SELECT url FROM short_links ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+
+class LinkExpander:
+    """
+    Expande links encurtados (amzn.to, bit.ly...) seguindo os redirecionamentos
+    com HEAD (GET sem ler o corpo quando o encurtador recusa HEAD).
+
+    - Cache persistente (SQLiteLinkCache): descrições repetidas resolvem na hora
+    - Uma Session do requests com pool de conexões (keep-alive por host)
+    - Concorrência limitada (max_concurrency threads compartilhadas por todas
+      as requisições) e no máximo per_host expansões simultâneas por host
+    - expand_many espera no máximo budget segundos; o que não terminar
+      continua em segundo plano e fica no cache para a próxima vez
+    - Para de seguir quando sai dos encurtadores (is_shortener), sem visitar
+      a página da loja, e recusa hosts locais/privados (allow_private_hosts=True
+      só em testes)
+    """
+
+    def __init__(self, cache: SQLiteLinkCache = None, max_concurrency: int = 8, per_host: int = 2,
+                 timeout: float = 4.0, max_redirects: int = 5, budget: float = 8.0, is_shortener=None,
+                 allow_private_hosts: bool = False):
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.budget = budget
+        self.is_shortener = is_shortener
+        self.allow_private_hosts = allow_private_hosts
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='link-expander')
+        self._host_slots = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency, max_retries=0)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers['User-Agent'] = USER_AGENT
+        self._stats = {'cache_hits': 0, 'expanded': 0, 'failed': 0, 'timed_out': 0}
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False
+        if self.allow_private_hosts:
+            return True
+        if parts.hostname == 'localhost' or parts.hostname.endswith('.local'):
+            return False
+        try:
+            address = ipaddress.ip_address(parts.hostname)
+        except ValueError:
+            return True
+        return address.is_global
+
+    def _request(self, url: str):
+        response = self._session.head(url, allow_redirects=False, timeout=self.timeout)
+        if response.status_code in (403, 405, 501):
+            # Alguns encurtadores não aceitam HEAD: GET sem baixar o corpo
+            response.close()
+            response = self._session.get(url, allow_redirects=False, timeout=self.timeout, stream=True)
+        response.close()
+        return response
+
+    def expand(self, url: str):
+        """URL final do link ou None se não foi possível expandir (sem usar o cache)."""
+        current = url
+        for _ in range(self.max_redirects):
+            if not self._allowed(current):
+                return None
+            with self._host_slot(urlsplit(current).hostname):
+                response = self._request(current)
+            location = response.headers.get('Location')
+            if response.status_code not in REDIRECT_STATUSES or not location:
+                return current if current != url else None
+            current = urljoin(current, location)
+            if self.is_shortener and not self.is_shortener(current):
+                return current if self._allowed(current) else None
+        return current
+
+    def _expand_and_store(self, url: str):
+        try:
+            final_url = self.expand(url)
+        except requests.RequestException as exc:
+            logger.info("Não foi possível expandir %s: %s", url, exc)
+            final_url = None
+        with self._lock:
+            self._stats['expanded' if final_url else 'failed'] += 1
+        if self.cache:
+            try:
+                self.cache.set(url, final_url)
+            except sqlite3.Error as exc:
+                logger.warning("Erro ao gravar link expandido no cache: %s", exc)
+        return final_url
+
+    def _submit(self, url: str):
+        """Future da expansão; chamadas simultâneas para a mesma URL compartilham o trabalho."""
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._executor.submit(self._expand_and_store, url)
+                self._in_flight[url] = future
+                future.add_done_callback(lambda _, key=url: self._forget(key))
+            return future
+
+    def _forget(self, url: str):
+        with self._lock:
+            self._in_flight.pop(url, None)
+
+    def expand_many(self, urls) -> dict:
+        """
+        {url: URL final} para os links que puderam ser expandidos; os demais
+        (falha ou fora do orçamento de tempo) ficam de fora.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        cached = {}
+        if self.cache:
+            try:
+                cached = self.cache.get_many(urls)
+            except sqlite3.Error as exc:
+                logger.warning("Erro ao ler o cache de links: %s", exc)
+        result = {url: final for url, final in cached.items() if final}
+        pending = {url: self._submit(url) for url in urls if url not in cached}
+        with self._lock:
+            self._stats['cache_hits'] += len(cached)
+        if pending:
+            done, not_done = wait(pending.values(), timeout=self.budget)
+            with self._lock:
+                self._stats['timed_out'] += len(not_done)
+            for url, future in pending.items():
+                if future in done and future.result():
+                    result[url] = future.result()
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight))
+
+
+def create_link_expander_from_env(is_shortener=None):
+    """
+    Cria o expansor de links a partir das variáveis de ambiente (None se
+    desativado ou sem o pacote requests):
+    - LINK_EXPANSION_ENABLED: 'true' para expandir encurtadores (padrão: 'false')
+    - LINK_EXPANSION_CONCURRENCY / LINK_EXPANSION_PER_HOST: expansões simultâneas
+      no total e por host (padrão: 8 / 2)
+    - LINK_EXPANSION_TIMEOUT: timeout de cada requisição em segundos (padrão: 4)
+    - LINK_EXPANSION_BUDGET: espera máxima por descrição em segundos (padrão: 8)
+    - LINK_CACHE_PATH: arquivo SQLite do cache (padrão: <tmp>/youtube_shorts_links.db)
+    - LINK_CACHE_TTL: validade das expansões em segundos (padrão: 604800)
+    """
+    if os.environ.get('LINK_EXPANSION_ENABLED', 'false').lower() != 'true':
+        return None
+    if not REQUESTS_AVAILABLE:
+        logger.warning("LINK_EXPANSION_ENABLED sem o pacote requests; links não serão expandidos")
+        return None
+    path = os.environ.get('LINK_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'youtube_shorts_links.db')
+    return LinkExpander(
+        cache=SQLiteLinkCache(path, ttl_seconds=float(os.environ.get('LINK_CACHE_TTL', str(7 * 86400)))),
+        max_concurrency=int(os.environ.get('LINK_EXPANSION_CONCURRENCY', '8')),
+        per_host=int(os.environ.get('LINK_EXPANSION_PER_HOST', '2')),
+        timeout=float(os.environ.get('LINK_EXPANSION_TIMEOUT', '4')),
+        budget=float(os.environ.get('LINK_EXPANSION_BUDGET', '8')),
+        is_shortener=is_shortener,
+    )
@@ -0,0 +1,192 @@
+import os
+import re
+
+# Um único passe pela descrição: cada URL é uma sequência sem espaços a partir
+# de http(s)://, sem alternâncias nem quantificadores aninhados (tempo linear)
+URL_PATTERN = re.compile(r'https?://[^\s)<>"]+', re.IGNORECASE)
+TRAILING_PUNCTUATION = '.,;:!?)]}\'"'
+
+STORE = 'store'
+SHORTENER = 'shortener'
+MENTION = 'mention'
+
+DEFAULT_STORE_DOMAINS = (
+    'shopee.com.br', 'shopee.com', 'amazon.com.br', 'amazon.com', 'aliexpress.com', 'aliexpress.com.br',
+    'magazineluiza.com.br', 'mercadolivre.com.br', 'mercadolivre.com', 'americanas.com.br', 'submarino.com.br',
+    'shoptime.com.br',
+)
+DEFAULT_SHORTENER_DOMAINS = (
+    'amzn.to', 'a.co', 'bit.ly', 't.co', 'short.link', 'tinyurl.com', 'shope.ee', 's.click.aliexpress.com',
+    'mercadolivre.com/sec', 'magalu.lu',
+)
+
+
+class ProductLink:
+    """URL de produto encontrada na descrição"""
+
+    __slots__ = ('url', 'host', 'kind')
+
+    def __init__(self, url: str, host: str, kind: str):
+        self.url = url
+        self.host = host
+        self.kind = kind
+
+    def __repr__(self):
+        return f'<ProductLink {self.kind} {self.url}>'
+
+
+class LinkFilter:
+    """
+    Filtro de links por termos: a URL precisa conter algum termo de include
+    (se houver) e nenhum de exclude. Comparação sem diferenciar maiúsculas.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = tuple(term.lower() for term in include if term)
+        self.exclude = tuple(term.lower() for term in exclude if term)
+
+    @classmethod
+    def parse(cls, spec: str):
+        """
+        Lê o parâmetro linkFilter: termos separados por vírgula; termos com '-'
+        na frente excluem. Ex.: 'shopee, amazon, -cupom'. Um termo só continua
+        funcionando como antes.
+        """
+        include, exclude = [], []
+        for term in (spec or '').split(','):
+            term = term.strip()
+            if term.startswith('-'):
+                exclude.append(term[1:].strip())
+            elif term:
+                include.append(term)
+        return cls(include, exclude)
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def matches(self, url: str) -> bool:
+        lowered = url.lower()
+        if self.include and not any(term in lowered for term in self.include):
+            return False
+        return not any(term in lowered for term in self.exclude)
+
+
+class LinkExtractor:
+    """
+    Extrator de links de produtos em uma única leitura da descrição.
+
+    Cada URL encontrada é classificada pelo host em um índice de domínios
+    (dicionário consultado sufixo a sufixo: 's.shopee.com.br' ->
+    'shopee.com.br'), sem regex por domínio:
+    - store: domínio de loja
+    - shortener: encurtador (o destino é desconhecido até ser expandido)
+    - mention: outro domínio, mas a URL cita uma loja (ex.: redirecionador
+      de afiliado com a loja no caminho)
+
+    URLs são normalizadas (esquema e host em minúsculas, sem pontuação final
+    nem porta padrão) e deduplicadas.
+    """
+
+    def __init__(self, store_domains=DEFAULT_STORE_DOMAINS, shortener_domains=DEFAULT_SHORTENER_DOMAINS):
+        self.domains = {}
+        self.shortener_paths = {}
+        for domain in store_domains:
+            self.domains[domain.lower().strip('.')] = STORE
+        for domain in shortener_domains:
+            domain = domain.lower().strip('.')
+            if '/' in domain:
+                # Encurtador em um caminho de domínio de loja (ex.: mercadolivre.com/sec)
+                host, path = domain.split('/', 1)
+                self.shortener_paths.setdefault(host, []).append('/' + path)
+            else:
+                self.domains[domain] = SHORTENER
+        # Nomes das lojas (primeiro rótulo do domínio) para as citações em outros domínios
+        self.mentions = tuple(sorted({domain.split('.', 1)[0] for domain, kind in self.domains.items()
+                                      if kind == STORE}))
+
+    def classify(self, host: str, path: str = '') -> str:
+        """Tipo do host (STORE, SHORTENER) ou None; sobe pelos sufixos do domínio."""
+        while host:
+            paths = self.shortener_paths.get(host)
+            if paths and any(path.startswith(prefix) for prefix in paths):
+                return SHORTENER
+            kind = self.domains.get(host)
+            if kind:
+                return kind
+            dot = host.find('.')
+            if dot < 0:
+                return None
+            host = host[dot + 1:]
+        return None
+
+    @staticmethod
+    def normalize(url: str):
+        """(URL normalizada, host, caminho e query) ou None se não houver host."""
+        url = url.rstrip(TRAILING_PUNCTUATION)
+        scheme_end = url.find('://')
+        scheme = url[:scheme_end].lower()
+        rest = url[scheme_end + 3:]
+        cut = len(rest)
+        for separator in '/?#':
+            position = rest.find(separator)
+            if 0 <= position < cut:
+                cut = position
+        authority, tail = rest[:cut], rest[cut:]
+        host = authority.rsplit('@', 1)[-1].lower()
+        if host.endswith(':80') and scheme == 'http' or host.endswith(':443') and scheme == 'https':
+            host = host.rsplit(':', 1)[0]
+        host = host.rstrip('.')
+        if not host or host.startswith(':'):
+            return None
+        return f'{scheme}://{host}{tail}', host.split(':', 1)[0], tail
+
+    def classify_url(self, url: str):
+        """ProductLink da URL ou None se ela não for de produto."""
+        normalized = self.normalize(url)
+        if normalized is None:
+            return None
+        url, host, tail = normalized
+        kind = self.classify(host, tail.lower())
+        if kind is None:
+            lowered = url.lower()
+            if not any(name in lowered for name in self.mentions):
+                return None
+            kind = MENTION
+        return ProductLink(url, host, kind)
+
+    def is_shortener(self, url: str) -> bool:
+        link = self.classify_url(url)
+        return link is not None and link.kind == SHORTENER
+
+    def extract(self, text: str, link_filter: LinkFilter = None) -> list:
+        """ProductLinks da descrição, na ordem em que aparecem, sem repetições."""
+        if not text:
+            return []
+        links = []
+        seen = set()
+        for match in URL_PATTERN.finditer(text):
+            link = self.classify_url(match.group())
+            if link is None or link.url in seen:
+                continue
+            seen.add(link.url)
+            if link_filter and not link_filter.matches(link.url):
+                continue
+            links.append(link)
+        return links
+
+
+def _env_domains(name: str, defaults: tuple) -> tuple:
+    extra = [domain.strip() for domain in os.environ.get(name, '').split(',') if domain.strip()]
+    return tuple(defaults) + tuple(extra)
+
+
+def create_link_extractor_from_env() -> LinkExtractor:
+    """
+    Cria o extrator com os domínios padrão mais os das variáveis de ambiente:
+    - PRODUCT_LINK_DOMAINS: domínios de lojas extras, separados por vírgula
+    - PRODUCT_LINK_SHORTENERS: encurtadores extras, separados por vírgula
+    """
+    return LinkExtractor(
+        store_domains=_env_domains('PRODUCT_LINK_DOMAINS', DEFAULT_STORE_DOMAINS),
+        shortener_domains=_env_domains('PRODUCT_LINK_SHORTENERS', DEFAULT_SHORTENER_DOMAINS),
+    )
@@ -41,3 +41,17 @@ class User(db.Model):
 
 
 
+
+
+class RevokedToken(db.Model):
+    """Token JWT revogado (logout), guardado até a sua expiração"""
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.String(64), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
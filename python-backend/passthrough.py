@@ -0,0 +1,88 @@
+import logging
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import requests
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Cabeçalhos da origem repassados ao cliente (Range/206 funcionam de ponta a ponta)
+FORWARDED_HEADERS = ('Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified', 'ETag')
+
+
+class PassthroughError(Exception):
+    """A origem recusou o stream (ex.: URL assinada expirada)"""
+
+
+def select_progressive_format(info: dict):
+    """
+    Formato progressivo (vídeo + áudio no mesmo arquivo, via HTTP) escolhido
+    pelo yt-dlp, ou None quando o seletor resolveu para vídeo+áudio separados
+    (DASH, exige merge) ou para um protocolo que não é HTTP simples.
+
+    Args:
+        info: info_dict já processado por process_ie_result(download=False)
+    """
+    if not info or info.get('requested_formats'):
+        return None
+    if info.get('vcodec') in (None, 'none') or info.get('acodec') in (None, 'none'):
+        return None
+    if info.get('protocol') not in ('http', 'https') or not info.get('url'):
+        return None
+    return {
+        'url': info['url'],
+        'http_headers': dict(info.get('http_headers') or {}),
+        'format_id': info.get('format_id'),
+        'ext': info.get('ext') or 'mp4',
+    }
+
+
+def open_upstream(fmt: dict, range_header: str = None, session=None, timeout=(10, 30)):
+    """
+    Abre o stream do formato na origem, repassando o Range do cliente.
+
+    Raises:
+        PassthroughError: resposta diferente de 200/206
+    """
+    headers = dict(fmt.get('http_headers') or {})
+    # Sem compressão de transporte: os bytes (e o Content-Length) são repassados como estão
+    headers['Accept-Encoding'] = 'identity'
+    if range_header:
+        headers['Range'] = range_header
+
+    upstream = (session or requests).get(fmt['url'], headers=headers, stream=True, timeout=timeout)
+    if upstream.status_code not in (200, 206):
+        upstream.close()
+        raise PassthroughError(f"Origem respondeu HTTP {upstream.status_code}")
+    return upstream
+
+
+def proxy_response(upstream, filename: str, mimetype: str = 'video/mp4', chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Resposta Flask que repassa os bytes da origem conforme chegam.
+
+    O gerador só lê o próximo bloco da origem quando o servidor WSGI pede o
+    próximo bloco da resposta, ou seja, depois de escrever o anterior no socket
+    do cliente (backpressure natural, sem acumular o vídeo em memória).
+    """
+    def generate():
+        try:
+            for chunk in upstream.iter_content(chunk_size):
+                if chunk:
+                    yield chunk
+        finally:
+            upstream.close()
+
+    headers = {name: upstream.headers[name] for name in FORWARDED_HEADERS if name in upstream.headers}
+    headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    headers['X-Accel-Buffering'] = 'no'
+
+    response = Response(generate(), status=upstream.status_code, mimetype=mimetype, headers=headers)
+    response.call_on_close(upstream.close)
+    return response
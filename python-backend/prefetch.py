@@ -0,0 +1,209 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_RANKS = {'high': 0, 'normal': 1, 'low': 2}
+
+
+class PrefetchItem:
+    """Vídeo na fila de pré-carregamento"""
+
+    __slots__ = ('video_id', 'quality', 'include_video', 'priority')
+
+    def __init__(self, video_id: str, quality: str = None, include_video: bool = False, priority: str = 'normal'):
+        self.video_id = video_id
+        self.quality = quality
+        self.include_video = include_video
+        self.priority = priority
+
+    def __repr__(self):
+        return f'<PrefetchItem {self.video_id} ({self.priority})>'
+
+
+class PrefetchBudget:
+    """
+    Bytes que o pré-carregamento colocou no cache em disco. Cada vídeo conta
+    até o arquivo sair do cache (remoção LRU ou expiração): used() descarta
+    os caminhos que não existem mais. Vídeos baixados pelos usuários não
+    entram na conta. A contagem é por processo (cada worker tem seu orçamento).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._files = {}  # caminho no cache -> bytes
+        self._lock = threading.Lock()
+
+    def add(self, path: str, size: int):
+        with self._lock:
+            self._files[path] = size
+
+    def used(self) -> int:
+        with self._lock:
+            for path in [path for path in self._files if not os.path.exists(path)]:
+                del self._files[path]
+            return sum(self._files.values())
+
+    def fits(self, size: int) -> bool:
+        return self.used() + size <= self.max_bytes
+
+    def stats(self) -> dict:
+        used = self.used()
+        with self._lock:
+            files = len(self._files)
+        return {'max_bytes': self.max_bytes, 'bytes': used, 'files': files}
+
+
+class Prefetcher:
+    """
+    Pré-carregamento em segundo plano dos vídeos que o usuário provavelmente
+    vai abrir (sugestões, listas em alta).
+
+    - Fila com prioridade ('high', 'normal', 'low') e, dentro da mesma
+      prioridade, na ordem da lista; vídeos já na fila ou pré-carregados há
+      menos de recent_ttl segundos são ignorados
+    - Poucos workers (workers): o pré-carregamento nunca compete de igual
+      para igual com as requisições dos usuários
+    - warm_info(video_id): aquece o cache de informações (a extração passa
+      pelo limitador de saída com prioridade BACKGROUND); devolve a mensagem
+      de erro ou None
+    - warm_video(item): baixa o vídeo para o cache em disco; só é chamado se
+      video_room(item) permitir (orçamento de disco, fila de downloads livre)
+      e devolve a mensagem de erro ou None
+
+    Args:
+        warm_info: Função video_id -> erro ou None
+        warm_video: Função PrefetchItem -> erro ou None (None desativa vídeos)
+        video_room: Função PrefetchItem -> motivo para não baixar agora ou None
+    """
+
+    def __init__(self, warm_info, warm_video=None, video_room=None, workers: int = 2, max_queue: int = 200,
+                 recent_ttl: float = 600.0):
+        self.warm_info = warm_info
+        self.warm_video = warm_video
+        self.video_room = video_room
+        self.workers = workers
+        self.max_queue = max_queue
+        self.recent_ttl = recent_ttl
+        self._heap = []
+        self._order = itertools.count()
+        self._pending = set()  # vídeos na fila ou em andamento
+        self._recent = {}  # video_id (e qualidade do vídeo) -> expira_em
+        self._threads = []
+        self._cond = threading.Condition()
+        self._stats = {'queued': 0, 'skipped': 0, 'rejected': 0, 'info_warmed': 0, 'info_failed': 0,
+                       'videos_warmed': 0, 'videos_failed': 0, 'videos_deferred': 0}
+
+    @staticmethod
+    def _key(item: PrefetchItem) -> tuple:
+        return (item.video_id, item.quality if item.include_video else None)
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker_loop, name=f'prefetch-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, items: list) -> dict:
+        """
+        Enfileira os itens (na ordem recebida).
+
+        Returns:
+            {'queued': [...], 'skipped': [...], 'rejected': [...]} com os IDs;
+            skipped: já na fila ou pré-carregados há pouco; rejected: fila cheia
+        """
+        result = {'queued': [], 'skipped': [], 'rejected': []}
+        now = time.time()
+        with self._cond:
+            for item in items:
+                key = self._key(item)
+                if key in self._pending or self._recent.get(key, 0) > now:
+                    result['skipped'].append(item.video_id)
+                elif len(self._heap) >= self.max_queue:
+                    result['rejected'].append(item.video_id)
+                else:
+                    self._pending.add(key)
+                    heapq.heappush(self._heap, (PRIORITY_RANKS.get(item.priority, 1), next(self._order), item))
+                    result['queued'].append(item.video_id)
+            self._stats['queued'] += len(result['queued'])
+            self._stats['skipped'] += len(result['skipped'])
+            self._stats['rejected'] += len(result['rejected'])
+            if result['queued']:
+                self._ensure_workers()
+                self._cond.notify(len(result['queued']))
+        return result
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, item = heapq.heappop(self._heap)
+            try:
+                self._run(item)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Erro no pré-carregamento de %s", item.video_id)
+            finally:
+                with self._cond:
+                    key = self._key(item)
+                    self._pending.discard(key)
+                    now = time.time()
+                    self._recent[key] = now + self.recent_ttl
+                    if len(self._recent) > 4 * self.max_queue:
+                        self._recent = {k: expires for k, expires in self._recent.items() if expires > now}
+
+    def _count(self, name: str):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _run(self, item: PrefetchItem):
+        error = self.warm_info(item.video_id)
+        if error:
+            logger.info("Pré-carregamento de %s falhou: %s", item.video_id, error)
+            self._count('info_failed')
+            return
+        self._count('info_warmed')
+        if not item.include_video or self.warm_video is None:
+            return
+        reason = self.video_room(item) if self.video_room else None
+        if reason:
+            logger.info("Vídeo %s não pré-carregado: %s", item.video_id, reason)
+            self._count('videos_deferred')
+            return
+        error = self.warm_video(item)
+        if error:
+            logger.info("Pré-carregamento do vídeo %s falhou: %s", item.video_id, error)
+        self._count('videos_failed' if error else 'videos_warmed')
+
+    def stats(self) -> dict:
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'pending': len(self._pending),
+                'waiting': len(self._heap),
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'video_enabled': self.warm_video is not None,
+            })
+        return data
+
+
+def create_prefetcher_from_env(warm_info, warm_video=None, video_room=None) -> Prefetcher:
+    """
+    Cria o pré-carregador a partir das variáveis de ambiente:
+    - PREFETCH_WORKERS: vídeos pré-carregados ao mesmo tempo (padrão: 2)
+    - PREFETCH_MAX_QUEUE: limite da fila (padrão: 200)
+    - PREFETCH_RECENT_TTL: segundos em que um vídeo já pré-carregado é ignorado (padrão: 600)
+    """
+    return Prefetcher(
+        warm_info,
+        warm_video=warm_video,
+        video_room=video_room,
+        workers=int(os.environ.get('PREFETCH_WORKERS', '2')),
+        max_queue=int(os.environ.get('PREFETCH_MAX_QUEUE', '200')),
+        recent_ttl=float(os.environ.get('PREFETCH_RECENT_TTL', '600')),
+    )
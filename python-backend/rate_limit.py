@@ -0,0 +1,500 @@
+import logging
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Prioridades do limitador de saída: downloads interativos passam na frente
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class RateLimited(Exception):
+    """
+    Limite de requisições atingido; retry_after em segundos. code identifica
+    o limite (ex.: 'USER_RATE_LIMIT', 'DAILY_QUOTA') nas respostas 429.
+    """
+
+    def __init__(self, message: str, retry_after: int, code: str = 'RATE_LIMIT'):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.code = code
+
+
+class BucketSpec:
+    """
+    Balde de tokens: rate tokens/s, até burst tokens. reserve é o saldo que
+    precisa sobrar depois do consumo (usado para deixar folga para chamadas
+    de prioridade maior).
+    """
+
+    def __init__(self, key: str, rate: float, burst: float, reserve: float = 0.0):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+
+
+def _level(states: dict, spec: BucketSpec, now: float) -> float:
+    tokens, updated_at = states.get(spec.key, (spec.burst, now))
+    return min(spec.burst, tokens + max(0.0, now - updated_at) * spec.rate)
+
+
+def _take(states: dict, specs: list, cost: float, now: float):
+    """
+    Consome cost tokens de todos os baldes ou de nenhum. Um balde menor que
+    cost (burst < cost) cede o burst inteiro: senão nunca teria saldo.
+
+    Args:
+        states: key -> (tokens, updated_at) atuais (ausente = balde cheio)
+
+    Returns:
+        (espera em segundos até haver saldo (0 se consumiu), novos estados)
+    """
+    levels = {}
+    wait = 0.0
+    for spec in specs:
+        tokens = levels[spec.key] = _level(states, spec, now)
+        spec_cost = min(cost, spec.burst)
+        needed = spec_cost + min(spec.reserve, spec.burst - spec_cost)
+        if tokens < needed:
+            wait = max(wait, (needed - tokens) / spec.rate)
+    if wait > 0:
+        return wait, {}
+    return 0.0, {spec.key: (levels[spec.key] - min(cost, spec.burst), now) for spec in specs}
+
+
+class MemoryBucketBackend:
+    """Baldes em memória (por processo)"""
+
+    def __init__(self):
+        self._states = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def take(self, specs: list, cost: float) -> float:
+        with self._lock:
+            wait, updates = _take(self._states, specs, cost, time.time())
+            self._states.update(updates)
+        return wait
+
+    def levels(self, specs: list) -> dict:
+        now = time.time()
+        with self._lock:
+            return {spec.key: round(_level(self._states, spec, now), 2) for spec in specs}
+
+    def add(self, key: str, amount: float, expires_at: float) -> float:
+        """Soma amount ao contador (criado zerado se ausente ou expirado) e retorna o novo valor."""
+        now = time.time()
+        with self._lock:
+            value, expires = self._counters.get(key, (0.0, expires_at))
+            if expires <= now:
+                value = 0.0
+            value += amount
+            self._counters[key] = (value, expires_at)
+            # Descartar contadores vencidos (ex.: cotas de dias anteriores)
+            for stale in [k for k, (_, e) in self._counters.items() if e <= now]:
+                del self._counters[stale]
+        return value
+
+    def get(self, key: str) -> float:
+        with self._lock:
+            value, expires = self._counters.get(key, (0.0, 0.0))
+        return value if expires > time.time() else 0.0
+
+
+class SQLiteBucketBackend:
+    """Baldes em SQLite, compartilhados entre os workers do gunicorn"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_counters ('
+                'key TEXT PRIMARY KEY, value REAL NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _read(self, conn, specs: list) -> dict:
+        keys = [spec.key for spec in specs]
+        rows = conn.execute(
+            f"SELECT key, tokens, updated_at FROM rate_buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall()
+        return {key: (tokens, updated_at) for key, tokens, updated_at in rows}
+
+    def take(self, specs: list, cost: float) -> float:
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE serializa a leitura + escrita entre processos
+            conn.isolation_level = None
+            conn.execute('BEGIN IMMEDIATE')
+            wait, updates = _take(self._read(conn, specs), specs, cost, time.time())
+            conn.executemany('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                             [(key, tokens, updated_at) for key, (tokens, updated_at) in updates.items()])
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def levels(self, specs: list) -> dict:
+        now = time.time()
+        with self._connect() as conn:
+            states = self._read(conn, specs)
+        return {spec.key: round(_level(states, spec, now), 2) for spec in specs}
+
+    def add(self, key: str, amount: float, expires_at: float) -> float:
+        """Soma amount ao contador (criado zerado se ausente ou expirado) e retorna o novo valor."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM rate_counters WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'INSERT INTO rate_counters (key, value, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+                (key, amount, expires_at)
+            )
+            row = conn.execute('SELECT value FROM rate_counters WHERE key = ?', (key,)).fetchone()
+        return row[0]
+
+    def get(self, key: str) -> float:
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM rate_counters WHERE key = ? AND expires_at > ?',
+                               (key, time.time())).fetchone()
+        return row[0] if row else 0.0
+
+
+class OutboundLimiter:
+    """
+    Ritmo das requisições ao YouTube (extrações e downloads): um balde global
+    e um por identidade (arquivo de cookies ou 'anonymous').
+
+    Chamadas em segundo plano (batch, prefetch) só consomem tokens se sobrar
+    background_reserve (fração do burst) no balde depois do consumo; essa
+    folga fica para os downloads interativos. acquire() espera até haver
+    saldo, no máximo max_wait[priority] segundos.
+    """
+
+    def __init__(self, backend, global_rate_per_minute: float = 60, global_burst: float = 10,
+                 identity_rate_per_minute: float = 30, identity_burst: float = 5,
+                 background_reserve: float = 0.5, max_wait: dict = None):
+        self.backend = backend
+        self.global_rate = global_rate_per_minute / 60.0
+        self.global_burst = global_burst
+        self.identity_rate = identity_rate_per_minute / 60.0
+        self.identity_burst = identity_burst
+        self.background_reserve = background_reserve
+        self.max_wait = {INTERACTIVE: 30.0, BACKGROUND: 300.0}
+        self.max_wait.update(max_wait or {})
+        self._lock = threading.Lock()
+        self._stats = {priority: {'acquired': 0, 'waited': 0, 'timeouts': 0, 'errors': 0,
+                                  'wait_total': 0.0, 'wait_max': 0.0}
+                       for priority in PRIORITIES}
+
+    @property
+    def enabled(self) -> bool:
+        return self.global_rate > 0 or self.identity_rate > 0
+
+    def _specs(self, identity: str, priority: str) -> list:
+        reserve_fraction = self.background_reserve if priority == BACKGROUND else 0.0
+        specs = []
+        if self.global_rate > 0:
+            specs.append(BucketSpec('outbound:global', self.global_rate, self.global_burst,
+                                    reserve_fraction * self.global_burst))
+        if self.identity_rate > 0:
+            specs.append(BucketSpec(f"outbound:identity:{identity or 'anonymous'}", self.identity_rate,
+                                    self.identity_burst, reserve_fraction * self.identity_burst))
+        return specs
+
+    def acquire(self, identity: str = None, priority: str = INTERACTIVE, cost: float = 1.0) -> float:
+        """
+        Espera até poder fazer uma requisição ao YouTube.
+
+        Returns:
+            Segundos de espera
+
+        Raises:
+            RateLimited: a espera passaria de max_wait[priority]
+        """
+        if not self.enabled:
+            return 0.0
+        specs = self._specs(identity, priority)
+        started = time.monotonic()
+        deadline = started + self.max_wait.get(priority, self.max_wait[INTERACTIVE])
+        while True:
+            try:
+                wait = self.backend.take(specs, cost)
+            except Exception as exc:  # pylint: disable=broad-except
+                # Falha no armazenamento não deve bloquear os downloads
+                logger.warning("Erro no limitador de saída; seguindo sem limite: %s", exc)
+                self._record(priority, 'errors')
+                return 0.0
+            waited = time.monotonic() - started
+            if wait <= 0:
+                self._record(priority, 'acquired', waited)
+                return waited
+            if time.monotonic() + wait > deadline:
+                self._record(priority, 'timeouts', waited)
+                raise RateLimited("Limite de requisições ao YouTube atingido; tente novamente em instantes",
+                                  retry_after=max(1, math.ceil(wait)))
+            # Acordar antes para disputar tokens de forma justa entre workers
+            time.sleep(min(wait, 0.5) + random.uniform(0, 0.05))
+
+    def _record(self, priority: str, outcome: str, waited: float = 0.0):
+        with self._lock:
+            stats = self._stats.setdefault(priority, {'acquired': 0, 'waited': 0, 'timeouts': 0, 'errors': 0,
+                                                      'wait_total': 0.0, 'wait_max': 0.0})
+            stats[outcome] += 1
+            if waited > 0.001:
+                stats['waited'] += 1
+                stats['wait_total'] += waited
+                stats['wait_max'] = max(stats['wait_max'], waited)
+
+    def stats(self) -> dict:
+        with self._lock:
+            priorities = {}
+            for priority, stats in self._stats.items():
+                data = dict(stats)
+                data['wait_avg_ms'] = round(stats['wait_total'] / stats['acquired'] * 1000, 1) if stats['acquired'] else 0.0
+                data['wait_total'] = round(stats['wait_total'], 3)
+                data['wait_max'] = round(stats['wait_max'], 3)
+                priorities[priority] = data
+        data = {
+            'enabled': self.enabled,
+            'global_per_minute': self.global_rate * 60,
+            'identity_per_minute': self.identity_rate * 60,
+            'priorities': priorities,
+        }
+        if self.global_rate > 0:
+            try:
+                data['global_tokens'] = self.backend.levels(self._specs(None, INTERACTIVE)[:1])['outbound:global']
+            except Exception:  # pylint: disable=broad-except
+                pass
+        return data
+
+
+def next_utc_midnight(now: float = None) -> float:
+    now = time.time() if now is None else now
+    return (math.floor(now / 86400) + 1) * 86400
+
+
+class InboundLimiter:
+    """
+    Limites das requisições dos clientes nos endpoints de download:
+
+    - balde de tokens por usuário (sub do JWT) e por IP: rajadas curtas são
+      aceitas, o ritmo sustentado fica limitado
+    - cotas diárias por usuário (dia UTC): número de downloads e bytes enviados
+
+    check() consome os tokens e conta o download, ou levanta RateLimited
+    (Retry-After até haver token ou até a virada do dia, no caso das cotas).
+    """
+
+    def __init__(self, backend, user_rate_per_minute: float = 20, user_burst: float = 10,
+                 ip_rate_per_minute: float = 60, ip_burst: float = 20,
+                 daily_downloads: int = 200, daily_bytes: int = 10 * 1024 ** 3):
+        self.backend = backend
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate_per_minute / 60.0
+        self.ip_burst = ip_burst
+        self.daily_downloads = daily_downloads
+        self.daily_bytes = daily_bytes
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'rejected': {}, 'errors': 0}
+
+    def _quota_key(self, user_id: str, name: str, now: float) -> str:
+        return f"quota:{user_id}:{time.strftime('%Y%m%d', time.gmtime(now))}:{name}"
+
+    def _reject(self, exc: RateLimited):
+        with self._lock:
+            self._stats['rejected'][exc.code] = self._stats['rejected'].get(exc.code, 0) + 1
+        raise exc
+
+    def check(self, user_id: str = None, ip: str = None, downloads: int = 1) -> dict:
+        """
+        Args:
+            user_id: sub do JWT (None para requisições sem login: só o limite por IP)
+            ip: IP do cliente
+            downloads: quantos downloads contar na cota diária (0 para não contar)
+
+        Returns:
+            Estado das cotas do usuário (para quota_headers)
+
+        Raises:
+            RateLimited: limite de ritmo ou cota diária atingidos
+        """
+        now = time.time()
+        try:
+            user_spec = ip_spec = None
+            if self.user_rate > 0 and user_id:
+                user_spec = BucketSpec(f"inbound:user:{user_id}", self.user_rate, self.user_burst)
+            if self.ip_rate > 0 and ip:
+                ip_spec = BucketSpec(f"inbound:ip:{ip}", self.ip_rate, self.ip_burst)
+            specs = [spec for spec in (user_spec, ip_spec) if spec]
+            # Os dois baldes juntos: recusa por IP não gasta o token do usuário
+            wait = self.backend.take(specs, 1) if specs else 0.0
+            if wait > 0:
+                if user_spec and self.backend.levels([user_spec])[user_spec.key] < 1:
+                    self._reject(RateLimited("Muitas requisições. Aguarde um pouco antes de tentar novamente.",
+                                             max(1, math.ceil(wait)), 'USER_RATE_LIMIT'))
+                self._reject(RateLimited("Muitas requisições deste endereço. Aguarde um pouco.",
+                                         max(1, math.ceil(wait)), 'IP_RATE_LIMIT'))
+            if not user_id:
+                return {}
+
+            reset = next_utc_midnight(now)
+            until_reset = max(1, math.ceil(reset - now))
+            if self.daily_bytes > 0:
+                used_bytes = self.backend.get(self._quota_key(user_id, 'bytes', now))
+                if used_bytes >= self.daily_bytes:
+                    self._reject(RateLimited("Limite diário de dados atingido.", until_reset, 'DAILY_BYTE_QUOTA'))
+            if downloads > 0 and self.daily_downloads > 0:
+                # Incrementa antes de comparar: atômico entre workers
+                used = self.backend.add(self._quota_key(user_id, 'downloads', now), downloads, reset)
+                if used > self.daily_downloads:
+                    self.backend.add(self._quota_key(user_id, 'downloads', now), -downloads, reset)
+                    self._reject(RateLimited("Limite diário de downloads atingido.", until_reset, 'DAILY_QUOTA'))
+        except RateLimited:
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            # Falha no armazenamento não deve derrubar os downloads
+            logger.warning("Erro no limitador de entrada; seguindo sem limite: %s", exc)
+            with self._lock:
+                self._stats['errors'] += 1
+            return {}
+
+        with self._lock:
+            self._stats['allowed'] += 1
+        return self.quota_status(user_id, now)
+
+    def refund_downloads(self, user_id: str, downloads: int = 1):
+        """Devolve os downloads contados por check() quando a requisição falhou."""
+        if not user_id or downloads <= 0 or self.daily_downloads <= 0:
+            return
+        now = time.time()
+        try:
+            self.backend.add(self._quota_key(user_id, 'downloads', now), -downloads, next_utc_midnight(now))
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Erro ao devolver download à cota: %s", exc)
+
+    def record_bytes(self, user_id: str, nbytes: int):
+        """Soma os bytes enviados à cota diária do usuário."""
+        if not user_id or self.daily_bytes <= 0 or nbytes <= 0:
+            return
+        now = time.time()
+        try:
+            self.backend.add(self._quota_key(user_id, 'bytes', now), nbytes, next_utc_midnight(now))
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Erro ao registrar bytes na cota: %s", exc)
+
+    def quota_status(self, user_id: str, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        status = {'reset': int(next_utc_midnight(now))}
+        if self.daily_downloads > 0:
+            used = self.backend.get(self._quota_key(user_id, 'downloads', now))
+            status['downloads_limit'] = self.daily_downloads
+            status['downloads_remaining'] = max(0, int(self.daily_downloads - used))
+        if self.daily_bytes > 0:
+            used = self.backend.get(self._quota_key(user_id, 'bytes', now))
+            status['bytes_limit'] = self.daily_bytes
+            status['bytes_remaining'] = max(0, int(self.daily_bytes - used))
+        return status
+
+    @staticmethod
+    def quota_headers(status: dict) -> dict:
+        """Cabeçalhos X-Quota-* com o saldo das cotas diárias."""
+        headers = {}
+        if 'downloads_remaining' in status:
+            headers['X-Quota-Downloads-Limit'] = str(status['downloads_limit'])
+            headers['X-Quota-Downloads-Remaining'] = str(status['downloads_remaining'])
+        if 'bytes_remaining' in status:
+            headers['X-Quota-Bytes-Limit'] = str(status['bytes_limit'])
+            headers['X-Quota-Bytes-Remaining'] = str(status['bytes_remaining'])
+        if headers:
+            headers['X-Quota-Reset'] = str(status['reset'])
+        return headers
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = {'allowed': self._stats['allowed'], 'rejected': dict(self._stats['rejected']),
+                    'errors': self._stats['errors']}
+        data.update({
+            'user_per_minute': self.user_rate * 60,
+            'ip_per_minute': self.ip_rate * 60,
+            'daily_downloads': self.daily_downloads,
+            'daily_bytes': self.daily_bytes,
+        })
+        return data
+
+
+def create_bucket_backend_from_env():
+    """
+    Backend dos baldes: RATE_LIMIT_BACKEND='sqlite' (padrão, compartilhado entre
+    workers em RATE_LIMIT_PATH) ou 'memory'.
+    """
+    backend = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite').lower()
+    if backend == 'sqlite':
+        path = os.environ.get('RATE_LIMIT_PATH') or os.path.join(tempfile.gettempdir(), 'youtube_shorts_ratelimit.db')
+        try:
+            return SQLiteBucketBackend(path)
+        except sqlite3.Error as exc:
+            logger.warning("Não foi possível abrir %s (%s); usando limitador em memória", path, exc)
+    return MemoryBucketBackend()
+
+
+def create_outbound_limiter_from_env(backend=None) -> OutboundLimiter:
+    """
+    Cria o limitador de saída a partir das variáveis de ambiente:
+    - OUTBOUND_RATE_PER_MINUTE / OUTBOUND_BURST: balde global (padrão: 60 / 10; 0 desativa)
+    - OUTBOUND_IDENTITY_RATE_PER_MINUTE / OUTBOUND_IDENTITY_BURST: balde por identidade (padrão: 30 / 5)
+    - OUTBOUND_BACKGROUND_RESERVE: fração do burst reservada aos downloads interativos (padrão: 0.5)
+    - OUTBOUND_MAX_WAIT / OUTBOUND_BACKGROUND_MAX_WAIT: espera máxima em segundos (padrão: 30 / 300)
+    """
+    return OutboundLimiter(
+        backend or create_bucket_backend_from_env(),
+        global_rate_per_minute=float(os.environ.get('OUTBOUND_RATE_PER_MINUTE', '60')),
+        global_burst=float(os.environ.get('OUTBOUND_BURST', '10')),
+        identity_rate_per_minute=float(os.environ.get('OUTBOUND_IDENTITY_RATE_PER_MINUTE', '30')),
+        identity_burst=float(os.environ.get('OUTBOUND_IDENTITY_BURST', '5')),
+        background_reserve=float(os.environ.get('OUTBOUND_BACKGROUND_RESERVE', '0.5')),
+        max_wait={
+            INTERACTIVE: float(os.environ.get('OUTBOUND_MAX_WAIT', '30')),
+            BACKGROUND: float(os.environ.get('OUTBOUND_BACKGROUND_MAX_WAIT', '300')),
+        },
+    )
+
+
+def create_inbound_limiter_from_env(backend=None) -> InboundLimiter:
+    """
+    Cria o limitador de entrada a partir das variáveis de ambiente (0 desativa cada limite):
+    - INBOUND_USER_RATE_PER_MINUTE / INBOUND_USER_BURST: por usuário (padrão: 20 / 10)
+    - INBOUND_IP_RATE_PER_MINUTE / INBOUND_IP_BURST: por IP (padrão: 60 / 20)
+    - DAILY_DOWNLOAD_QUOTA: downloads por usuário por dia UTC (padrão: 200)
+    - DAILY_BYTE_QUOTA: bytes enviados por usuário por dia UTC (padrão: 10 GiB)
+    """
+    return InboundLimiter(
+        backend or create_bucket_backend_from_env(),
+        user_rate_per_minute=float(os.environ.get('INBOUND_USER_RATE_PER_MINUTE', '20')),
+        user_burst=float(os.environ.get('INBOUND_USER_BURST', '10')),
+        ip_rate_per_minute=float(os.environ.get('INBOUND_IP_RATE_PER_MINUTE', '60')),
+        ip_burst=float(os.environ.get('INBOUND_IP_BURST', '20')),
+        daily_downloads=int(os.environ.get('DAILY_DOWNLOAD_QUOTA', '200')),
+        daily_bytes=int(os.environ.get('DAILY_BYTE_QUOTA', str(10 * 1024 ** 3))),
+    )
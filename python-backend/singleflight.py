@@ -0,0 +1,266 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows: coalescência apenas dentro do processo
+    FCNTL_AVAILABLE = False
+
+
+class Flight:
+    """Execução em andamento para uma chave, compartilhada por todos que a aguardam"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.last_progress = None
+        self._subscribers = []
+        self._done_callbacks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def resolved(cls, key: str, result):
+        """Execução já concluída (ex.: resultado encontrado em cache)."""
+        flight = cls(key)
+        flight.result = result
+        flight.waiters = 1
+        flight.done.set()
+        return flight
+
+    def wait(self, timeout: float = None):
+        """Aguarda a conclusão e retorna o resultado (ou levanta o erro)."""
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Execução de {self.key} não terminou em {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def add_done_callback(self, callback):
+        """Chama callback(flight) na conclusão (imediatamente, se já concluída)."""
+        with self._lock:
+            if not self.done.is_set():
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_done(self):
+        with self._lock:
+            self.done.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Erro em callback de conclusão: %s", exc)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+            last = self.last_progress
+        # Quem chega depois recebe o último estado imediatamente
+        if last is not None:
+            callback(dict(last))
+
+    def publish(self, data: dict):
+        with self._lock:
+            self.last_progress = dict(data)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(dict(data))
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Erro ao repassar progresso compartilhado: %s", exc)
+
+
+class SingleFlight:
+    """
+    Coalescência de requisições (single-flight) por chave.
+
+    Dentro do processo, a primeira chamada para uma chave executa a função e as
+    concorrentes aguardam o mesmo resultado, recebendo os mesmos eventos de
+    progresso. Entre workers do gunicorn, um lock de arquivo (fcntl) por chave
+    garante que apenas um processo execute por vez; os demais repassam o
+    progresso publicado pelo líder em um arquivo ao lado do lock e, ao obter o
+    lock, executam a função, que deve consultar primeiro o cache compartilhado
+    (ex.: o cache de vídeos em disco) para reaproveitar o resultado.
+    """
+
+    def __init__(self, lock_dir: str = None, poll_interval: float = 0.5, progress_write_interval: float = 0.5):
+        self.lock_dir = lock_dir if FCNTL_AVAILABLE else None
+        self.poll_interval = poll_interval
+        self.progress_write_interval = progress_write_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'followers': 0}
+
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def _paths(self, key: str):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        base = os.path.join(self.lock_dir, digest)
+        return base + '.lock', base + '.progress'
+
+    def start(self, key: str, fn, progress_callback=None, share=None, runner=None) -> Flight:
+        """
+        Inicia a execução de fn(publish) para a chave ou se junta à que já está
+        em andamento, sem bloquear. Use flight.wait() para obter o resultado.
+
+        Args:
+            key: Chave de coalescência (ex.: "videoId:qualidade")
+            fn: Função que recebe publish(dict) para emitir progresso
+            progress_callback: Recebe os eventos de progresso da execução compartilhada
+            share: Chamado com o resultado uma vez para cada participante além do
+                   primeiro, antes de sinalizar a conclusão (ex.: para incrementar a
+                   contagem de referências de um artefato)
+            runner: runner(execute, flight) executa o trabalho do líder (ex.:
+                    submissão a um pool de workers). Se levantar exceção, ela é
+                    propagada a quem chamou start() e a todos os participantes.
+                    Sem runner, o trabalho roda na thread de quem chamou.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight(key)
+                self._flights[key] = flight
+                self._stats['leaders'] += 1
+            else:
+                self._stats['followers'] += 1
+            flight.waiters += 1
+
+        if progress_callback:
+            flight.subscribe(progress_callback)
+
+        if not leader:
+            logger.info("Aguardando execução em andamento para %s", key)
+            return flight
+
+        def execute():
+            result, error = None, None
+            try:
+                if self.lock_dir:
+                    result = self._run_with_process_lock(flight, fn)
+                else:
+                    result = fn(flight.publish)
+            except Exception as exc:  # pylint: disable=broad-except
+                error = exc
+            self._finish(flight, result, error, share)
+
+        if runner is None:
+            execute()
+        else:
+            try:
+                runner(execute, flight)
+            except Exception as exc:  # pylint: disable=broad-except
+                # Participantes que já se juntaram recebem o erro; o líder também
+                self._finish(flight, None, exc, None)
+                raise
+        return flight
+
+    def in_flight(self, key: str) -> bool:
+        """Há execução em andamento para a chave (neste processo ou, com lock_dir, em outro worker)?"""
+        with self._lock:
+            if key in self._flights:
+                return True
+        if not self.lock_dir:
+            return False
+        lock_path, _ = self._paths(key)
+        try:
+            with open(lock_path, 'a+') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def do(self, key: str, fn, progress_callback=None, share=None, runner=None):
+        """Como start(), mas bloqueia até o resultado (ou levanta o erro compartilhado)."""
+        return self.start(key, fn, progress_callback, share, runner).wait()
+
+    def _finish(self, flight: Flight, result, error, share):
+        with self._lock:
+            self._flights.pop(flight.key, None)
+            flight.result = result
+            flight.error = error
+            if share is not None and error is None:
+                for _ in range(flight.waiters - 1):
+                    share(result)
+        flight._set_done()  # pylint: disable=protected-access
+
+    def _run_with_process_lock(self, flight: Flight, fn):
+        lock_path, progress_path = self._paths(flight.key)
+        with open(lock_path, 'a+') as lock_file:
+            self._acquire(lock_file, progress_path, flight)
+            try:
+                last_write = [0.0]
+
+                def publish(data):
+                    flight.publish(data)
+                    now = time.time()
+                    if now - last_write[0] >= self.progress_write_interval or data.get('status') != 'downloading':
+                        last_write[0] = now
+                        self._write_progress(progress_path, data)
+
+                return fn(publish)
+            finally:
+                try:
+                    os.remove(progress_path)
+                except OSError:
+                    pass
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file, progress_path: str, flight: Flight):
+        """Obtém o lock do processo, repassando o progresso de outro worker enquanto espera."""
+        announced = False
+        last_seen = None
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if not announced:
+                    logger.info("Outro worker já está processando %s; aguardando", flight.key)
+                    announced = True
+                progress = self._read_progress(progress_path)
+                if progress and progress != last_seen:
+                    last_seen = progress
+                    flight.publish(progress)
+                time.sleep(self.poll_interval)
+
+    def _write_progress(self, path: str, data: dict):
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.debug("Não foi possível gravar progresso compartilhado: %s", exc)
+
+    @staticmethod
+    def _read_progress(path: str):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data['in_flight'] = len(self._flights)
+        data['cross_process'] = bool(self.lock_dir)
+        return data
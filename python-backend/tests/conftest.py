@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Ambiente isolado para importar app.py: banco em memória, estado por processo
+# e caches em um diretório temporário (nada de Redis nem arquivos compartilhados)
+TEST_DIR = tempfile.mkdtemp(prefix='yt_backend_tests_')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ.setdefault('JOB_STORE_BACKEND', 'memory')
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'memory')
+os.environ.setdefault('INFO_CACHE_BACKEND', 'memory')
+os.environ.setdefault('VIDEO_CACHE_DIR', os.path.join(TEST_DIR, 'video_cache'))
+os.environ.setdefault('SINGLEFLIGHT_LOCK_DIR', os.path.join(TEST_DIR, 'locks'))
+os.environ.setdefault('LINK_EXPANSION_ENABLED', 'false')
@@ -0,0 +1,116 @@
+import pytest
+
+import extractor_health
+from extractor_health import CLOSED, HALF_OPEN, OPEN, HealthTracker
+from hedged_resolver import AllStrategiesFailed, HedgedResolver, Strategy
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(extractor_health.time, 'time', clock)
+    return clock
+
+
+def state(tracker, key):
+    return tracker.stats()[key]['state']
+
+
+def test_trips_on_failure_rate_and_recovers_after_probe(clock):
+    tracker = HealthTracker(min_samples=4, failure_threshold=0.5, open_seconds=30)
+    tracker.record('yt-dlp', True, 1.0)
+    tracker.record('yt-dlp', True, 1.0)
+    tracker.record('yt-dlp', False, 1.0, error='HTTP Error 500')
+    assert state(tracker, 'yt-dlp') == CLOSED  # menos de min_samples
+    tracker.record('yt-dlp', False, 1.0, error='HTTP Error 500')
+    assert state(tracker, 'yt-dlp') == OPEN
+    assert not tracker.allow('yt-dlp')
+    assert tracker.retry_after('yt-dlp') == 30
+
+    clock.now += 31
+    assert tracker.allow('yt-dlp')  # probe
+    assert state(tracker, 'yt-dlp') == HALF_OPEN
+    assert not tracker.allow('yt-dlp')  # só um probe por vez
+    tracker.record('yt-dlp', True, 1.0)
+    assert state(tracker, 'yt-dlp') == CLOSED
+    assert tracker.allow('yt-dlp')
+
+
+def test_failed_probe_reopens_with_doubled_backoff(clock):
+    tracker = HealthTracker(min_samples=1, failure_threshold=0.5, open_seconds=30)
+    tracker.record('pytube', False, 1.0)
+    clock.now += 31
+    assert tracker.allow('pytube')
+    tracker.record('pytube', False, 1.0)
+    assert state(tracker, 'pytube') == OPEN
+    assert tracker.retry_after('pytube') == 60
+
+
+def test_block_opens_immediately(clock):
+    tracker = HealthTracker(min_samples=5, block_backoff=60)
+    tracker.record('yt-dlp', True, 1.0)
+    tracker.record('yt-dlp', False, 1.0, error="Sign in to confirm you're not a bot", blocked=True)
+    assert state(tracker, 'yt-dlp') == OPEN
+    assert tracker.retry_after('yt-dlp') == 60
+    assert 'not a bot' in str(tracker.open_error('yt-dlp'))
+
+
+def test_release_probe_admits_next_caller(clock):
+    tracker = HealthTracker(min_samples=1, open_seconds=30)
+    tracker.record('download', False, 1.0)
+    clock.now += 31
+    assert tracker.allow('download')
+    assert not tracker.allow('download')
+    tracker.release_probe('download')  # ex.: fila cheia, o backend não foi testado
+    assert tracker.allow('download')
+    assert state(tracker, 'download') == HALF_OPEN
+
+
+def test_client_error_does_not_trip_circuit(clock):
+    tracker = HealthTracker(min_samples=1, failure_threshold=0.5)
+    resolver = HedgedResolver(stagger_seconds=0.01, health=tracker)
+    calls = []
+
+    def private_video(cancel):
+        calls.append('private')
+        raise RuntimeError('ERROR: [youtube] abc: Private video')
+
+    strategies = [Strategy('watch', private_video, group='yt-dlp'),
+                  Strategy('shorts', private_video, group='yt-dlp')]
+    with pytest.raises(AllStrategiesFailed):
+        resolver.resolve('extract', strategies, client_error=lambda exc: 'Private video' in str(exc))
+
+    assert calls == ['private']  # a outra estratégia do grupo falharia do mesmo jeito
+    assert tracker.allow('yt-dlp')
+    assert tracker.stats()['yt-dlp']['samples'] == 0
+
+    # A mesma falha sem a classificação conta e abre o circuito
+    with pytest.raises(AllStrategiesFailed):
+        resolver.resolve('extract', strategies[:1])
+    assert state(tracker, 'yt-dlp') == OPEN
+
+
+def test_backend_classifies_ytdlp_errors():
+    backend = pytest.importorskip('app')
+    if not backend.YT_DLP_AVAILABLE:
+        pytest.skip('yt-dlp não instalado')
+    from yt_dlp.networking.exceptions import TransportError
+    from yt_dlp.utils import DownloadError, ExtractorError
+
+    unavailable = ExtractorError('Video unavailable', expected=True)
+    assert backend.is_client_error(DownloadError('ERROR: Video unavailable', (None, unavailable, None)))
+    assert not backend.is_client_error(ExtractorError('timed out', expected=True, cause=TransportError('boom')))
+    assert not backend.is_client_error(ExtractorError("Sign in to confirm you're not a bot", expected=True))
+
+    # A mensagem do backend cita bloqueio, mas a causa decide
+    failure = backend.DownloadFailure('O YouTube bloqueou as requisições', 'ERROR: [youtube] abc: Video unavailable')
+    assert not failure.blocked and failure.client_error
+    assert not backend.is_bot_detection_error(str(failure))
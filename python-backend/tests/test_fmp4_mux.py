@@ -0,0 +1,98 @@
+import functools
+import os
+import subprocess
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fmp4_mux import FragmentedMP4Stream, MuxError, build_mux_command, find_ffmpeg, select_dash_pair
+
+FFMPEG = find_ffmpeg()
+
+requires_ffmpeg = pytest.mark.skipif(FFMPEG is None, reason='ffmpeg não encontrado (PATH ou FFMPEG_BINARY)')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def dash_server(tmp_path_factory):
+    """Componentes DASH sintéticos (vídeo H.264 sem áudio e áudio AAC sem vídeo) servidos por HTTP local."""
+    directory = tmp_path_factory.mktemp('dash')
+    common = [FFMPEG, '-hide_banner', '-loglevel', 'error', '-y']
+    subprocess.run(common + [
+        '-f', 'lavfi', '-i', 'testsrc2=size=160x284:rate=15:duration=2',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '15', '-pix_fmt', 'yuv420p',
+        '-movflags', 'faststart', str(directory / 'video.mp4'),
+    ], check=True)
+    subprocess.run(common + [
+        '-f', 'lavfi', '-i', 'sine=frequency=440:duration=2',
+        '-c:a', 'aac', '-b:a', '64k', '-movflags', 'faststart', str(directory / 'audio.m4a'),
+    ], check=True)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def dash_info(base_url: str, video_path: str = '/video.mp4') -> dict:
+    """info_dict processado como o do yt-dlp para um seletor bestvideo+bestaudio."""
+    return {
+        'id': 'dashFixture',
+        'title': 'DASH local',
+        'requested_formats': [
+            {'format_id': '136', 'url': base_url + video_path, 'protocol': 'http', 'ext': 'mp4',
+             'vcodec': 'avc1.64000c', 'acodec': 'none', 'http_headers': {'User-Agent': 'pytest'}},
+            {'format_id': '140', 'url': base_url + '/audio.m4a', 'protocol': 'http', 'ext': 'm4a',
+             'vcodec': 'none', 'acodec': 'mp4a.40.2', 'http_headers': {'User-Agent': 'pytest'}},
+        ],
+    }
+
+
+def test_select_dash_pair():
+    video, audio = select_dash_pair(dash_info('http://origin'))
+    assert (video['format_id'], audio['format_id']) == ('136', '140')
+    assert select_dash_pair({'requested_formats': [{'url': 'x', 'vcodec': 'avc1', 'acodec': 'mp4a'}]}) is None
+    manifest = dash_info('http://origin')
+    manifest['requested_formats'][0]['protocol'] = 'm3u8_native'
+    assert select_dash_pair(manifest) is None
+
+
+@requires_ffmpeg
+def test_mux_produces_playable_fragmented_mp4(dash_server, tmp_path):
+    video, audio = select_dash_pair(dash_info(dash_server))
+    stream = FragmentedMP4Stream(build_mux_command(FFMPEG, video, audio)).start()
+    output = b''.join(stream)
+
+    assert output[4:8] == b'ftyp'
+    assert b'moof' in output  # fragmentos (moof+mdat) em vez de um único mdat
+    assert stream.process.returncode == 0
+
+    out_path = tmp_path / 'muxed.mp4'
+    out_path.write_bytes(output)
+    probe = subprocess.run([FFMPEG, '-hide_banner', '-i', str(out_path), '-f', 'null', '-'],
+                           capture_output=True, text=True)
+    assert probe.returncode == 0, probe.stderr
+    assert 'Video: h264' in probe.stderr
+    assert 'Audio: aac' in probe.stderr
+
+
+@requires_ffmpeg
+def test_mux_failure_is_reported_before_first_byte(dash_server):
+    video, audio = select_dash_pair(dash_info(dash_server, video_path='/missing.mp4'))
+    with pytest.raises(MuxError):
+        FragmentedMP4Stream(build_mux_command(FFMPEG, video, audio)).start()
+
+
+@requires_ffmpeg
+def test_close_stops_ffmpeg(dash_server):
+    video, audio = select_dash_pair(dash_info(dash_server))
+    stream = FragmentedMP4Stream(build_mux_command(FFMPEG, video, audio), chunk_size=1024).start()
+    chunks = iter(stream)
+    assert next(chunks)
+    stream.close()
+    assert stream.process.poll() is not None
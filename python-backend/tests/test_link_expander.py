@@ -0,0 +1,139 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from link_expander import LinkExpander, SQLiteLinkCache
+
+
+class Shortener(BaseHTTPRequestHandler):
+    """
+    Encurtador local:
+    - /chain/<n>: /chain/<n> -> /chain/<n-1> -> ... -> /store/<id> (200)
+    - /nohead/<n>: recusa HEAD (405) e redireciona no GET para /store/<n>
+    - /external: redireciona para um host privado (10.0.0.1)
+    """
+
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        with Shortener.lock:
+            Shortener.requests.append((self.command, self.path))
+        parts = self.path.strip('/').split('/')
+        if parts[0] == 'chain' and int(parts[1]) > 0:
+            self.send_response(302)
+            self.send_header('Location', f'/chain/{int(parts[1]) - 1}')
+        elif parts[0] == 'chain':
+            self.send_response(301)
+            self.send_header('Location', '/store/final')
+        elif parts[0] == 'nohead' and self.command == 'HEAD':
+            self.send_response(405)
+        elif parts[0] == 'nohead':
+            self.send_response(302)
+            self.send_header('Location', f'/store/{parts[1]}')
+        elif parts[0] == 'external':
+            self.send_response(302)
+            self.send_header('Location', 'http://10.0.0.1/store/private')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_HEAD = _handle
+    do_GET = _handle
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Shortener)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_requests():
+    Shortener.requests = []
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SQLiteLinkCache(str(tmp_path / 'links.db'))
+
+
+def test_follows_redirect_chain(base_url):
+    expander = LinkExpander(allow_private_hosts=True)
+    assert expander.expand(f'{base_url}/chain/2') == f'{base_url}/store/final'
+    assert [path for _, path in Shortener.requests] == ['/chain/2', '/chain/1', '/chain/0', '/store/final']
+
+
+def test_falls_back_to_get_when_head_is_refused(base_url):
+    expander = LinkExpander(allow_private_hosts=True)
+    assert expander.expand(f'{base_url}/nohead/7') == f'{base_url}/store/7'
+    assert ('GET', '/nohead/7') in Shortener.requests
+
+
+def test_stops_at_redirect_limit(base_url):
+    expander = LinkExpander(allow_private_hosts=True, max_redirects=2)
+    # Sem chegar ao destino final: devolve o último salto sem visitá-lo
+    assert expander.expand(f'{base_url}/chain/5') == f'{base_url}/chain/3'
+    assert len(Shortener.requests) == 2
+
+
+def test_stops_when_leaving_shorteners(base_url):
+    expander = LinkExpander(allow_private_hosts=True, is_shortener=lambda url: '/chain/' in url)
+    assert expander.expand(f'{base_url}/chain/1') == f'{base_url}/store/final'
+    assert ('HEAD', '/store/final') not in Shortener.requests
+
+
+def test_refuses_private_hosts(base_url):
+    expander = LinkExpander()
+    assert expander.expand(f'{base_url}/chain/1') is None
+    assert expander.expand('http://localhost/chain/1') is None
+    assert expander.expand('ftp://example.com/file') is None
+    assert Shortener.requests == []
+
+
+def test_refuses_redirect_to_private_host(base_url):
+    class StubOnlyExpander(LinkExpander):
+        # O encurtador local é liberado; o destino segue a regra normal (10.0.0.1 é privado)
+        def _allowed(self, url):
+            return url.startswith(base_url) or super()._allowed(url)
+
+    expander = StubOnlyExpander(is_shortener=lambda url: url.startswith(base_url))
+    assert expander.expand(f'{base_url}/external') is None
+    assert len(Shortener.requests) == 1
+
+
+def test_expand_many_uses_cache(base_url, cache):
+    expander = LinkExpander(cache, allow_private_hosts=True)
+    urls = [f'{base_url}/chain/1', f'{base_url}/nohead/3']
+    expected = {urls[0]: f'{base_url}/store/final', urls[1]: f'{base_url}/store/3'}
+
+    assert expander.expand_many(urls) == expected
+    made = len(Shortener.requests)
+    assert made > 0
+
+    # Segunda vez: tudo do cache, nenhuma requisição nova ao encurtador
+    assert expander.expand_many(urls) == expected
+    assert len(Shortener.requests) == made
+    assert expander.stats()['cache_hits'] == 2
+
+    # Outro expansor com o mesmo arquivo (outro worker) também acerta o cache
+    other = LinkExpander(SQLiteLinkCache(cache.path), allow_private_hosts=True)
+    assert other.expand_many(urls) == expected
+    assert len(Shortener.requests) == made
+
+
+def test_failures_are_cached(base_url, cache):
+    expander = LinkExpander(cache, allow_private_hosts=True)
+    url = f'{base_url}/store/direct'  # sem redirecionamento: nada a expandir
+    assert expander.expand_many([url]) == {}
+    assert cache.get_many([url]) == {url: None}
+    made = len(Shortener.requests)
+    assert expander.expand_many([url]) == {}
+    assert len(Shortener.requests) == made
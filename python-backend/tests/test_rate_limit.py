@@ -0,0 +1,47 @@
+import pytest
+
+from rate_limit import (INTERACTIVE, BucketSpec, InboundLimiter, MemoryBucketBackend, OutboundLimiter,
+                        RateLimited, _take)
+
+
+def test_take_with_cost_above_burst_drains_the_bucket():
+    spec = BucketSpec('outbound:identity:anonymous', rate=1.0, burst=1.0)
+
+    wait, updates = _take({}, [spec], 2, now=100.0)
+    assert wait == 0.0
+    assert updates == {spec.key: (0.0, 100.0)}
+
+    # Balde vazio: espera só até encher o burst, não os 2 tokens pedidos
+    wait, updates = _take(updates, [spec], 2, now=100.0)
+    assert wait == pytest.approx(1.0)
+    assert updates == {}
+
+
+def test_outbound_acquire_succeeds_when_cost_exceeds_identity_burst():
+    limiter = OutboundLimiter(MemoryBucketBackend(), global_rate_per_minute=60, global_burst=10,
+                              identity_rate_per_minute=60, identity_burst=1,
+                              max_wait={INTERACTIVE: 0.0})
+
+    assert limiter.acquire('cookies.txt', cost=2) < 1.0
+    with pytest.raises(RateLimited):
+        limiter.acquire('cookies.txt', cost=2)
+
+
+def test_inbound_ip_rejection_keeps_the_user_token():
+    backend = MemoryBucketBackend()
+    limiter = InboundLimiter(backend, user_rate_per_minute=1, user_burst=2,
+                             ip_rate_per_minute=1, ip_burst=1, daily_downloads=0, daily_bytes=0)
+
+    limiter.check('alice', '10.0.0.1', downloads=0)
+    with pytest.raises(RateLimited) as exc_info:
+        limiter.check('alice', '10.0.0.1', downloads=0)
+    assert exc_info.value.code == 'IP_RATE_LIMIT'
+
+    user_spec = BucketSpec('inbound:user:alice', 1 / 60.0, 2)
+    assert backend.levels([user_spec])[user_spec.key] == pytest.approx(1.0, abs=0.01)
+
+    # De outro endereço o token que sobrou ainda vale; depois o limite é do usuário
+    limiter.check('alice', '10.0.0.2', downloads=0)
+    with pytest.raises(RateLimited) as exc_info:
+        limiter.check('alice', '10.0.0.3', downloads=0)
+    assert exc_info.value.code == 'USER_RATE_LIMIT'
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from artifacts import DownloadArtifact
+from singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condição não satisfeita a tempo')
+        time.sleep(0.01)
+
+
+def run_concurrently(target, count: int = CALLERS) -> list:
+    results = [None] * count
+    errors = []
+
+    def call(index):
+        try:
+            results[index] = target()
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not errors, errors
+    return results
+
+
+def test_single_flight_runs_function_once_for_concurrent_callers(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path))
+    calls = []
+
+    def fetch(publish):
+        calls.append(1)
+        # Segurar o líder até todos os participantes se juntarem
+        wait_for(lambda: flights._flights['video:best'].waiters == CALLERS)
+        publish({'status': 'downloading', 'percent': 50})
+        return 'resultado'
+
+    results = run_concurrently(lambda: flights.do('video:best', fetch))
+
+    assert len(calls) == 1
+    assert results == ['resultado'] * CALLERS
+    assert flights.stats()['leaders'] == 1
+    assert flights.stats()['followers'] == CALLERS - 1
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_single_flight_shares_error_with_all_callers():
+    flights = SingleFlight()
+    calls = []
+
+    def fetch(publish):
+        calls.append(1)
+        wait_for(lambda: flights._flights['video:best'].waiters == CALLERS)
+        raise RuntimeError('origem indisponível')
+
+    errors = []
+
+    def call():
+        try:
+            flights.do('video:best', fetch)
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    run_concurrently(call)
+    assert len(calls) == 1
+    assert errors == ['origem indisponível'] * CALLERS
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    import app as backend_app
+    return backend_app
+
+
+def test_start_shared_download_fetches_source_once(backend, monkeypatch):
+    video_id, key = 'coalesced01', 'coalesced01:best'
+    calls = []
+
+    def fake_download(vid, quality=None, progress_callback=None, priority=None):
+        calls.append(vid)
+        wait_for(lambda: key in backend.download_flights._flights
+                 and backend.download_flights._flights[key].waiters == CALLERS)
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, f'{vid}.mp4')
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * 1024)
+        return True, DownloadArtifact.adopt(path, f'{vid}.mp4'), f'{vid}.mp4', None
+
+    monkeypatch.setattr(backend, 'download_with_ytdlp', fake_download)
+    monkeypatch.setattr(backend.video_cache, 'max_bytes', 0)  # sem cache: só a coalescência
+
+    results = run_concurrently(
+        lambda: backend.download_with_ytdlp_shared(video_id, 'best', user_key='tester'))
+
+    assert calls == [video_id]
+    artifacts = [artifact for success, artifact, _, _ in results]
+    assert all(success for success, *_ in results)
+    assert len({id(artifact) for artifact in artifacts}) == 1
+    artifact = artifacts[0]
+    assert artifact.exists()
+
+    # Cada participante tem sua referência: o arquivo só some no último close()
+    for other in artifacts[:-1]:
+        other.close()
+    assert artifact.exists()
+    artifacts[-1].close()
+    assert not artifact.exists()
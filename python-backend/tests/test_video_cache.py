@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+
+from video_cache import VideoCache
+
+
+@pytest.fixture
+def make_file(tmp_path):
+    def make(name: str, size: int) -> str:
+        path = tmp_path / 'downloads' / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'\x00' * size)
+        return str(path)
+    return make
+
+
+def test_store_and_lookup(tmp_path, make_file):
+    cache = VideoCache(str(tmp_path / 'cache'), 1000, 3600)
+    entry = cache.store('abc', 'best', '18', make_file('a.mp4', 100), 'a.mp4')
+    assert entry is not None and os.path.exists(entry.path)
+    found = cache.lookup('abc', 'best')
+    assert found.path == entry.path and found.size == 100
+
+
+def test_store_refuses_file_larger_than_cache(tmp_path, make_file):
+    cache = VideoCache(str(tmp_path / 'cache'), 100, 3600)
+    source = make_file('big.mp4', 500)
+
+    assert cache.store('big', 'best', '137', source, 'big.mp4') is None
+    # O chamador continua com o arquivo (DownloadArtifact.adopt)
+    assert os.path.exists(source)
+    assert cache.lookup('big', 'best') is None
+    assert cache.stats()['oversized'] == 1
+
+
+def test_evict_keeps_entry_being_stored(tmp_path, make_file):
+    cache = VideoCache(str(tmp_path / 'cache'), 250, 3600)
+    old = cache.store('old', 'best', '18', make_file('old.mp4', 100), 'old.mp4')
+    # Entrada antiga acessada "depois" da publicação da nova: pelo LRU, a nova sairia primeiro
+    future = time.time() + 60
+    os.utime(old.path, (future, future))
+
+    new = cache.store('new', 'best', '22', make_file('new.mp4', 200), 'new.mp4')
+
+    assert new is not None and os.path.exists(new.path)
+    assert not os.path.exists(old.path)
+    assert cache.stats()['bytes'] <= 250
+
+
+def test_evict_removes_least_recently_used(tmp_path, make_file):
+    cache = VideoCache(str(tmp_path / 'cache'), 250, 3600)
+    first = cache.store('first', 'best', '18', make_file('1.mp4', 100), '1.mp4')
+    os.utime(first.path, (time.time() - 60, time.time() - 60))
+    second = cache.store('second', 'best', '18', make_file('2.mp4', 100), '2.mp4')
+    third = cache.store('third', 'best', '18', make_file('3.mp4', 100), '3.mp4')
+
+    assert not os.path.exists(first.path)
+    assert os.path.exists(second.path) and os.path.exists(third.path)
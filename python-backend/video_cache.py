@@ -0,0 +1,285 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """Entrada publicada no cache de vídeos"""
+
+    def __init__(self, key, path, filename, size, format_id):
+        self.key = key
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.format_id = format_id
+
+    def __repr__(self):
+        return f'<CacheEntry {self.key[:12]} {self.filename} ({self.size} bytes)>'
+
+
+class VideoCache:
+    """
+    Cache persistente em disco dos MP4 finais (já mesclados).
+
+    O conteúdo é endereçado por (video_id, format_id resolvido), ou seja, pelos
+    formatos que o yt-dlp realmente escolheu a partir de get_format_selector.
+    Um índice de "aliases" mapeia (video_id, qualidade pedida) para esse
+    conteúdo, permitindo responder antes de qualquer chamada ao YouTube.
+
+    Layout do diretório:
+        objects/<chave>.mp4   -> arquivo de vídeo
+        objects/<chave>.json  -> metadados (nome do arquivo, tamanho, criação)
+        aliases/<chave>.json  -> {"key": <chave do objeto>, "created": ...}
+        tmp/                  -> arquivos parciais antes da publicação
+
+    A publicação é atômica (os.replace dentro do mesmo sistema de arquivos),
+    então leitores concorrentes nunca veem arquivos parciais. A remoção usa
+    LRU pelo mtime do vídeo, atualizado a cada acerto.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'oversized': 0}
+
+        if self.enabled:
+            for sub in ('objects', 'aliases', 'tmp'):
+                os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ------------------------------------------------------------------ chaves
+
+    @staticmethod
+    def _hash(*parts) -> str:
+        raw = '\x1f'.join(str(p) for p in parts)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _object_paths(self, key: str):
+        base = os.path.join(self.directory, 'objects', key)
+        return base + '.mp4', base + '.json'
+
+    def _alias_path(self, video_id: str, quality: str) -> str:
+        return os.path.join(self.directory, 'aliases', self._hash(video_id, quality or 'best') + '.json')
+
+    # ------------------------------------------------------------- utilitários
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _write_json_atomic(self, path: str, data: dict):
+        tmp_path = os.path.join(self.directory, 'tmp', f'{uuid.uuid4().hex}.json')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: str):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_expired(self, created) -> bool:
+        if not self.ttl_seconds:
+            return False
+        return (time.time() - (created or 0)) > self.ttl_seconds
+
+    def _load_entry(self, key: str):
+        video_path, meta_path = self._object_paths(key)
+        meta = self._read_json(meta_path)
+        if not meta or self._is_expired(meta.get('created')):
+            return None
+        try:
+            size = os.path.getsize(video_path)
+            # Atualiza o mtime para a política LRU
+            os.utime(video_path, None)
+        except OSError:
+            return None
+        return CacheEntry(key, video_path, meta.get('filename') or 'video.mp4', size, meta.get('format_id'))
+
+    # ---------------------------------------------------------------- consulta
+
+    def lookup(self, video_id: str, quality: str = None, record_stats: bool = True):
+        """
+        Procura o vídeo pela qualidade pedida (antes de consultar o YouTube).
+        record_stats=False evita contar duas vezes a mesma requisição.
+
+        Returns:
+            CacheEntry ou None
+        """
+        if not self.enabled:
+            return None
+
+        alias = self._read_json(self._alias_path(video_id, quality))
+        entry = None
+        if alias and not self._is_expired(alias.get('created')):
+            entry = self._load_entry(alias.get('key', ''))
+
+        if record_stats:
+            self._count('hits' if entry else 'misses')
+        return entry
+
+    def lookup_format(self, video_id: str, quality: str, format_id: str):
+        """
+        Procura o vídeo pelos formatos resolvidos pelo yt-dlp. Em caso de acerto
+        grava o alias da qualidade pedida para que a próxima consulta seja direta.
+        """
+        if not self.enabled or not format_id:
+            return None
+
+        key = self._hash(video_id, format_id)
+        entry = self._load_entry(key)
+        if entry:
+            self._count('hits')
+            self._write_alias(video_id, quality, key)
+        return entry
+
+    def _write_alias(self, video_id: str, quality: str, key: str):
+        try:
+            self._write_json_atomic(self._alias_path(video_id, quality), {'key': key, 'created': time.time()})
+        except OSError as exc:
+            logger.warning("Não foi possível gravar alias do cache: %s", exc)
+
+    # -------------------------------------------------------------- publicação
+
+    def store(self, video_id: str, quality: str, format_id: str, source_path: str, filename: str):
+        """
+        Publica um arquivo baixado no cache. O arquivo de origem é movido.
+
+        Returns:
+            CacheEntry publicada ou None se o cache estiver desativado/falhar ou
+            o arquivo for maior que o orçamento (o arquivo de origem fica onde está)
+        """
+        if not self.enabled:
+            return None
+        try:
+            if os.path.getsize(source_path) > self.max_bytes:
+                logger.info("Vídeo %s maior que o cache (%d bytes); não publicado", video_id, self.max_bytes)
+                self._count('oversized')
+                return None
+        except OSError as exc:
+            logger.error("Erro ao publicar vídeo no cache: %s", exc)
+            return None
+
+        key = self._hash(video_id, format_id or quality or 'best')
+        video_path, meta_path = self._object_paths(key)
+        part_path = os.path.join(self.directory, 'tmp', f'{uuid.uuid4().hex}.part')
+
+        try:
+            shutil.move(source_path, part_path)
+            os.replace(part_path, video_path)
+            self._write_json_atomic(meta_path, {
+                'video_id': video_id,
+                'format_id': format_id,
+                'filename': filename,
+                'created': time.time(),
+            })
+            self._write_alias(video_id, quality, key)
+            size = os.path.getsize(video_path)
+        except OSError as exc:
+            logger.error("Erro ao publicar vídeo no cache: %s", exc)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return None
+
+        self._count('stores')
+        logger.info("Vídeo publicado no cache: %s (%s, %d bytes)", video_id, format_id, size)
+        self.evict(keep=key)
+        return CacheEntry(key, video_path, filename, size, format_id)
+
+    # ---------------------------------------------------------------- remoção
+
+    def _remove_object(self, key: str):
+        for path in self._object_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self, keep: str = None):
+        """
+        Remove entradas expiradas e, depois, as menos usadas até caber no
+        orçamento; keep (a entrada recém-publicada) nunca é removida.
+        """
+        objects_dir = os.path.join(self.directory, 'objects')
+        entries = []
+        try:
+            names = os.listdir(objects_dir)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith('.mp4'):
+                continue
+            key = name[:-4]
+            try:
+                stat = os.stat(os.path.join(objects_dir, name))
+            except OSError:
+                continue
+            meta = self._read_json(os.path.join(objects_dir, key + '.json')) or {}
+            if self._is_expired(meta.get('created')):
+                self._remove_object(key)
+                self._count('evictions')
+                continue
+            entries.append((stat.st_mtime, stat.st_size, key))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            # Leitores com o arquivo aberto continuam lendo normalmente (POSIX)
+            self._remove_object(key)
+            total -= size
+            self._count('evictions')
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+        data['enabled'] = self.enabled
+        data['max_bytes'] = self.max_bytes
+        if self.enabled:
+            objects_dir = os.path.join(self.directory, 'objects')
+            sizes = []
+            try:
+                for name in os.listdir(objects_dir):
+                    if name.endswith('.mp4'):
+                        try:
+                            sizes.append(os.path.getsize(os.path.join(objects_dir, name)))
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            data['entries'] = len(sizes)
+            data['bytes'] = sum(sizes)
+        return data
+
+
+def create_video_cache_from_env() -> VideoCache:
+    """
+    Cria o cache a partir das variáveis de ambiente:
+    - VIDEO_CACHE_DIR: diretório do cache (padrão: <tmp>/youtube_shorts_cache)
+    - VIDEO_CACHE_MAX_BYTES: orçamento em bytes (padrão: 2 GiB, 0 desativa)
+    - VIDEO_CACHE_TTL: validade das entradas em segundos (padrão: 24h)
+    """
+    directory = os.environ.get('VIDEO_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'youtube_shorts_cache')
+    max_bytes = int(os.environ.get('VIDEO_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+    ttl = int(os.environ.get('VIDEO_CACHE_TTL', str(24 * 3600)))
+    return VideoCache(directory, max_bytes, ttl)
@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class ZipEntry:
+    """
+    Arquivo a ser incluído no ZIP: um caminho em disco (path) ou bytes (data).
+
+    compress=False grava sem compressão (ZIP_STORED), o adequado para MP4,
+    que já é comprimido. on_done é chamado depois que a entrada foi escrita
+    (ou descartada), por exemplo para liberar um DownloadArtifact.
+    """
+
+    def __init__(self, arcname: str, path: str = None, data: bytes = None, compress: bool = False,
+                 on_done=None):
+        self.arcname = arcname
+        self.path = path
+        self.data = data
+        self.compress = compress
+        self.on_done = on_done
+
+    def done(self):
+        if self.on_done is not None:
+            callback, self.on_done = self.on_done, None
+            try:
+                callback()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Erro ao finalizar entrada %s do ZIP: %s", self.arcname, exc)
+
+
+class _ChunkSink:
+    """
+    Destino sem seek para o zipfile: guarda o que foi escrito até ser drenado.
+    Sem tell()/seek(), o zipfile usa data descriptors em vez de voltar para
+    reescrever cabeçalhos, o que permite enviar o ZIP enquanto é gerado.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b''.join(chunks)
+
+
+def stream_zip(entries, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Gera um ZIP como sequência de blocos de bytes, sem montar o arquivo
+    inteiro em memória nem em disco. O uso de memória fica em torno de
+    chunk_size, independente do tamanho dos vídeos.
+
+    Args:
+        entries: Iterável de ZipEntry; pode ser um gerador que produz as
+                 entradas conforme ficam prontas (o ZIP é enviado aos poucos)
+        chunk_size: Tamanho dos blocos lidos dos arquivos
+
+    Entradas maiores que 4 GiB (ou ZIPs com mais de 65535 entradas) usam ZIP64.
+    """
+    sink = _ChunkSink()
+    zip_file = zipfile.ZipFile(sink, 'w', allowZip64=True)
+    try:
+        for entry in entries:
+            try:
+                info = zipfile.ZipInfo(entry.arcname, date_time=time.localtime(time.time())[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED if entry.compress else zipfile.ZIP_STORED
+                info.external_attr = 0o644 << 16
+
+                if entry.path is not None:
+                    # Com o tamanho conhecido o zipfile decide sozinho se precisa de ZIP64
+                    info.file_size = os.path.getsize(entry.path)
+                    with open(entry.path, 'rb') as source, zip_file.open(info, 'w') as target:
+                        while True:
+                            block = source.read(chunk_size)
+                            if not block:
+                                break
+                            target.write(block)
+                            data = sink.drain()
+                            if data:
+                                yield data
+                else:
+                    payload = entry.data or b''
+                    info.file_size = len(payload)
+                    with zip_file.open(info, 'w') as target:
+                        target.write(payload)
+            finally:
+                entry.done()
+
+            data = sink.drain()
+            if data:
+                yield data
+
+        zip_file.close()
+        data = sink.drain()
+        if data:
+            yield data
+    finally:
+        # Cliente desconectou no meio: descarta o ZIP incompleto sem escrever o diretório central
+        if zip_file.fp is not None:
+            zip_file.fp = None
+        if hasattr(entries, 'close'):
+            entries.close()